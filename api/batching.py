@@ -0,0 +1,184 @@
+import asyncio
+from bisect import bisect_left
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from starlette.concurrency import run_in_threadpool
+
+from utils.logger import setup_logger
+
+logger = setup_logger("batching")
+
+
+class Histogram:
+    """Cumulative histogram with fixed bucket upper bounds.
+
+    Args:
+        buckets (List[float]): Sorted upper bounds of the buckets.
+
+    """
+
+    def __init__(self, buckets: List[float]):
+        self._buckets = sorted(buckets)
+        self._counts = [0] * len(self._buckets)
+        self._count = 0
+        self._sum = 0.0
+
+    def observe(self, value: float):
+        self._count += 1
+        self._sum += value
+        # Index of the first bound greater than or equal to the value
+        i = bisect_left(self._buckets, value)
+        if i < len(self._counts):
+            self._counts[i] += 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        cumulative = 0
+        buckets = {}
+        for bound, count in zip(self._buckets, self._counts):
+            cumulative += count
+            buckets[f"{bound:g}"] = cumulative
+        buckets["+Inf"] = self._count
+        return {"buckets": buckets, "count": self._count, "sum": self._sum}
+
+
+class MicroBatcher:
+    """
+    MicroBatcher gathers concurrent requests in a shared queue and scores them
+    with a single batched call.
+
+    A batch is flushed as soon as it holds `max_batch_size` items or when the
+    oldest item has waited `max_wait_ms` milliseconds. The batched function
+    runs in the thread pool, so new requests keep queuing up for the next
+    batch while the current one is being scored.
+
+    Args:
+        predict_batch (Callable): Function scoring a list of items. It is called
+            with `return_exceptions=True` and must return one result (or
+            exception) per item, in input order.
+        max_batch_size (int): Maximum number of items scored in one call.
+        max_wait_ms (float): Maximum time an item waits for the batch to fill.
+
+    """
+
+    def __init__(
+        self,
+        predict_batch: Callable[..., List[Any]],
+        max_batch_size: int = 64,
+        max_wait_ms: float = 5.0,
+    ):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1")
+        self._predict_batch = predict_batch
+        self._max_batch_size = max_batch_size
+        self._max_wait = max_wait_ms / 1000
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+
+        buckets = [2**i for i in range(max_batch_size.bit_length())]
+        if buckets[-1] < max_batch_size:
+            buckets.append(max_batch_size)
+        self._batch_size_histogram = Histogram(buckets)
+        self._queue_depth_histogram = Histogram(
+            [0] + [2**i for i in range(max(max_batch_size, 1024).bit_length())]
+        )
+
+    @property
+    def max_batch_size(self) -> int:
+        return self._max_batch_size
+
+    @property
+    def max_wait_ms(self) -> float:
+        return self._max_wait * 1000
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def submit(self, item: Any) -> Any:
+        """
+        Queue an item and wait for its result.
+
+        Args:
+            item (Any): The item to score.
+
+        Returns:
+            Any: The result of the batched function for this item.
+
+        Raises:
+            Exception: The exception raised while scoring this item.
+
+        """
+        queue = self._ensure_worker()
+        future = asyncio.get_running_loop().create_future()
+        await queue.put((item, future))
+        return await future
+
+    async def stop(self):
+        """Cancel the worker task, pending items are not scored."""
+        if self._worker is not None and not self._worker.done():
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+        self._worker = None
+        self._queue = None
+        self._loop = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_batch_size": self._max_batch_size,
+            "max_wait_ms": self.max_wait_ms,
+            "queue_depth": self.queue_depth,
+            "batch_size": self._batch_size_histogram.to_dict(),
+            "queue_depth_at_flush": self._queue_depth_histogram.to_dict(),
+        }
+
+    def _ensure_worker(self) -> asyncio.Queue:
+        # The worker is bound to the running loop, start a new one if the
+        # loop changed (e.g. a test client running each request in its own loop)
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._worker is None or self._worker.done():
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._worker = loop.create_task(self._run(self._queue))
+        return self._queue
+
+    async def _run(self, queue: asyncio.Queue):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await queue.get()]
+            deadline = loop.time() + self._max_wait
+            while len(batch) < self._max_batch_size:
+                if not queue.empty():
+                    batch.append(queue.get_nowait())
+                    continue
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            self._queue_depth_histogram.observe(queue.qsize())
+            self._batch_size_histogram.observe(len(batch))
+            await self._flush(batch)
+
+    async def _flush(self, batch: List[Tuple[Any, asyncio.Future]]):
+        items = [item for item, _ in batch]
+        try:
+            results = await run_in_threadpool(
+                self._predict_batch, items, return_exceptions=True
+            )
+        except Exception as e:
+            logger.exception(f"Batch of {len(items)} items failed")
+            results = [e] * len(items)
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                # The caller went away (e.g. cancelled request)
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
@@ -0,0 +1,194 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+from api.schemas.prediction import CustomerData
+
+
+class LRUCache:
+    """
+    LRUCache is a thread-safe mapping bounded to `maxsize` entries, evicting the
+    least recently used entry when full.
+
+    Args:
+        maxsize (int): The maximum number of entries, 0 disables the cache.
+        ttl (float, optional): Seconds after which an entry expires, entries
+            never expire by default.
+
+    """
+
+    def __init__(self, maxsize: int = 10000, ttl: Optional[float] = None):
+        self._maxsize = maxsize
+        self._ttl = ttl
+        # key -> (expiration time, value)
+        self._data: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    @property
+    def maxsize(self) -> int:
+        return self._maxsize
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """
+        Get the value of a key and mark it as recently used.
+
+        Args:
+            key (Hashable): The key.
+
+        Returns:
+            Optional[Any]: The value, or None if the key is not cached.
+        """
+        with self._lock:
+            try:
+                expires_at, value = self._data[key]
+            except KeyError:
+                self._misses += 1
+                return None
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                self._misses += 1
+                return None
+            self._data.move_to_end(key)
+            self._hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any):
+        """
+        Cache a value, evicting the least recently used entry if full.
+
+        Args:
+            key (Hashable): The key.
+            value (Any): The value.
+        """
+        if self._maxsize <= 0:
+            return
+        expires_at = None if self._ttl is None else time.monotonic() + self._ttl
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self._maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key: Hashable):
+        """
+        Remove a key from the cache, if cached.
+
+        Args:
+            key (Hashable): The key.
+        """
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "size": len(self._data),
+            "maxsize": self._maxsize,
+            "ttl": self._ttl,
+            "hits": self._hits,
+            "misses": self._misses,
+        }
+
+
+class PredictionCache:
+    """
+    PredictionCache caches the predictions of identical customer profiles.
+
+    The key is a hash of the normalized customer features (the customer ID is
+    ignored) and of the version of the model that made the prediction. The
+    whole cache is flushed as soon as a prediction is requested for another
+    model version, e.g. after the production model has been reloaded.
+
+    Args:
+        maxsize (int): The maximum number of cached predictions.
+        ttl (float, optional): Seconds after which a prediction expires.
+
+    """
+
+    def __init__(self, maxsize: int = 10000, ttl: Optional[float] = None):
+        self._cache = LRUCache(maxsize=maxsize, ttl=ttl)
+        self._model_version: Optional[str] = None
+        self._flushes = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(data: CustomerData, model_version: str) -> str:
+        """
+        Compute the cache key of a customer profile.
+
+        Args:
+            data (CustomerData): The customer features.
+            model_version (str): The version of the model.
+
+        Returns:
+            str: The hexadecimal key.
+        """
+        features = {
+            k: v.strip() if isinstance(v, str) else v
+            for k, v in data.model_dump(exclude={"customerID"}).items()
+        }
+        canonical = json.dumps(
+            [model_version, features], sort_keys=True, separators=(",", ":")
+        )
+        return hashlib.sha256(canonical.encode()).hexdigest()
+
+    def get(self, data: CustomerData, model_version: str) -> Optional[str]:
+        """
+        Get the cached prediction of a customer profile.
+
+        Args:
+            data (CustomerData): The customer features.
+            model_version (str): The version of the model currently served.
+
+        Returns:
+            Optional[str]: The prediction, or None if not cached.
+        """
+        self._check_version(model_version)
+        return self._cache.get(self.key(data, model_version))
+
+    def put(self, data: CustomerData, model_version: str, prediction: str):
+        """
+        Cache the prediction of a customer profile.
+
+        Predictions of another model version than the one currently served,
+        e.g. finishing after a reload, are not cached.
+
+        Args:
+            data (CustomerData): The customer features.
+            model_version (str): The version of the model that made the prediction.
+            prediction (str): The prediction.
+        """
+        if model_version != self._model_version:
+            return
+        self._cache.put(self.key(data, model_version), prediction)
+
+    def clear(self):
+        self._cache.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self._cache.stats(),
+            "model_version": self._model_version,
+            "flushes": self._flushes,
+        }
+
+    def _check_version(self, model_version: str):
+        if model_version == self._model_version:
+            return
+        with self._lock:
+            if model_version != self._model_version:
+                if self._model_version is not None:
+                    self._flushes += 1
+                self._cache.clear()
+                self._model_version = model_version
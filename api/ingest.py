@@ -0,0 +1,220 @@
+import codecs
+import csv
+import json
+from typing import Any, AsyncIterator, Dict, List, Tuple, Union
+
+import anyio
+import pandas as pd
+from pydantic import ValidationError
+from starlette.responses import StreamingResponse
+
+from api.schemas.customer import CustomerRecord
+from database.bulk import CUSTOMER_FEATURES_COLUMNS
+
+NDJSON_CONTENT_TYPES = ("application/x-ndjson", "application/jsonl")
+CSV_CONTENT_TYPE = "text/csv"
+
+# Columns of the Telco customer churn CSV, per field of CustomerRecord
+CSV_COLUMNS = {
+    "customerID": CUSTOMER_FEATURES_COLUMNS["id"],
+    **{
+        field: column
+        for field, column in CUSTOMER_FEATURES_COLUMNS.items()
+        if field != "id"
+    },
+    "churn": "Churn",
+}
+
+# Maximum number of characters of a line, a customer takes about 600
+MAX_LINE_LENGTH = 2**16
+
+# A parsed row, or the error which made it unreadable, with its line number
+Row = Tuple[int, Union[Dict[str, Any], Exception]]
+
+
+class LineTooLongError(ValueError):
+    pass
+
+
+async def iter_lines(
+    stream: AsyncIterator[bytes], max_line_length: int = MAX_LINE_LENGTH
+) -> AsyncIterator[str]:
+    """
+    Split a byte stream into lines, decoding it as UTF-8 as it arrives.
+
+    Args:
+        stream (AsyncIterator[bytes]): The byte stream, as a request body.
+        max_line_length (int): The maximum number of characters of a line.
+
+    Yields:
+        str: The lines, without their line break.
+
+    Raises:
+        LineTooLongError: If a line is longer than `max_line_length`, before
+            buffering more of it.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    async for data in stream:
+        buffer += decoder.decode(data)
+        *lines, buffer = buffer.split("\n")
+        for line in lines + [buffer]:
+            if len(line) > max_line_length:
+                raise LineTooLongError(f"Line longer than {max_line_length} characters")
+        for line in lines:
+            yield line.rstrip("\r")
+    buffer += decoder.decode(b"", final=True)
+    if buffer:
+        yield buffer.rstrip("\r")
+
+
+def _parse_csv_row(header: List[str], line: str) -> Dict[str, Any]:
+    values = next(csv.reader([line]))
+    if len(values) != len(header):
+        raise ValueError(f"Expected {len(header)} columns, got {len(values)}")
+    row = dict(zip(header, values))
+    record = {
+        field: row[column] for field, column in CSV_COLUMNS.items() if column in row
+    }
+    # As in `prepare_customers`: the senior citizen flag is 0 or 1, and the
+    # total charges of a new customer are blank
+    senior_citizen = record.get("seniorCitizen")
+    record["seniorCitizen"] = {"0": "No", "1": "Yes"}.get(
+        senior_citizen, senior_citizen
+    )
+    for field in ["totalCharges", "churn"]:
+        if not record.get(field, "").strip():
+            record[field] = None
+    return record
+
+
+def _parse_ndjson_row(line: str) -> Dict[str, Any]:
+    record = json.loads(line)
+    if not isinstance(record, dict):
+        raise ValueError("Expected a JSON object")
+    return record
+
+
+async def iter_row_chunks(
+    stream: AsyncIterator[bytes],
+    content_type: str,
+    chunk_size: int,
+    max_line_length: int = MAX_LINE_LENGTH,
+) -> AsyncIterator[List[Row]]:
+    """
+    Parse an NDJSON or CSV byte stream into chunks of rows, holding a single
+    chunk in memory at a time.
+
+    NDJSON rows are objects with the fields of `CustomerRecord`, CSV rows have
+    the columns of the Telco customer churn CSV, after a header. Blank lines
+    are skipped.
+
+    Args:
+        stream (AsyncIterator[bytes]): The byte stream, as a request body.
+        content_type (str): The media type of the stream, NDJSON or CSV.
+        chunk_size (int): The number of rows per chunk.
+        max_line_length (int): The maximum number of characters of a line.
+
+    Yields:
+        List[Row]: The line number and the parsed row, or the error.
+
+    Raises:
+        LineTooLongError: If a line is longer than `max_line_length`.
+    """
+    is_csv = content_type == CSV_CONTENT_TYPE
+    header = None
+    chunk: List[Row] = []
+    line_number = 0
+    async for line in iter_lines(stream, max_line_length):
+        line_number += 1
+        if not line.strip():
+            continue
+        if is_csv and header is None:
+            header = next(csv.reader([line]))
+            continue
+        try:
+            if is_csv:
+                row = _parse_csv_row(header, line)
+            else:
+                row = _parse_ndjson_row(line)
+        except ValueError as e:
+            row = e
+        chunk.append((line_number, row))
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def validate_rows(
+    rows: List[Row],
+) -> Tuple[List[CustomerRecord], List[Tuple[int, str]]]:
+    """
+    Validate a chunk of rows into customer records.
+
+    Args:
+        rows (List[Row]): The rows, from `iter_row_chunks`.
+
+    Returns:
+        Tuple[List[CustomerRecord], List[Tuple[int, str]]]: The valid records,
+            and the line number and error of the rejected rows.
+    """
+    records = []
+    rejected = []
+    customer_ids = set()
+    for line_number, row in rows:
+        if isinstance(row, Exception):
+            rejected.append((line_number, str(row)))
+            continue
+        try:
+            record = CustomerRecord(**row)
+        except ValidationError as e:
+            errors = [
+                f"{'.'.join(map(str, error['loc']))}: {error['msg']}"
+                for error in e.errors()
+            ]
+            rejected.append((line_number, "; ".join(errors)))
+            continue
+        # Only the first row of a customer is inserted
+        if record.customerID in customer_ids:
+            rejected.append((line_number, f"Duplicate customer {record.customerID}"))
+            continue
+        customer_ids.add(record.customerID)
+        records.append(record)
+    return records, rejected
+
+
+def records_frame(records: List[CustomerRecord]) -> pd.DataFrame:
+    """
+    Convert customer records into the columns expected by `insert_customers`.
+
+    Args:
+        records (List[CustomerRecord]): The records.
+
+    Returns:
+        pd.DataFrame: The records, with the columns of the Telco customer
+            churn CSV.
+    """
+    return pd.DataFrame(
+        {
+            column: [getattr(record, field) for record in records]
+            for field, column in CSV_COLUMNS.items()
+        }
+    )
+
+
+class RequestStreamingResponse(StreamingResponse):
+    """
+    RequestStreamingResponse streams a content produced while the request
+    body is still being read, as the results of the rows already received.
+
+    StreamingResponse listens for the disconnection of the client by reading
+    the request messages, which would take the chunks of the body away from
+    the content. A disconnection is raised by `Request.stream` instead.
+
+    """
+
+    async def listen_for_disconnect(self, receive):
+        # The response ends with its content
+        await anyio.sleep_forever()
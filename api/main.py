@@ -1,24 +1,101 @@
 import os
-from typing import Any, Dict, List
+import threading
+import time
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
 
+import numpy as np
 from dotenv import load_dotenv
-from fastapi import BackgroundTasks, FastAPI, Form, Request
-from fastapi.responses import HTMLResponse
+from fastapi import (
+    Depends,
+    FastAPI,
+    Form,
+    Header,
+    HTTPException,
+    Query,
+    Request,
+    Response,
+)
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse
 from fastapi.templating import Jinja2Templates
-from sqlalchemy import create_engine
+from pydantic import ValidationError
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import sessionmaker
 from starlette.middleware.sessions import SessionMiddleware
 
-from api.routers.prediction import predict_churn
-from api.schemas.prediction import CustomerChurnPrediction, CustomerData
+from api.batching import MicroBatcher
+from api.cache import LRUCache, PredictionCache
+from api.ingest import (
+    CSV_CONTENT_TYPE,
+    NDJSON_CONTENT_TYPES,
+    LineTooLongError,
+    RequestStreamingResponse,
+    Row,
+    iter_row_chunks,
+    records_frame,
+    validate_rows,
+)
+from api.metrics import (
+    CONTENT_TYPE,
+    MetricsMiddleware,
+    database_session_latency,
+    metrics,
+    observe_prediction_stage,
+    prediction_stage_latency,
+)
+from api.registry import (
+    LoadedModel,
+    ModelRegistry,
+    ModelUnavailableError,
+    ModelValidationError,
+    load_warmup_records,
+)
+from api.routers.prediction import (
+    INPUT_COLUMNS,
+    encode_customers,
+    predict_churn_batch,
+    predict_churn_encoded,
+    registry,
+)
+from api.schemas.customer import (
+    CustomerDeletion,
+    CustomerDeletionResult,
+    CustomerIDPage,
+    CustomerIngestError,
+    CustomerIngestSummary,
+    CustomerRecord,
+)
+from api.schemas.prediction import (
+    CustomerChurnBatchItem,
+    CustomerChurnBatchPrediction,
+    CustomerChurnPrediction,
+    CustomerData,
+)
+from api.shadow import ShadowScorer
+from api.write_behind import WriteBehindBuffer
+from database.bulk import delete_customers, insert_new_customers
+from database.engine import create_database_engine
 from database.models import (
     Contract,
     Customer,
     CustomerChurn,
+    CustomerFeatures,
     InternetService,
     PhoneService,
 )
+from database.queries import (
+    select_customer_features,
+    select_customer_ids,
+    select_customer_info,
+)
+from database.session import create_async_session_factory, session_dependency
+from models.churn import ChurnModel
+from models.production import release_dirs
 from utils.logger import setup_logger
+from utils.memory import memory_usage
+from utils.profiling import Profiler
 
 logger = setup_logger("api_main")
 
@@ -33,6 +110,8 @@ load_dotenv()
 api_key = os.getenv("API_KEY")
 secret_key = os.getenv("SECRET_KEY")
 app.add_middleware(SessionMiddleware, secret_key=secret_key)
+# Count the requests and record their durations, by handler
+app.add_middleware(MetricsMiddleware)
 
 # Simulated user database
 fake_users_db = {"testuser": {"password": "testpassword"}}
@@ -40,11 +119,174 @@ fake_users_db = {"testuser": {"password": "testpassword"}}
 # Create an SQLite database (You can use a different database URL if needed)
 database_url = os.getenv("DATABASE_URL", "sqlite:////data/customers.db")
 logger.info(f"Load database: {database_url}")
-engine = create_engine(database_url)
+engine = create_database_engine(database_url)
 
 # Initialize a session to interact with the database
 Session = sessionmaker(bind=engine)
 
+# Async sessions used by the request handlers, so that database access doesn't
+# block the event loop
+AsyncSessionLocal = create_async_session_factory(
+    os.getenv("ASYNC_DATABASE_URL", database_url)
+)
+get_session = session_dependency(
+    AsyncSessionLocal,
+    observer=lambda seconds: database_session_latency.labels().observe(seconds),
+)
+
+# Response header of the version of the model that served the prediction
+MODEL_VERSION_HEADER = "X-Model-Version"
+
+
+def predict_churn_versioned(
+    data: List[CustomerData], return_exceptions: bool = False
+) -> List[Any]:
+    """Predict churn for a batch with a single model version.
+
+    Each prediction is returned with the version of the model that made it.
+
+    """
+    loaded = registry.get()
+    predictions = predict_churn_batch(
+        data,
+        return_exceptions=return_exceptions,
+        churn_model=loaded.churn_model,
+        observer=observe_prediction_stage,
+    )
+    return [
+        prediction
+        if isinstance(prediction, Exception)
+        else (prediction, loaded.version)
+        for prediction in predictions
+    ]
+
+
+# Group concurrent single-customer predictions into batched model calls
+batcher = MicroBatcher(
+    predict_churn_versioned,
+    max_batch_size=int(os.getenv("BATCH_MAX_SIZE", 64)),
+    max_wait_ms=float(os.getenv("BATCH_MAX_WAIT_MS", 5)),
+)
+
+# Encoded features of the customers already in the database, by customer ID,
+# with the version of the model that encoded them
+feature_cache = LRUCache(maxsize=int(os.getenv("FEATURE_CACHE_SIZE", 10000)))
+
+# Predictions of the customer profiles already scored by the current model
+prediction_cache_ttl = os.getenv("PREDICTION_CACHE_TTL")
+prediction_cache = PredictionCache(
+    maxsize=int(os.getenv("PREDICTION_CACHE_SIZE", 10000)),
+    ttl=float(prediction_cache_ttl) if prediction_cache_ttl else None,
+)
+
+# Predictions are written to the database in batches, off the request path.
+# add_churn_predictions is defined below, it is looked up at each write.
+prediction_writer = WriteBehindBuffer(
+    lambda predictions: add_churn_predictions(predictions),
+    flush_size=int(os.getenv("PREDICTION_WRITE_BATCH_SIZE", 500)),
+    max_wait_ms=float(os.getenv("PREDICTION_WRITE_MAX_WAIT_MS", 200)),
+    max_size=int(os.getenv("PREDICTION_WRITE_BUFFER_SIZE", 10000)),
+)
+
+# Candidate model scoring the customers of the live predictions in the
+# background, to be compared with the production model before promoting it
+shadow_release = os.getenv("SHADOW_RELEASE")
+shadow_scorer: Optional[ShadowScorer] = None
+if shadow_release:
+    shadow_preprocessor_dir, shadow_models_dir = release_dirs(
+        Path("data/releases", shadow_release)
+    )
+    shadow_scorer = ShadowScorer(
+        ModelRegistry(
+            shadow_preprocessor_dir, shadow_models_dir, input_columns=INPUT_COLUMNS
+        ),
+        max_queue_size=int(os.getenv("SHADOW_QUEUE_SIZE", 1000)),
+    )
+
+# Customers scored before the app reports itself ready, and by a new model
+# before it is swapped in, empty to skip the warmup
+model_warmup_path = os.getenv("MODEL_WARMUP_PATH", "data/example_churn.json")
+
+# Seconds between two checks of the active release, 0 to disable the watcher
+model_reload_interval = float(os.getenv("MODEL_RELOAD_INTERVAL", 0))
+
+
+def load_canary_records() -> List[Dict[str, Any]]:
+    if not model_warmup_path:
+        return []
+    if not Path(model_warmup_path).exists():
+        logger.warning(f"Warmup batch {model_warmup_path} not found, skip it")
+        return []
+    return load_warmup_records(Path(model_warmup_path))
+
+
+def warmup_model():
+    """Load the production model and score the warmup batch."""
+    try:
+        registry.warmup(load_canary_records())
+    except ModelUnavailableError:
+        # Reported by /health/ready, the requests will retry loading the model
+        pass
+
+
+def reload_model(release: Optional[str] = None) -> LoadedModel:
+    """Load a new model, validate it on the warmup batch and swap it in."""
+    return registry.reload(load_canary_records(), release=release)
+
+
+def watch_model_releases():
+    """Reload the model whenever another release is activated."""
+    while True:
+        time.sleep(model_reload_interval)
+        if registry.release_changed():
+            try:
+                reload_model()
+            except ModelValidationError:
+                # Reported by /health/ready, the current model keeps serving
+                pass
+
+
+@app.on_event("startup")
+async def start_model_warmup():
+    # Warm up in the background so that the app starts right away and reports
+    # itself not ready until the model can serve
+    if not registry.ready:
+        threading.Thread(target=warmup_model, daemon=True).start()
+    # Every worker of the pre-fork server watches the releases on its own
+    if model_reload_interval > 0:
+        threading.Thread(target=watch_model_releases, daemon=True).start()
+
+
+@app.on_event("shutdown")
+async def stop_batcher():
+    await batcher.stop()
+
+
+@app.on_event("shutdown")
+async def flush_predictions():
+    # The buffered predictions are written before the process exits
+    await run_in_threadpool(prediction_writer.stop)
+
+
+@app.on_event("shutdown")
+async def stop_shadow_scorer():
+    if shadow_scorer is not None:
+        await run_in_threadpool(shadow_scorer.stop)
+
+
+@app.exception_handler(ModelUnavailableError)
+async def model_unavailable_handler(request: Request, exc: ModelUnavailableError):
+    return JSONResponse(
+        status_code=503, content={"detail": f"Model unavailable: {exc}"}
+    )
+
+
+async def get_loaded_model() -> LoadedModel:
+    # The first request loads the model off the event loop
+    if not registry.loaded:
+        return await run_in_threadpool(registry.load)
+    return registry.get()
+
 
 @app.get("/", response_class=HTMLResponse)
 async def login_page(request: Request):
@@ -95,10 +337,13 @@ async def login(request: Request, username: str = Form(...), password: str = For
 
 @app.post("/churn-prediction/predict-churn")
 async def predict_churn_endpoint(
-    data: dict, background_tasks: BackgroundTasks
+    data: dict, response: Response
 ) -> CustomerChurnPrediction:
     """Predict churn based on customer data.
 
+    The version of the model that made the prediction is returned in the
+    `X-Model-Version` header.
+
     Args:
         data (dict): Customer data for prediction.
 
@@ -107,127 +352,692 @@ async def predict_churn_endpoint(
 
     """
     logger.debug(f"Use data for prediction: {data}")
-    data = CustomerData(**data)
-    prediction = predict_churn(data)
+    with prediction_stage_latency.time("validation"):
+        data = CustomerData(**data)
+    model_version = (await get_loaded_model()).version
+    prediction = prediction_cache.get(data, model_version)
+    if prediction is None:
+        prediction, model_version = await batcher.submit(data)
+        prediction_cache.put(data, model_version, prediction)
     logger.info(f"Churn prediction: {prediction}")
+    response.headers[MODEL_VERSION_HEADER] = model_version
+    if shadow_scorer is not None:
+        shadow_scorer.submit(data, prediction)
 
     # Store churn prediction asynchronously
-    background_tasks.add_task(
-        add_churn_prediction, customer_id=data.customerID, churn_prediction=prediction
-    )
+    await prediction_writer.submit([(data.customerID, prediction)])
 
     return CustomerChurnPrediction(**{"churnPrediction": prediction})
 
 
-def add_churn_prediction(customer_id: int, churn_prediction: bool):
-    """Add churn prediction to the database (simulated)."""
-    with Session() as session:
-        customer_churn = CustomerChurn(churn=churn_prediction, customer_id=customer_id)
-        session.add(customer_churn)
-        session.commit()
+@app.post("/churn-prediction/predict-churn-batch")
+async def predict_churn_batch_endpoint(
+    data: List[dict], response: Response
+) -> CustomerChurnBatchPrediction:
+    """Predict churn for a list of customers in a single model call.
+
+    Invalid customers are reported individually and do not fail the batch.
+
+    Args:
+        data (List[dict]): Customers data for prediction.
+
+    Returns:
+        CustomerChurnBatchPrediction: One result per customer, in input order.
+
+    """
+    logger.debug(f"Use batch of {len(data)} customers for prediction")
+    items = [CustomerChurnBatchItem(index=i) for i in range(len(data))]
+    customers = []
+    valid_indices = []
+    for i, customer_data in enumerate(data):
+        items[i].customerID = customer_data.get("customerID")
+        try:
+            customers.append(CustomerData(**customer_data))
+            valid_indices.append(i)
+        except ValidationError as e:
+            items[i].error = str(e)
+
+    loaded = await get_loaded_model()
+    # Scored in the thread pool, a large batch would stall the event loop
+    predictions = await run_in_threadpool(
+        predict_churn_batch,
+        customers,
+        return_exceptions=True,
+        churn_model=loaded.churn_model,
+    )
+    scored = []
+    for i, customer, prediction in zip(valid_indices, customers, predictions):
+        if isinstance(prediction, Exception):
+            items[i].error = str(prediction)
+        else:
+            items[i].churnPrediction = prediction
+            scored.append((customer.customerID, prediction))
+    logger.info(f"Batch churn prediction: {len(scored)}/{len(data)} customers scored")
+    response.headers[MODEL_VERSION_HEADER] = loaded.version
+
+    # Store churn predictions asynchronously
+    await prediction_writer.submit(scored)
+
+    return CustomerChurnBatchPrediction(predictions=items)
+
+
+# Number of customers of a prediction stream scored together
+PREDICT_STREAM_CHUNK_SIZE = 1000
+
+
+def predict_churn_rows(
+    rows: List[Row], first_index: int, churn_model: ChurnModel
+) -> List[CustomerChurnBatchItem]:
+    """Validate and score a chunk of the customers of a prediction stream."""
+    items = []
+    customers = []
+    valid_items = []
+    for index, (_, row) in enumerate(rows, first_index):
+        item = CustomerChurnBatchItem(index=index)
+        items.append(item)
+        if isinstance(row, Exception):
+            item.error = str(row)
+            continue
+        item.customerID = row.get("customerID")
+        try:
+            customers.append(CustomerData(**row))
+            valid_items.append(item)
+        except ValidationError as e:
+            item.error = str(e)
+
+    predictions = predict_churn_batch(
+        customers, return_exceptions=True, churn_model=churn_model
+    )
+    for item, prediction in zip(valid_items, predictions):
+        if isinstance(prediction, Exception):
+            item.error = str(prediction)
+        else:
+            item.churnPrediction = prediction
+    return items
+
+
+@app.post("/churn-prediction/predict-stream")
+async def predict_churn_stream_endpoint(
+    request: Request,
+    chunk_size: int = Query(PREDICT_STREAM_CHUNK_SIZE, ge=1, le=50000),
+) -> RequestStreamingResponse:
+    """Predict churn for a stream of customers, streaming the predictions back.
+
+    The body holds one customer per line (NDJSON), and is read as it is
+    received: each chunk of customers is scored in a single model call and
+    its predictions are sent while the next ones are read, so memory stays
+    flat whatever the size of the body. The response holds one result per
+    line, as in the batch endpoint, and the whole stream is scored by the
+    model version of the `X-Model-Version` header. A line longer than
+    `MAX_LINE_LENGTH` is rejected with a 413, or ends the stream with an
+    error line once the first predictions are sent.
+
+    Args:
+        chunk_size (int): The number of customers scored together.
+
+    Returns:
+        RequestStreamingResponse: One result per customer, in input order.
+
+    """
+    loaded = await get_loaded_model()
+    chunks = iter_row_chunks(request.stream(), NDJSON_CONTENT_TYPES[0], chunk_size)
+    # Read the first chunk before sending the status, so that a body whose first
+    # line is too long is rejected with a 413
+    try:
+        first_rows = await chunks.__anext__()
+    except StopAsyncIteration:
+        first_rows = []
+    except LineTooLongError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+
+    async def predictions() -> AsyncIterator[str]:
+        index = 0
+        start = time.perf_counter()
+        rows = first_rows
+        while rows:
+            items = await run_in_threadpool(
+                predict_churn_rows, rows, index, loaded.churn_model
+            )
+            index += len(rows)
+            # Store churn predictions asynchronously
+            await prediction_writer.submit(
+                [
+                    (item.customerID, item.churnPrediction)
+                    for item in items
+                    if item.churnPrediction is not None
+                ]
+            )
+            yield "".join(item.model_dump_json() + "\n" for item in items)
+            try:
+                rows = await chunks.__anext__()
+            except StopAsyncIteration:
+                rows = []
+            except LineTooLongError as e:
+                # The status is already sent, the error ends the stream
+                item = CustomerChurnBatchItem(index=index, error=str(e))
+                yield item.model_dump_json() + "\n"
+                rows = []
+        logger.info(
+            f"Stream churn prediction: {index} customers "
+            f"in {time.perf_counter() - start:.1f}s"
+        )
+
+    return RequestStreamingResponse(
+        predictions(),
+        media_type=NDJSON_CONTENT_TYPES[0],
+        headers={MODEL_VERSION_HEADER: loaded.version},
+    )
+
+
+@app.get("/health/ready")
+async def readiness() -> JSONResponse:
+    """Report whether the model is loaded and warmed up.
+
+    Responds 503 until the warmup batch has been scored, so that orchestrators
+    only route traffic to warm instances.
+
+    """
+    status = registry.status()
+    return JSONResponse(status_code=200 if status["ready"] else 503, content=status)
+
+
+@app.post("/admin/model/reload")
+async def reload_model_endpoint(
+    release: Optional[str] = None, x_api_key: Optional[str] = Header(None)
+) -> Dict[str, Any]:
+    """Load a new model and swap it in without dropping requests.
+
+    The new model is validated on the warmup batch first, the current model
+    keeps serving if it fails. When `API_KEY` is set, it must be sent in the
+    `X-API-Key` header.
+
+    Args:
+        release (str, optional): The release of `data/releases` to serve,
+            which is then activated. Defaults to the active release.
+
+    Returns:
+        Dict[str, Any]: The previous and the new model versions.
+
+    """
+    if api_key and x_api_key != api_key:
+        raise HTTPException(status_code=401, detail="Invalid API key")
+    previous_version = registry.status()["model_version"]
+    try:
+        loaded = await run_in_threadpool(reload_model, release)
+    except ModelValidationError as e:
+        raise HTTPException(
+            status_code=409,
+            detail=f"Model reload failed, still serving {previous_version}: {e}",
+        )
+    return {"previous_version": previous_version, "model_version": loaded.version}
+
+
+# Profiler of the preprocessing and model calls, started on demand
+profiler: Optional[Profiler] = None
+
+
+def get_started_profiler(x_api_key: Optional[str]) -> Profiler:
+    if api_key and x_api_key != api_key:
+        raise HTTPException(status_code=401, detail="Invalid API key")
+    if profiler is None:
+        raise HTTPException(status_code=404, detail="Profiling was never started")
+    return profiler
+
+
+@app.post("/admin/profiling/start")
+async def start_profiling(
+    trace_memory: bool = False, x_api_key: Optional[str] = Header(None)
+) -> Dict[str, Any]:
+    """Start recording the preprocessing and model calls, with a new profiler.
+
+    Tracing the peak memory of the calls slows the predictions down a few
+    times. When `API_KEY` is set, it must be sent in the `X-API-Key` header.
+
+    Args:
+        trace_memory (bool): Whether to trace the peak memory of the calls.
+
+    Returns:
+        Dict[str, Any]: The profiling status.
+
+    """
+    global profiler
+    if api_key and x_api_key != api_key:
+        raise HTTPException(status_code=401, detail="Invalid API key")
+    if profiler is not None:
+        profiler.stop()
+    profiler = Profiler(
+        trace_memory=trace_memory,
+        max_records=int(os.getenv("PROFILING_MAX_RECORDS", 100000)),
+    ).start()
+    logger.info(f"Started profiling, trace memory: {trace_memory}")
+    return {"profiling": True, "trace_memory": trace_memory}
+
+
+@app.post("/admin/profiling/stop")
+async def stop_profiling(x_api_key: Optional[str] = Header(None)) -> Dict[str, Any]:
+    """Stop recording the calls, and summarize them by name."""
+    stopped = get_started_profiler(x_api_key)
+    stopped.stop()
+    logger.info("Stopped profiling")
+    return {"profiling": False, "summary": stopped.summary()}
+
+
+@app.get("/admin/profiling/report", response_class=PlainTextResponse)
+async def profiling_report(x_api_key: Optional[str] = Header(None)):
+    """Report the time, rows and peak memory of the recorded calls, by name."""
+    return PlainTextResponse(get_started_profiler(x_api_key).report())
+
+
+@app.get("/admin/profiling/trace")
+async def profiling_trace(x_api_key: Optional[str] = Header(None)) -> Dict[str, Any]:
+    """Export the recorded calls as a Chrome trace, for chrome://tracing."""
+    return get_started_profiler(x_api_key).chrome_trace()
+
+
+@app.get("/health/memory")
+async def worker_memory() -> Dict[str, Any]:
+    """Report the memory usage of the worker serving the request.
+
+    The unique set size (`uss`) excludes the model pages shared with the other
+    workers when served by `api.server`.
+
+    """
+    return {"pid": os.getpid(), **memory_usage()}
+
+
+@app.get("/churn-prediction/cache-stats")
+async def cache_stats() -> Dict[str, Any]:
+    """Report the size and hit/miss counters of the prediction caches."""
+    return {
+        "predictions": prediction_cache.stats(),
+        "features": feature_cache.stats(),
+    }
+
+
+@app.get("/churn-prediction/batching-stats")
+async def batching_stats() -> Dict[str, Any]:
+    """Report the micro-batching queue depth and batch size histograms."""
+    return batcher.stats()
+
+
+@app.get("/churn-prediction/write-stats")
+async def write_stats() -> Dict[str, Any]:
+    """Report the buffered predictions, the batch sizes and the flush latencies."""
+    return prediction_writer.stats()
+
+
+@app.get("/churn-prediction/shadow-stats")
+async def shadow_stats() -> Dict[str, Any]:
+    """Report the disagreements and the latency of the shadow model."""
+    if shadow_scorer is None:
+        return {"enabled": False}
+    return shadow_scorer.stats()
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Expose the request, stage and database metrics to Prometheus."""
+    return PlainTextResponse(metrics.render(), media_type=CONTENT_TYPE)
+
+
+def add_churn_predictions(predictions: List[Tuple[str, str]]):
+    """Add several churn predictions to the database in one transaction."""
+    if not predictions:
+        return
+    with prediction_stage_latency.time("db_write"), engine.begin() as connection:
+        connection.execute(
+            insert(CustomerChurn),
+            [
+                {"customer_id": customer_id, "churn": churn_prediction}
+                for customer_id, churn_prediction in predictions
+            ],
+        )
 
 
 @app.post("/customer-database/add-prediction")
-async def add_churn_prediction_to_database(customer_id: int, churn_prediction: bool):
+async def add_churn_prediction_to_database(
+    customer_id: int,
+    churn_prediction: bool,
+    session: AsyncSession = Depends(get_session),
+):
     """Add churn prediction to the database."""
-    add_churn_prediction(customer_id, churn_prediction)
+    session.add(CustomerChurn(churn=churn_prediction, customer_id=customer_id))
+    await session.commit()
     return {"message": "Churn prediction added to the database"}
 
 
-def fetch_customer_ids() -> List[str]:
-    customer_ids = []
+# Number of customer IDs rendered in the customer database page, the next
+# ones are fetched by the page from /customers
+CUSTOMER_PAGE_SIZE = 100
+
+
+async def fetch_customer_ids(
+    session: AsyncSession,
+    after: Optional[str] = None,
+    prefix: Optional[str] = None,
+    limit: int = CUSTOMER_PAGE_SIZE,
+) -> CustomerIDPage:
+    # Retrieve a page of customer IDs from the Customer table
+    result = await session.scalars(
+        select_customer_ids(after=after, prefix=prefix, limit=limit)
+    )
+    customer_ids = list(result)
+    return CustomerIDPage(
+        customerIDs=customer_ids,
+        next=customer_ids[-1] if len(customer_ids) == limit else None,
+    )
+
+
+@app.get("/customers")
+async def list_customers(
+    after: Optional[str] = None,
+    limit: int = Query(CUSTOMER_PAGE_SIZE, ge=1, le=1000),
+    session: AsyncSession = Depends(get_session),
+) -> CustomerIDPage:
+    """List the customer IDs, one page at a time in ID order.
+
+    Args:
+        after (str, optional): The `next` ID of the previous page.
+        limit (int): The maximum number of IDs of the page.
+
+    Returns:
+        CustomerIDPage: The IDs, and the `next` ID to request the next page.
+
+    """
+    return await fetch_customer_ids(session, after=after, limit=limit)
+
+
+@app.get("/customers/search")
+async def search_customers(
+    prefix: str,
+    limit: int = Query(20, ge=1, le=1000),
+    session: AsyncSession = Depends(get_session),
+) -> CustomerIDPage:
+    """Find the first customer IDs starting with a prefix, for typeahead.
+
+    Args:
+        prefix (str): The beginning of the customer IDs.
+        limit (int): The maximum number of IDs.
+
+    Returns:
+        CustomerIDPage: The IDs, in ID order.
+
+    """
+    return await fetch_customer_ids(session, prefix=prefix, limit=limit)
+
+
+def delete_customers_from_database(
+    customer_ids: Optional[List[str]], churn: Optional[str] = None
+) -> Tuple[List[str], Dict[str, int]]:
+    """Delete customers, given by ID or by churn label, in one transaction."""
+    # Buffered predictions of the customers are written first, to be deleted too
+    prediction_writer.flush()
+    with engine.begin() as connection:
+        if customer_ids is None:
+            customer_ids = connection.scalars(
+                select(CustomerChurn.customer_id).filter_by(churn=churn).distinct()
+            ).all()
+        return customer_ids, delete_customers(connection, customer_ids)
+
+
+@app.post("/customers/delete")
+async def delete_customers_endpoint(
+    deletion: CustomerDeletion, x_api_key: Optional[str] = Header(None)
+) -> CustomerDeletionResult:
+    """Delete customers and all their rows in a single transaction.
+
+    The customers are given either by ID, or by churn label to delete a
+    cohort. When `API_KEY` is set, it must be sent in the `X-API-Key` header.
+
+    Args:
+        deletion (CustomerDeletion): The customer IDs, or the churn label.
+
+    Returns:
+        CustomerDeletionResult: The number of deleted rows per table.
+
+    """
+    if api_key and x_api_key != api_key:
+        raise HTTPException(status_code=401, detail="Invalid API key")
+    if (deletion.customerIDs is None) == (deletion.churn is None):
+        raise HTTPException(status_code=422, detail="Give either customerIDs or churn")
+    customer_ids, counts = await run_in_threadpool(
+        delete_customers_from_database, deletion.customerIDs, deletion.churn
+    )
+    for customer_id in customer_ids:
+        feature_cache.invalidate(customer_id)
+    logger.info(f"Deleted {counts[Customer.__tablename__]} customers: {counts}")
+    return CustomerDeletionResult(deleted=counts)
+
+
+# Number of rows of an upload validated and inserted together
+INGEST_CHUNK_SIZE = 1000
+# Number of rejected rows whose error is detailed in the ingest summary
+MAX_INGEST_ERRORS = 100
+
+
+def ingest_customer_records(
+    records: List[CustomerRecord], churn_model: Optional[ChurnModel] = None
+) -> Tuple[int, List[Tuple[str, str]]]:
+    """Insert a chunk of customers in one transaction, and score the new ones."""
+    with engine.connect() as connection:
+        inserted = set(insert_new_customers(connection, records_frame(records)))
+    if churn_model is None:
+        return len(inserted), []
+    # The customers already in the database keep their stored data, the
+    # uploaded rows of these customers are not scored
+    records = [record for record in records if record.customerID in inserted]
+    try:
+        features = encode_customers(records, churn_model)
+    except ValueError:
+        # A single customer with an unseen label fails the encoding of the
+        # chunk, the customers are scored one by one to skip the invalid ones
+        predictions = predict_churn_batch(
+            records, return_exceptions=True, churn_model=churn_model
+        )
+    else:
+        # Customers with missing values (e.g. no total charges yet) can't be
+        # scored, as in `score_customers`
+        valid = np.isfinite(features).all(axis=1)
+        predictions = [None] * len(records)
+        if valid.any():
+            for i, prediction in zip(
+                np.flatnonzero(valid),
+                predict_churn_encoded(features[valid], churn_model),
+            ):
+                predictions[i] = prediction
+    return len(inserted), [
+        (record.customerID, prediction)
+        for record, prediction in zip(records, predictions)
+        if isinstance(prediction, str)
+    ]
+
+
+@app.post("/customers/ingest")
+async def ingest_customers(
+    request: Request,
+    score: bool = False,
+    chunk_size: int = Query(INGEST_CHUNK_SIZE, ge=1, le=50000),
+    x_api_key: Optional[str] = Header(None),
+) -> CustomerIngestSummary:
+    """Insert customers from an NDJSON or CSV upload, streamed chunk by chunk.
+
+    The body is parsed as it is received, and each chunk of rows is validated
+    and inserted in all the tables in one transaction, so that memory stays
+    bounded whatever the size of the upload. NDJSON rows have the fields of
+    the prediction endpoints and an optional `churn` label, CSV rows the
+    columns of the Telco customer churn CSV. Customers already in the
+    database are skipped. A line longer than `MAX_LINE_LENGTH` is rejected
+    with a 413. When `API_KEY` is set, it must be sent in the `X-API-Key`
+    header.
+
+    Args:
+        score (bool): Whether to predict the churn of the valid rows, the
+            predictions being stored as for the prediction endpoints.
+        chunk_size (int): The number of rows per chunk.
+
+    Returns:
+        CustomerIngestSummary: The numbers of inserted, skipped, rejected and
+            scored rows, and the errors of the first rejected rows.
 
-    with Session() as session:
-        # Retrieve customer IDs from the Customer table
-        customer_ids = [customer.id for customer in session.query(Customer).all()]
-        customer_ids.sort()
-    return customer_ids
+    """
+    if api_key and x_api_key != api_key:
+        raise HTTPException(status_code=401, detail="Invalid API key")
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
+    if content_type not in (CSV_CONTENT_TYPE, *NDJSON_CONTENT_TYPES):
+        raise HTTPException(
+            status_code=415, detail=f"Upload NDJSON or CSV, not {content_type}"
+        )
+    churn_model = (await get_loaded_model()).churn_model if score else None
+
+    summary = CustomerIngestSummary()
+    start = time.perf_counter()
+    chunks = iter_row_chunks(request.stream(), content_type, chunk_size)
+    while True:
+        # The chunks read before a too long line are already inserted
+        try:
+            rows = await chunks.__anext__()
+        except StopAsyncIteration:
+            break
+        except LineTooLongError as e:
+            raise HTTPException(status_code=413, detail=str(e))
+        records, rejected = await run_in_threadpool(validate_rows, rows)
+        summary.rows += len(rows)
+        summary.rejected += len(rejected)
+        for line, error in rejected[: MAX_INGEST_ERRORS - len(summary.errors)]:
+            summary.errors.append(CustomerIngestError(line=line, error=error))
+        if not records:
+            continue
+
+        n_inserted, predictions = await run_in_threadpool(
+            ingest_customer_records, records, churn_model
+        )
+        summary.inserted += n_inserted
+        summary.skipped += len(records) - n_inserted
+        summary.scored += len(predictions)
+        await prediction_writer.submit(predictions)
+
+    logger.info(
+        f"Ingested {summary.inserted}/{summary.rows} customers "
+        f"in {time.perf_counter() - start:.1f}s"
+    )
+    return summary
 
 
 @app.get("/customer-database", response_class=HTMLResponse)
-async def customer_database_page(request: Request):
-    # Fetch customer IDs from the database
+async def customer_database_page(
+    request: Request, session: AsyncSession = Depends(get_session)
+):
+    # Fetch the first page of customer IDs from the database
     logger.info("Fetch customer ids")
-    customer_ids = fetch_customer_ids()
+    customer_ids = await fetch_customer_ids(session)
 
     return templates.TemplateResponse(
         "customer-database.html", {"request": request, "customer_ids": customer_ids}
     )
 
 
-def fetch_customer_info(customerID) -> Dict[str, Any]:
+async def fetch_customer_info(session: AsyncSession, customerID) -> Dict[str, Any]:
     customer_info = {}
-    with Session() as session:
-        # Use SQLAlchemy to fetch customer data by customer ID and join multiple tables
-        customer_data = (
-            session.query(
-                Customer.id,
-                Customer.gender,
-                Customer.seniorCitizen,
-                Customer.partner,
-                Customer.dependents,
-                Contract.tenure,
-                PhoneService.hasPhoneService,
-                PhoneService.multipleLines,
-                InternetService.internetServiceType,
-                InternetService.onlineSecurity,
-                InternetService.onlineBackup,
-                InternetService.deviceProtection,
-                InternetService.techSupport,
-                InternetService.streamingTV,
-                InternetService.streamingMovies,
-                Contract.contractType,
-                Contract.paperlessBilling,
-                Contract.paymentMethod,
-                Contract.monthlyCharges,
-                Contract.totalCharges,
-                CustomerChurn.churn,
-            )
-            .join(Contract, Contract.customer_id == Customer.id)
-            .join(PhoneService, PhoneService.contract_id == Contract.id)
-            .join(InternetService, InternetService.contract_id == Contract.id)
-            .join(CustomerChurn, CustomerChurn.customer_id == Customer.id, isouter=True)
-            .filter(Customer.id == customerID)
-            .first()
-        )
-
-        if customer_data:
-            # The cursor.fetchone() result is a tuple with columns in order
-            customer_info = {
-                "customerID": customer_data[0],
-                "gender": customer_data[1],
-                "SeniorCitizen": customer_data[2],
-                "Partner": customer_data[3],
-                "Dependents": customer_data[4],
-                "tenure": customer_data[5],
-                "PhoneService": customer_data[6],
-                "MultipleLines": customer_data[7],
-                "InternetService": customer_data[8],
-                "OnlineSecurity": customer_data[9],
-                "OnlineBackup": customer_data[10],
-                "DeviceProtection": customer_data[11],
-                "TechSupport": customer_data[12],
-                "StreamingTV": customer_data[13],
-                "StreamingMovies": customer_data[14],
-                "Contract": customer_data[15],
-                "PaperlessBilling": customer_data[16],
-                "PaymentMethod": customer_data[17],
-                "MonthlyCharges": customer_data[18],
-                "TotalCharges": customer_data[19],
-                "Churn": customer_data[20],
-            }
-            logger.info(f"Find customer {customerID} information")
-        else:
-            logger.info(f"Customer {customerID} not found.")
+    # Use SQLAlchemy to fetch customer data by customer ID from the features table
+    result = await session.execute(
+        select_customer_info().filter(CustomerFeatures.id == customerID)
+    )
+    customer_data = result.first()
+    if customer_data:
+        # The cursor.fetchone() result is a tuple with columns in order
+        customer_info = {
+            "customerID": customer_data[0],
+            "gender": customer_data[1],
+            "SeniorCitizen": customer_data[2],
+            "Partner": customer_data[3],
+            "Dependents": customer_data[4],
+            "tenure": customer_data[5],
+            "PhoneService": customer_data[6],
+            "MultipleLines": customer_data[7],
+            "InternetService": customer_data[8],
+            "OnlineSecurity": customer_data[9],
+            "OnlineBackup": customer_data[10],
+            "DeviceProtection": customer_data[11],
+            "TechSupport": customer_data[12],
+            "StreamingTV": customer_data[13],
+            "StreamingMovies": customer_data[14],
+            "Contract": customer_data[15],
+            "PaperlessBilling": customer_data[16],
+            "PaymentMethod": customer_data[17],
+            "MonthlyCharges": customer_data[18],
+            "TotalCharges": customer_data[19],
+            "Churn": customer_data[20],
+        }
+        logger.info(f"Find customer {customerID} information")
+    else:
+        logger.info(f"Customer {customerID} not found.")
 
     return customer_info
 
 
+async def fetch_customer_data(
+    session: AsyncSession, customerID: str
+) -> Optional[CustomerData]:
+    """Fetch the features of a customer of the database, in the prediction format."""
+    result = await session.execute(
+        select_customer_features().filter(CustomerFeatures.id == customerID)
+    )
+    customer_data = result.first()
+    if customer_data is None:
+        return None
+    features = dict(customer_data._mapping)
+    features["customerID"] = features.pop("id")
+    return CustomerData(**features)
+
+
+@app.get("/customers/{customerID}/churn")
+async def predict_customer_churn(
+    customerID: str, response: Response, session: AsyncSession = Depends(get_session)
+) -> CustomerChurnPrediction:
+    """Predict churn for a customer of the database.
+
+    The encoded features of the customer are cached, so scoring the same
+    customer again skips both the database query and the preprocessing.
+
+    Args:
+        customerID (str): The customer ID.
+
+    Returns:
+        CustomerChurnPrediction: Prediction result.
+
+    """
+    loaded = await get_loaded_model()
+    cached = feature_cache.get(customerID)
+    # Features encoded by the preprocessors of another model version are stale
+    if cached is not None and cached[0] == loaded.version:
+        features = cached[1]
+    else:
+        try:
+            customer_data = await fetch_customer_data(session, customerID)
+            if customer_data is None:
+                raise HTTPException(
+                    status_code=404, detail=f"Customer {customerID} not found"
+                )
+            features = encode_customers([customer_data], loaded.churn_model)
+        except (ValidationError, ValueError) as e:
+            raise HTTPException(status_code=422, detail=str(e))
+        feature_cache.put(customerID, (loaded.version, features))
+
+    prediction = predict_churn_encoded(features, loaded.churn_model)[0]
+    logger.info(f"Churn prediction for customer {customerID}: {prediction}")
+    response.headers[MODEL_VERSION_HEADER] = loaded.version
+    return CustomerChurnPrediction(churnPrediction=prediction)
+
+
 @app.post("/customer-database/access", response_class=HTMLResponse)
-async def access_customer(request: Request, customerID: str = Form(...)):
+async def access_customer(
+    request: Request,
+    customerID: str = Form(...),
+    session: AsyncSession = Depends(get_session),
+):
     # Fetch the customer's information based on customerID
-    customer_info = fetch_customer_info(customerID)
-    customer_ids = fetch_customer_ids()
+    customer_info = await fetch_customer_info(session, customerID)
+    customer_ids = await fetch_customer_ids(session)
 
     return templates.TemplateResponse(
         "customer-database.html",
@@ -262,50 +1072,54 @@ async def add_customer(
     PaymentMethod: str = Form(...),
     MonthlyCharges: float = Form(...),
     TotalCharges: float = Form(...),
+    session: AsyncSession = Depends(get_session),
 ):
     # Add the data to the database
     try:
-        with Session() as session:
-            phone_service = PhoneService(
-                hasPhoneService=phoneService, multipleLines=MultipleLines
-            )
-            internet_service = InternetService(
-                internetServiceType=internetService,
-                onlineSecurity=OnlineSecurity,
-                onlineBackup=OnlineBackup,
-                deviceProtection=DeviceProtection,
-                techSupport=TechSupport,
-                streamingTV=StreamingTV,
-                streamingMovies=StreamingMovies,
-            )
-            contract = Contract(
-                contractType=contractType,
-                tenure=tenure,
-                paperlessBilling=PaperlessBilling,
-                paymentMethod=PaymentMethod,
-                monthlyCharges=MonthlyCharges,
-                totalCharges=TotalCharges,
-                phone_service=phone_service,
-                internet_service=internet_service,
-            )
+        phone_service = PhoneService(
+            hasPhoneService=phoneService, multipleLines=MultipleLines
+        )
+        internet_service = InternetService(
+            internetServiceType=internetService,
+            onlineSecurity=OnlineSecurity,
+            onlineBackup=OnlineBackup,
+            deviceProtection=DeviceProtection,
+            techSupport=TechSupport,
+            streamingTV=StreamingTV,
+            streamingMovies=StreamingMovies,
+        )
+        contract = Contract(
+            contractType=contractType,
+            tenure=tenure,
+            paperlessBilling=PaperlessBilling,
+            paymentMethod=PaymentMethod,
+            monthlyCharges=MonthlyCharges,
+            totalCharges=TotalCharges,
+            phone_service=phone_service,
+            internet_service=internet_service,
+        )
 
-            customer = Customer(
-                id=customerID,
-                gender=gender,
-                seniorCitizen=SeniorCitizen,
-                partner=Partner,
-                dependents=Dependents,
-                contracts=[contract],
-            )
-            session.add(customer)
-            session.commit()
+        customer = Customer(
+            id=customerID,
+            gender=gender,
+            seniorCitizen=SeniorCitizen,
+            partner=Partner,
+            dependents=Dependents,
+            contracts=[contract],
+        )
+        session.add(customer)
+        session.add(CustomerFeatures.from_customer(customer))
+        await session.commit()
 
-            message = f"Customer {customerID} added successfully"
+        message = f"Customer {customerID} added successfully"
     except Exception as e:
+        await session.rollback()
         message = f"An error occured while adding customer {customerID}: {e}"
     logger.info(message)
 
-    customer_ids = fetch_customer_ids()
+    feature_cache.invalidate(customerID)
+
+    customer_ids = await fetch_customer_ids(session)
     return templates.TemplateResponse(
         "customer-database.html",
         {
@@ -316,52 +1130,22 @@ async def add_customer(
     )
 
 
-def delete_customer_data(session, customer):
-    # Delete related data (child tables)
-    session.query(CustomerChurn).filter_by(customer_id=customer.id).delete()
-    session.query(InternetService).filter_by(contract_id=customer.contract.id).delete()
-    session.query(PhoneService).filter_by(contract_id=customer.contract.id).delete()
-
-
-def delete_customer(session, customer):
-    # Delete the customer
-    session.delete(customer)
-
-
 @app.post("/customer-database/delete", response_class=HTMLResponse)
 async def delete_customer(
-    request: Request, customerID: str = Form(...)
-):  # Use a context manager to create and manage a session
-    with Session() as session:
-        # Retrieve the customer to delete
-        customer_to_delete = session.query(Customer).filter_by(id=customerID).first()
-
-        if customer_to_delete:
-            contract_to_delete = (
-                session.query(Contract)
-                .filter_by(customer_id=customer_to_delete.id)
-                .first()
-            )
-            session.query(PhoneService).filter_by(
-                contract_id=contract_to_delete.id
-            ).delete()
-            session.query(InternetService).filter_by(
-                contract_id=contract_to_delete.id
-            ).delete()
-            session.query(CustomerChurn).filter_by(
-                customer_id=customer_to_delete.id
-            ).delete()
-
-            # Delete the customer
-            session.delete(customer_to_delete)
-            session.delete(contract_to_delete)
-            session.commit()
-            message = f"Customer {customerID} deleted successfully"
-        else:
-            message = f"Customer {customerID} not found"
+    request: Request,
+    customerID: str = Form(...),
+    session: AsyncSession = Depends(get_session),
+):
+    _, counts = await run_in_threadpool(delete_customers_from_database, [customerID])
+
+    if counts[Customer.__tablename__]:
+        feature_cache.invalidate(customerID)
+        message = f"Customer {customerID} deleted successfully"
+    else:
+        message = f"Customer {customerID} not found"
     logger.info(message)
 
-    customer_ids = fetch_customer_ids()
+    customer_ids = await fetch_customer_ids(session)
 
     return templates.TemplateResponse(
         "customer-database.html",
@@ -0,0 +1,302 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from api.batching import Histogram
+
+# Media type of the Prometheus text exposition format, the responses add the
+# UTF-8 charset
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+# Upper bounds of the latency buckets, in seconds
+LATENCY_BUCKETS = [
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+]
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    escaped = (
+        str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        for value in values
+    )
+    return "{" + ",".join(f'{n}="{v}"' for n, v in zip(names, escaped)) + "}"
+
+
+class Metric:
+    """
+    Metric is a family of time series sharing a name, one per combination of
+    label values.
+
+    The series are created on their first use and updated without locking,
+    as a scrape tolerates values a few updates behind.
+
+    Args:
+        name (str): The name of the metric.
+        documentation (str): The help text of the metric.
+        label_names (Sequence[str]): The names of the labels.
+
+    """
+
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._series: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    def _new_series(self):
+        raise NotImplementedError
+
+    def labels(self, *values: str):
+        """
+        Get the series of label values, creating it on first use.
+
+        Args:
+            *values (str): The values of the labels, in order.
+
+        Returns:
+            The series.
+        """
+        series = self._series.get(values)
+        if series is None:
+            if len(values) != len(self.label_names):
+                raise ValueError(
+                    f"Expected {len(self.label_names)} label values for "
+                    f"{self.name}, got {len(values)}"
+                )
+            with self._lock:
+                series = self._series.setdefault(values, self._new_series())
+        return series
+
+    def samples(self) -> Iterator[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type}",
+            *self.samples(),
+        ]
+        return "\n".join(lines) + "\n"
+
+
+class Value:
+    """A single value, for the series of counters and gauges."""
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        self.value -= amount
+
+    def set(self, value: float):
+        self.value = value
+
+
+class CounterMetric(Metric):
+    type = "counter"
+
+    def _new_series(self) -> Value:
+        return Value()
+
+    def samples(self) -> Iterator[str]:
+        for values, series in list(self._series.items()):
+            labels = _format_labels(self.label_names, values)
+            yield f"{self.name}{labels} {series.value:g}"
+
+
+class GaugeMetric(CounterMetric):
+    type = "gauge"
+
+
+class HistogramMetric(Metric):
+    """
+    HistogramMetric is a family of latency histograms, in seconds.
+
+    Args:
+        name (str): The name of the metric.
+        documentation (str): The help text of the metric.
+        label_names (Sequence[str]): The names of the labels.
+        buckets (List[float]): The upper bounds of the buckets.
+
+    """
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        label_names: Sequence[str] = (),
+        buckets: Optional[List[float]] = None,
+    ):
+        super().__init__(name, documentation, label_names)
+        self._buckets = LATENCY_BUCKETS if buckets is None else buckets
+
+    def _new_series(self) -> Histogram:
+        return Histogram(self._buckets)
+
+    @contextmanager
+    def time(self, *values: str) -> Iterator[None]:
+        """Record the duration of a block in the series of label values."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.labels(*values).observe(time.perf_counter() - start)
+
+    def samples(self) -> Iterator[str]:
+        names = self.label_names + ("le",)
+        for values, series in list(self._series.items()):
+            histogram = series.to_dict()
+            for bound, count in histogram["buckets"].items():
+                labels = _format_labels(names, values + (bound,))
+                yield f"{self.name}_bucket{labels} {count}"
+            labels = _format_labels(self.label_names, values)
+            yield f"{self.name}_count{labels} {histogram['count']}"
+            yield f"{self.name}_sum{labels} {histogram['sum']:g}"
+
+
+class MetricsRegistry:
+    """MetricsRegistry holds the metrics of the process, to render them."""
+
+    def __init__(self):
+        self._metrics: List[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def counter(
+        self, name: str, documentation: str, label_names: Sequence[str] = ()
+    ) -> CounterMetric:
+        return self.register(CounterMetric(name, documentation, label_names))
+
+    def gauge(
+        self, name: str, documentation: str, label_names: Sequence[str] = ()
+    ) -> GaugeMetric:
+        return self.register(GaugeMetric(name, documentation, label_names))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        label_names: Sequence[str] = (),
+        buckets: Optional[List[float]] = None,
+    ) -> HistogramMetric:
+        return self.register(
+            HistogramMetric(name, documentation, label_names, buckets=buckets)
+        )
+
+    def render(self) -> str:
+        """Render the metrics in the Prometheus text exposition format."""
+        return "".join(metric.render() for metric in self._metrics)
+
+
+metrics = MetricsRegistry()
+
+# Durations of the stages of a churn prediction: the validation of the
+# request, the preparation of the input columns, each preprocessing step of
+# the pipeline, the forest and the write of the prediction to the database
+prediction_stage_latency = metrics.histogram(
+    "churn_prediction_stage_seconds",
+    "Duration of each stage of the churn predictions",
+    ["stage"],
+)
+http_requests = metrics.counter(
+    "http_requests_total",
+    "Number of HTTP requests, by handler, method and status code",
+    ["handler", "method", "status"],
+)
+# The handler of a request is only known once it is routed
+http_requests_in_flight = metrics.gauge(
+    "http_requests_in_flight", "Number of HTTP requests being served"
+)
+http_request_latency = metrics.histogram(
+    "http_request_duration_seconds",
+    "Duration of the HTTP requests, by handler",
+    ["handler"],
+)
+database_session_latency = metrics.histogram(
+    "database_session_seconds",
+    "Duration of the database sessions of the requests",
+)
+
+
+def observe_prediction_stage(stage: str, seconds: float):
+    """
+    Record the duration of a stage of the churn predictions.
+
+    Args:
+        stage (str): The name of the stage.
+        seconds (float): The duration.
+    """
+    prediction_stage_latency.labels(stage).observe(seconds)
+
+
+class MetricsMiddleware:
+    """
+    MetricsMiddleware counts the HTTP requests and records their durations, by
+    handler: the name of the endpoint function the request was routed to.
+
+    It is a plain ASGI middleware, so the request and response bodies are
+    passed through as they are streamed.
+
+    Args:
+        app (ASGIApp): The application.
+
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        in_flight = http_requests_in_flight.labels()
+
+        async def send_status(message: Message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        in_flight.inc()
+        try:
+            await self.app(scope, receive, send_status)
+        finally:
+            in_flight.dec()
+            # The router stores the endpoint of the request in its scope
+            endpoint = scope.get("endpoint")
+            handler = getattr(endpoint, "__name__", "none")
+            http_requests.labels(handler, scope["method"], str(status)).inc()
+            http_request_latency.labels(handler).observe(time.perf_counter() - start)
@@ -0,0 +1,294 @@
+import json
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from models.churn import ChurnModel
+from models.production import (
+    PREDICTION_LABELS,
+    activate_release,
+    current_release,
+    load_production_model,
+    production_model_version,
+    release_dirs,
+)
+from utils.logger import setup_logger
+
+logger = setup_logger("model_registry")
+
+
+class ModelUnavailableError(RuntimeError):
+    """Raised when the production model can't be loaded."""
+
+
+class ModelValidationError(RuntimeError):
+    """Raised when a new model can't be loaded or fails its canary batch."""
+
+
+class LoadedModel(NamedTuple):
+    churn_model: ChurnModel
+    version: str
+
+
+class ModelRegistry:
+    """
+    ModelRegistry loads the production model on first use, or ahead of the
+    first request when `load` or `warmup` is called at startup.
+
+    Loading doesn't happen at import, so importing the API is fast and a
+    missing artifact doesn't prevent the app from starting: the error is
+    reported by `status` and raised as a `ModelUnavailableError` to the
+    requests that need the model.
+
+    When `releases_dir` holds an activated release, the artifacts of that
+    release are served instead of the ones of `preprocessor_dir` and
+    `models_dir`, and `reload` swaps in another release without restarting.
+
+    Args:
+        preprocessor_dir (Path): The directory of the preprocessor artifacts.
+        models_dir (Path): The directory of the model artifacts.
+        input_columns (List[str]): The raw features of the records to score.
+        releases_dir (Path, optional): The directory of the versioned releases
+            written by `publish_release`.
+
+    """
+
+    def __init__(
+        self,
+        preprocessor_dir: Path,
+        models_dir: Path,
+        input_columns: List[str],
+        releases_dir: Optional[Path] = None,
+    ):
+        self._preprocessor_dir = preprocessor_dir
+        self._models_dir = models_dir
+        self._input_columns = input_columns
+        self._releases_dir = releases_dir
+        self._loaded: Optional[LoadedModel] = None
+        self._release: Optional[str] = None
+        self._error: Optional[str] = None
+        self._reload_error: Optional[str] = None
+        self._warm = False
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        """Whether the model is loaded."""
+        return self._loaded is not None
+
+    @property
+    def ready(self) -> bool:
+        """Whether the model is loaded and warmed up."""
+        return self._loaded is not None and self._warm
+
+    def get(self) -> LoadedModel:
+        """
+        Get the production model, loading it if needed.
+
+        Returns:
+            LoadedModel: The churn model and its version.
+
+        Raises:
+            ModelUnavailableError: If the artifacts can't be loaded.
+        """
+        loaded = self._loaded
+        if loaded is not None:
+            return loaded
+        return self.load()
+
+    def load(self) -> LoadedModel:
+        """
+        Load the production model, unless it is already loaded.
+
+        Returns:
+            LoadedModel: The churn model and its version.
+
+        Raises:
+            ModelUnavailableError: If the artifacts can't be loaded.
+        """
+        with self._lock:
+            if self._loaded is not None:
+                return self._loaded
+            start = time.perf_counter()
+            try:
+                release = self.active_release()
+                preprocessor_dir, models_dir = self._artifact_dirs(release)
+                churn_model = load_production_model(
+                    preprocessor_dir, models_dir, input_columns=self._input_columns
+                )
+                version = production_model_version(preprocessor_dir, models_dir)
+            except Exception as e:
+                self._error = f"{type(e).__name__}: {e}"
+                logger.error(f"Failed to load the production model: {self._error}")
+                raise ModelUnavailableError(self._error) from e
+            self._loaded = LoadedModel(churn_model, version)
+            self._release = release
+            self._error = None
+            logger.info(f"Loaded model {version} in {time.perf_counter() - start:.2f}s")
+            return self._loaded
+
+    def active_release(self) -> Optional[str]:
+        """
+        Get the release activated in the releases directory.
+
+        Returns:
+            Optional[str]: The name of the release, or None if there is none.
+        """
+        if self._releases_dir is None:
+            return None
+        return current_release(self._releases_dir)
+
+    def reload(
+        self, records: List[Dict[str, Any]], release: Optional[str] = None
+    ) -> LoadedModel:
+        """
+        Load a new version of the model, validate it on a canary batch and swap
+        it in.
+
+        The current model keeps serving while the new one is loaded, and the
+        swap replaces a single reference: a request holds the `LoadedModel` it
+        got from `get`, so the requests in flight finish on the previous
+        version. The current model is kept if the new one fails to load or to
+        score the canary batch.
+
+        Args:
+            records (List[Dict[str, Any]]): The raw customer records of the
+                canary batch.
+            release (str, optional): The release to serve, which is then
+                activated. Defaults to the active release, or to the artifact
+                directories if there is none.
+
+        Returns:
+            LoadedModel: The model now served.
+
+        Raises:
+            ModelValidationError: If the new model can't be loaded or fails to
+                score the canary batch.
+        """
+        with self._reload_lock:
+            start = time.perf_counter()
+            try:
+                if release is None:
+                    release = self.active_release()
+                preprocessor_dir, models_dir = self._artifact_dirs(release)
+                version = production_model_version(preprocessor_dir, models_dir)
+                current = self._loaded
+                if current is not None and current.version == version:
+                    # Same artifacts, only the release is switched
+                    loaded = current
+                else:
+                    churn_model = load_production_model(
+                        preprocessor_dir, models_dir, input_columns=self._input_columns
+                    )
+                    self._validate(churn_model, records)
+                    loaded = LoadedModel(churn_model, version)
+            except Exception as e:
+                self._reload_error = f"{type(e).__name__}: {e}"
+                logger.error(f"Failed to reload the model: {self._reload_error}")
+                raise ModelValidationError(self._reload_error) from e
+
+            if release is not None and release != self.active_release():
+                activate_release(self._releases_dir, release)
+            with self._lock:
+                self._loaded = loaded
+                self._release = release
+                self._warm = True
+                self._error = None
+                self._reload_error = None
+            logger.info(
+                f"Swapped model {None if current is None else current.version} "
+                f"for {version} in {time.perf_counter() - start:.2f}s"
+            )
+            return loaded
+
+    def release_changed(self) -> bool:
+        """Whether another release was activated since the model was loaded."""
+        return self._loaded is not None and self.active_release() != self._release
+
+    def _artifact_dirs(self, release: Optional[str]) -> Tuple[Path, Path]:
+        if release is None:
+            return self._preprocessor_dir, self._models_dir
+        if self._releases_dir is None:
+            raise FileNotFoundError(f"Release {release} not found, no releases dir")
+        # Release names are directory names, never paths
+        release_dir = self._releases_dir.joinpath(release)
+        if release != release_dir.name or release.startswith("."):
+            raise FileNotFoundError(f"Release {release} not found")
+        if not release_dir.is_dir():
+            raise FileNotFoundError(f"Release {release} not found")
+        return release_dirs(release_dir)
+
+    @staticmethod
+    def _validate(churn_model: ChurnModel, records: List[Dict[str, Any]]):
+        if not records:
+            logger.warning("No canary batch, the new model is not validated")
+            return
+        predictions = churn_model.predict_records(records)
+        if len(predictions) != len(records):
+            raise ValueError(
+                f"Canary batch of {len(records)} records got {len(predictions)} "
+                "predictions"
+            )
+        unknown = set(predictions.tolist()) - set(PREDICTION_LABELS)
+        if unknown:
+            raise ValueError(f"Canary batch got unknown predictions {unknown}")
+
+    def warmup(self, records: List[Dict[str, Any]]):
+        """
+        Load the model and score a warmup batch, to prime the lazily
+        initialized code paths and bring the model pages in memory.
+
+        The registry is ready once the warmup batch has been scored.
+
+        Args:
+            records (List[Dict[str, Any]]): The raw customer records to score.
+
+        Raises:
+            ModelUnavailableError: If the artifacts can't be loaded or the warmup
+                batch can't be scored.
+        """
+        churn_model = self.get().churn_model
+        start = time.perf_counter()
+        if records:
+            try:
+                churn_model.predict_records(records)
+            except ValueError as e:
+                self._error = f"Warmup failed: {e}"
+                logger.error(self._error)
+                raise ModelUnavailableError(self._error) from e
+        self._warm = True
+        logger.info(
+            f"Warmed up with {len(records)} records in "
+            f"{time.perf_counter() - start:.3f}s"
+        )
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "ready": self.ready,
+            "loaded": self._loaded is not None,
+            "model_version": None if self._loaded is None else self._loaded.version,
+            "release": self._release,
+            "error": self._error,
+            "reload_error": self._reload_error,
+        }
+
+
+def load_warmup_records(warmup_path: Path) -> List[Dict[str, Any]]:
+    """
+    Load a warmup batch, a JSON customer or list of customers.
+
+    Args:
+        warmup_path (Path): The JSON file.
+
+    Returns:
+        List[Dict[str, Any]]: The raw customer records.
+    """
+    with open(warmup_path, "r") as f:
+        records = json.load(f)
+    if isinstance(records, dict):
+        records = [records]
+    return [
+        {k: v for k, v in record.items() if k != "customerID"} for record in records
+    ]
@@ -1,109 +1,101 @@
+import time
 from pathlib import Path
+from typing import Callable, List, Optional
 
 import numpy as np
-import pandas as pd
-from sklearn.pipeline import Pipeline
-from sklearn.preprocessing import OneHotEncoder, StandardScaler
 
+from api.registry import ModelRegistry
+from api.schemas.prediction import CustomerData
 from models.churn import ChurnModel
-from models.features import (
-    FeaturePreprocessor,
-    MultiColumnLabelEncoder,
-    RatioComputer,
-    TenureBinarizer,
-)
+from models.production import PREDICTION_LABELS
 
-# Initialize the model
-# Define the columns to be encoded
-label_encoded_variables = [
-    "gender",
-    "seniorCitizen",
-    "partner",
-    "dependents",
-    "hasPhoneService",
-    "paperlessBilling",
-    "contractType",
-    "paymentMethod",
-    "TenureGroup",
-]
-onehot_encoded_variables = [
-    "multipleLines",
-    "internetServiceType",
-    "onlineSecurity",
-    "onlineBackup",
-    "deviceProtection",
-    "techSupport",
-    "streamingTV",
-    "streamingMovies",
-]
-standard_scaler_variables = [
-    "tenure",
-    "monthlyCharges",
-    "totalCharges",
-    "MonthlyTotalChargesRatio",
-]
+# Raw features of the customers to score
+INPUT_COLUMNS = [field for field in CustomerData.model_fields if field != "customerID"]
 
-bins = [0, 12, 24, 36, 48, 60, np.inf]
-labels = ["0-1 Year", "1-2 Years", "2-3 Years", "3-4 Years", "4-5 Years", "5+ Years"]
-tenure_binarizer = FeaturePreprocessor(
-    TenureBinarizer(bins=bins, labels=labels),
-    encoded_variables=["tenure"],
-    output_variables=["tenure", "TenureGroup"],
-)
-ratio_computer = FeaturePreprocessor(
-    RatioComputer("monthlyCharges", "totalCharges", "MonthlyTotalChargesRatio"),
-    encoded_variables=["monthlyCharges", "totalCharges"],
-    output_variables=["monthlyCharges", "totalCharges", "MonthlyTotalChargesRatio"],
-)
-scaler = FeaturePreprocessor(
-    model=StandardScaler(),
-    encoded_variables=standard_scaler_variables,
-    output_variables=standard_scaler_variables,
+# The model is loaded on first use, or at startup by the app. The active
+# release of data/releases is served when there is one.
+registry = ModelRegistry(
+    preprocessor_dir=Path("data/preprocessors"),
+    models_dir=Path("data/models"),
+    input_columns=INPUT_COLUMNS,
+    releases_dir=Path("data/releases"),
 )
-label_encoder = MultiColumnLabelEncoder(encoded_variables=label_encoded_variables)
-onehot_encoder = FeaturePreprocessor(
-    model=OneHotEncoder(sparse=False, drop="first"),
-    encoded_variables=onehot_encoded_variables,
-    output_variables=onehot_encoded_variables,
-    transform_to_dataframe=True,
-)
-preprocessor_dir = Path("data/preprocessors")
-scaler.deserialize(preprocessor_dir.joinpath("standard_scaler.pkl"))
-label_encoder.deserialize(preprocessor_dir.joinpath(f"label_encoder.pkl"))
-onehot_encoder.deserialize(preprocessor_dir.joinpath(f"onehot_encoder.pkl"))
 
-preprocessors = Pipeline(
-    [
-        ("tenure_binarizer", tenure_binarizer),
-        ("ratio_computer", ratio_computer),
-        ("scaler", scaler),
-        ("label_encoder", label_encoder),
-        ("onehot_encoder", onehot_encoder),
-    ]
-)
-churn_model = ChurnModel(
-    preprocessors=preprocessors,
-)
-models_dir = Path("data/models")
-churn_model.deserialize(models_dir.joinpath("churn_model_prod.pkl"))
+output_map = PREDICTION_LABELS
+
+
+def predict_churn_batch(
+    data: List[CustomerData],
+    return_exceptions: bool = False,
+    churn_model: Optional[ChurnModel] = None,
+    observer: Optional[Callable[[str, float], None]] = None,
+):
+    """Predict churn for many customers with a single model call.
 
-output_map = {0: "No Churn", 1: "Churn"}
+    All customers are encoded into one feature matrix by the compiled
+    preprocessors, so the forest is only invoked once for the whole batch.
 
+    Args:
+        data (List[CustomerData]): Customers to score.
+        return_exceptions (bool): If True, a customer rejected by the
+            preprocessors (e.g. an unseen label) does not fail the batch: its
+            exception is returned in place of its prediction.
+        churn_model (ChurnModel, optional): The model to use, the one currently
+            served by default.
+        observer (Callable[[str, float], None], optional): Called with the
+            name and the duration in seconds of each stage: `records`, the
+            stages of `CompiledPreprocessor.transform`, and `predict`.
 
-def predict_churn(data):
-    # Convert the input data to a Pandas DataFrame
-    input_data = pd.DataFrame(
-        [{k: v for k, v in data.dict().items() if k != "customerID"}]
-    )
+    Returns:
+        List[str]: Predictions, in the same order as the input.
 
-    # Perform the necessary preprocessing steps on the input data
-    # (e.g., encoding categorical variables and feature scaling)
-    # X = churn_model.preprocess(input_data)
-    # Make predictions using the model
-    predictions = churn_model.predict(input_data)
+    """
+    if not data:
+        return []
+    if churn_model is None:
+        churn_model = registry.get().churn_model
+    start = time.perf_counter()
+    records = [customer.model_dump() for customer in data]
+    if observer is not None:
+        observer("records", time.perf_counter() - start)
+    try:
+        features = churn_model.encode_records(records, observer=observer)
+        start = time.perf_counter()
+        predictions = churn_model.predict_encoded(features)
+        if observer is not None:
+            observer("predict", time.perf_counter() - start)
+    except ValueError as e:
+        if not return_exceptions:
+            raise
+        if len(data) == 1:
+            return [e]
+        # The encoders reject the whole batch for a single bad row, score the
+        # customers one by one to find out which ones are invalid
+        results = []
+        for record in records:
+            try:
+                results.append(output_map[churn_model.predict_records([record])[0]])
+            except ValueError as e:
+                results.append(e)
+        return results
+    return [output_map[prediction] for prediction in predictions]
 
-    # Convert the predictions to human-readable labels if needed
-    # (e.g., 'Churn' or 'No Churn')
 
-    # Return the predictions
-    return output_map[predictions[0]]
+def encode_customers(
+    data: List[CustomerData], churn_model: Optional[ChurnModel] = None
+) -> np.ndarray:
+    """Encode customers into the feature matrix expected by the model."""
+    if churn_model is None:
+        churn_model = registry.get().churn_model
+    return churn_model.encode_records([customer.model_dump() for customer in data])
+
+
+def predict_churn_encoded(
+    features: np.ndarray, churn_model: Optional[ChurnModel] = None
+) -> List[str]:
+    """Predict churn from a feature matrix returned by `encode_customers`."""
+    if churn_model is None:
+        churn_model = registry.get().churn_model
+    return [
+        output_map[prediction] for prediction in churn_model.predict_encoded(features)
+    ]
@@ -0,0 +1,47 @@
+# api/schemas/customer.py
+
+from typing import Dict, List, Optional
+
+from pydantic import BaseModel
+
+from api.schemas.prediction import CustomerData
+
+
+class CustomerIDPage(BaseModel):
+    customerIDs: List[str]
+    # Last ID of the page, to request the next one, None on the last page
+    next: Optional[str] = None
+
+
+class CustomerDeletion(BaseModel):
+    # The customers to delete, given by ID or by churn label
+    customerIDs: Optional[List[str]] = None
+    churn: Optional[str] = None
+
+
+class CustomerDeletionResult(BaseModel):
+    # Number of deleted rows per table
+    deleted: Dict[str, int]
+
+
+class CustomerRecord(CustomerData):
+    # Customer of a bulk ingest, with its churn label when known
+    totalCharges: Optional[float] = None
+    churn: Optional[str] = None
+
+
+class CustomerIngestError(BaseModel):
+    # Line of the uploaded body, the header of a CSV being line 1
+    line: int
+    error: str
+
+
+class CustomerIngestSummary(BaseModel):
+    rows: int = 0
+    inserted: int = 0
+    # Customers already in the database
+    skipped: int = 0
+    rejected: int = 0
+    scored: int = 0
+    # Errors of the first rejected rows
+    errors: List[CustomerIngestError] = []
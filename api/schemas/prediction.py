@@ -1,5 +1,7 @@
 # api/schemas/prediction.py
 
+from typing import List, Optional
+
 from pydantic import BaseModel
 
 
@@ -28,3 +30,14 @@ class CustomerData(BaseModel):
 
 class CustomerChurnPrediction(BaseModel):
     churnPrediction: str
+
+
+class CustomerChurnBatchItem(BaseModel):
+    index: int
+    customerID: Optional[str] = None
+    churnPrediction: Optional[str] = None
+    error: Optional[str] = None
+
+
+class CustomerChurnBatchPrediction(BaseModel):
+    predictions: List[CustomerChurnBatchItem]
@@ -0,0 +1,172 @@
+import argparse
+import gc
+import os
+import signal
+import socket
+import time
+from typing import Dict
+
+from utils.logger import setup_logger
+from utils.memory import memory_usage
+
+logger = setup_logger("api_server")
+
+
+def _bind_socket(host: str, port: int, backlog: int = 2048) -> socket.socket:
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _run_worker(app, sock: socket.socket, log_level: str):
+    import uvicorn
+
+    # Let uvicorn install its own shutdown handlers
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    config = uvicorn.Config(app, log_level=log_level)
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def _spawn_worker(app, sock: socket.socket, log_level: str) -> int:
+    pid = os.fork()
+    if pid == 0:
+        exit_code = 0
+        try:
+            _run_worker(app, sock, log_level)
+        except BaseException:
+            logger.exception(f"Worker {os.getpid()} crashed")
+            exit_code = 1
+        finally:
+            # Never return into the parent's supervision loop
+            os._exit(exit_code)
+    logger.info(f"Started worker {pid}")
+    return pid
+
+
+def _report_memory(workers: Dict[int, int]):
+    parent = memory_usage()
+    logger.info(
+        f"Parent {os.getpid()} memory: rss={parent['rss']} pss={parent['pss']} "
+        f"uss={parent['uss']}"
+    )
+    for pid in workers:
+        usage = memory_usage(pid)
+        logger.info(
+            f"Worker {pid} memory: rss={usage['rss']} pss={usage['pss']} "
+            f"uss={usage['uss']}"
+        )
+
+
+def serve(
+    host: str = "0.0.0.0",
+    port: int = 8000,
+    workers: int = 2,
+    log_level: str = "info",
+    memory_report_interval: float = 60.0,
+):
+    """
+    Serve the API with several worker processes sharing the loaded model.
+
+    The app, and therefore the preprocessors and the churn model, is loaded
+    once in this parent process before the workers are forked, so their memory
+    pages are shared copy-on-write instead of being duplicated in every worker.
+    The loaded objects are moved to the garbage collector's permanent
+    generation before forking: collections in the workers then never write to
+    their headers, which would otherwise unshare the pages they live on. The
+    node arrays of the forest are never written to, and stay shared. When the
+    model is exported as a memory-mapped forest, its node tables are shared
+    through the page cache with any other process mapping them.
+
+    The parent restarts workers that die, logs the memory usage (RSS, PSS and
+    USS) of every worker every `memory_report_interval` seconds and forwards
+    SIGINT/SIGTERM to the workers on shutdown.
+
+    Args:
+        host (str): The interface to bind.
+        port (int): The port to bind.
+        workers (int): The number of worker processes.
+        log_level (str): The uvicorn log level.
+        memory_report_interval (float): Seconds between two memory reports, or
+            0 to disable them.
+    """
+    from api.main import app, warmup_model
+
+    # Load and warm up the model before forking, so that the workers share it
+    # and are ready as soon as they start
+    warmup_model()
+
+    sock = _bind_socket(host, port)
+    logger.info(f"Listening on {host}:{port} with {workers} workers")
+
+    gc.collect()
+    gc.freeze()
+
+    worker_pids: Dict[int, int] = {}
+    shutting_down = False
+
+    def shutdown(signum, frame):
+        nonlocal shutting_down
+        shutting_down = True
+        for pid in worker_pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+    for i in range(workers):
+        worker_pids[_spawn_worker(app, sock, log_level)] = i
+
+    last_report = time.monotonic()
+    while worker_pids:
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            break
+        if pid:
+            index = worker_pids.pop(pid)
+            logger.info(f"Worker {pid} exited with status {status}")
+            if not shutting_down:
+                worker_pids[_spawn_worker(app, sock, log_level)] = index
+            continue
+
+        if (
+            memory_report_interval
+            and not shutting_down
+            and time.monotonic() - last_report >= memory_report_interval
+        ):
+            _report_memory(worker_pids)
+            last_report = time.monotonic()
+        time.sleep(0.2)
+
+    sock.close()
+    logger.info("Server stopped")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--log-level", default="info")
+    parser.add_argument("--memory-report-interval", type=float, default=60.0)
+
+    args = parser.parse_args()
+    serve(
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        log_level=args.log_level,
+        memory_report_interval=args.memory_report_interval,
+    )
+
+
+if __name__ == "__main__":
+    main()
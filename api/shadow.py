@@ -0,0 +1,168 @@
+import os
+import queue
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+from api.batching import Histogram
+from api.registry import ModelRegistry, ModelUnavailableError
+from api.routers.prediction import predict_churn_batch
+from api.schemas.prediction import CustomerData
+from utils.logger import setup_logger
+
+logger = setup_logger("shadow")
+
+
+class ShadowScorer:
+    """
+    ShadowScorer scores the customers of live requests with a candidate model,
+    to compare it with the production model before promoting it.
+
+    The customers are queued with the prediction served to them and scored in
+    batches by a background thread, so the requests never wait for the
+    candidate model. The queue is bounded: when the thread falls behind, new
+    customers are dropped instead of queued.
+
+    Args:
+        registry (ModelRegistry): The registry of the candidate model.
+        max_queue_size (int): The maximum number of customers waiting to be
+            scored.
+        max_batch_size (int): The maximum number of customers scored in one
+            call.
+
+    """
+
+    def __init__(
+        self,
+        registry: ModelRegistry,
+        max_queue_size: int = 1000,
+        max_batch_size: int = 64,
+    ):
+        self._registry = registry
+        self._max_batch_size = max_batch_size
+        self._queue: "queue.Queue[Optional[Tuple[CustomerData, str]]]" = queue.Queue(
+            maxsize=max_queue_size
+        )
+        self._worker: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+        self._submitted = 0
+        self._dropped = 0
+        self._scored = 0
+        self._errors = 0
+        self._disagreements = 0
+        # (served prediction, shadow prediction) -> count
+        self._pairs: Counter = Counter()
+        self._latency_histogram = Histogram([1, 2, 5, 10, 20, 50, 100, 200, 500, 1000])
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def submit(self, data: CustomerData, prediction: str):
+        """
+        Queue a customer to be scored by the candidate model, without blocking.
+
+        Args:
+            data (CustomerData): The customer features.
+            prediction (str): The prediction served by the production model.
+        """
+        self._ensure_worker()
+        self._submitted += 1
+        try:
+            self._queue.put_nowait((data, prediction))
+        except queue.Full:
+            self._dropped += 1
+
+    def join(self):
+        """Wait until all the queued customers are scored."""
+        self._queue.join()
+
+    def stop(self):
+        """Stop the background thread, the queued customers are scored first."""
+        worker = self._worker
+        if worker is not None and worker.is_alive():
+            self._queue.put(None)
+            worker.join()
+        self._worker = None
+
+    def stats(self) -> Dict[str, Any]:
+        status = self._registry.status()
+        return {
+            "enabled": True,
+            "model_version": status["model_version"],
+            "error": status["error"],
+            "queue_depth": self.queue_depth,
+            "max_queue_size": self._queue.maxsize,
+            "submitted": self._submitted,
+            "dropped": self._dropped,
+            "scored": self._scored,
+            "errors": self._errors,
+            "disagreements": self._disagreements,
+            "disagreement_rate": self._disagreements / self._scored
+            if self._scored
+            else None,
+            "predictions": {
+                f"{served} -> {shadow}": count
+                for (served, shadow), count in sorted(self._pairs.items())
+            },
+            "latency_ms": self._latency_histogram.to_dict(),
+        }
+
+    def _ensure_worker(self):
+        # Threads don't survive a fork, each worker of the pre-fork server
+        # starts its own
+        if self._worker is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._worker is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._worker = threading.Thread(target=self._run, daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            batch = [item]
+            while item is not None and len(batch) < self._max_batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                batch.append(item)
+            stop = batch[-1] is None
+            items = [item for item in batch if item is not None]
+            try:
+                if items:
+                    self._score(items)
+            except Exception:
+                self._errors += len(items)
+                logger.exception(f"Shadow batch of {len(items)} customers failed")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+            if stop:
+                return
+
+    def _score(self, items: List[Tuple[CustomerData, str]]):
+        try:
+            churn_model = self._registry.get().churn_model
+        except ModelUnavailableError:
+            # Logged by the registry, which retries loading on the next batch
+            self._errors += len(items)
+            return
+        start = time.perf_counter()
+        predictions = predict_churn_batch(
+            [data for data, _ in items], return_exceptions=True, churn_model=churn_model
+        )
+        self._latency_histogram.observe((time.perf_counter() - start) * 1000)
+        for (_, served), shadow in zip(items, predictions):
+            if isinstance(shadow, Exception):
+                self._errors += 1
+                continue
+            self._scored += 1
+            self._pairs[(served, shadow)] += 1
+            if shadow != served:
+                self._disagreements += 1
@@ -0,0 +1,202 @@
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from starlette.concurrency import run_in_threadpool
+
+from api.batching import Histogram
+from utils.logger import setup_logger
+
+logger = setup_logger("write_behind")
+
+
+class WriteBehindBuffer:
+    """
+    WriteBehindBuffer collects rows in memory and writes them in batches from a
+    background thread, so that the requests producing them don't wait for the
+    database.
+
+    A batch is written as soon as the buffer holds `flush_size` rows or when
+    the oldest row has waited `max_wait_ms` milliseconds. The buffer holds at
+    most `max_size` rows: when it is full, the producers wait for the next
+    batch to be taken instead of growing it. The buffered rows are written
+    when the buffer is stopped.
+
+    Args:
+        write (Callable[[List[Any]], None]): Function writing a batch of rows,
+            in a single transaction.
+        flush_size (int): Number of buffered rows triggering a write.
+        max_wait_ms (float): Maximum time a row waits in the buffer.
+        max_size (int): Maximum number of buffered rows.
+
+    """
+
+    def __init__(
+        self,
+        write: Callable[[List[Any]], None],
+        flush_size: int = 500,
+        max_wait_ms: float = 200.0,
+        max_size: int = 10000,
+    ):
+        if flush_size < 1 or max_size < flush_size:
+            raise ValueError("flush_size must be between 1 and max_size")
+        self._write = write
+        self._flush_size = flush_size
+        self._max_wait = max_wait_ms / 1000
+        self._max_size = max_size
+        self._rows: List[Any] = []
+        self._oldest: Optional[float] = None
+        self._writing = 0
+        # Numbers of rows ever buffered, and taken by the worker and written
+        # or failed, for `flush` to wait for the rows buffered before it only
+        self._enqueued = 0
+        self._completed = 0
+        self._stopping = False
+        self._condition = threading.Condition()
+        self._worker: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+
+        self._written = 0
+        self._failed = 0
+        self._waits = 0
+        self._batch_size_histogram = Histogram(
+            [2**i for i in range(max_size.bit_length() + 1)]
+        )
+        self._flush_latency_histogram = Histogram(
+            [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 5000]
+        )
+
+    @property
+    def buffered(self) -> int:
+        return len(self._rows)
+
+    def put(self, rows: List[Any], block: bool = True) -> bool:
+        """
+        Buffer rows to be written.
+
+        Args:
+            rows (List[Any]): The rows.
+            block (bool): Whether to wait for room in the buffer when full.
+
+        Returns:
+            bool: Whether the rows were buffered, always True when blocking.
+        """
+        if not rows:
+            return True
+        self._ensure_worker()
+        with self._condition:
+            # A batch larger than the buffer is accepted once it is empty
+            while self._rows and len(self._rows) + len(rows) > self._max_size:
+                if not block:
+                    return False
+                self._waits += 1
+                self._condition.wait()
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            self._rows.extend(rows)
+            self._enqueued += len(rows)
+            self._condition.notify_all()
+        return True
+
+    async def submit(self, rows: List[Any]):
+        """
+        Buffer rows from the event loop, waiting in the thread pool when the
+        buffer is full.
+
+        Args:
+            rows (List[Any]): The rows.
+        """
+        if not self.put(rows, block=False):
+            await run_in_threadpool(self.put, rows)
+
+    def flush(self):
+        """
+        Write the buffered rows now, and wait until they are written.
+
+        The rows buffered after the call are not waited for, so that a flush
+        returns under a steady stream of rows.
+        """
+        with self._condition:
+            target = self._enqueued
+            if self._rows:
+                self._oldest = 0.0
+            self._condition.notify_all()
+            while self._completed < target and self._worker_alive():
+                self._condition.wait()
+
+    def stop(self):
+        """Write the buffered rows and stop the background thread."""
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+        if self._worker_alive():
+            self._worker.join()
+        self._worker = None
+        self._stopping = False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "buffered": self.buffered,
+            "max_size": self._max_size,
+            "flush_size": self._flush_size,
+            "max_wait_ms": self._max_wait * 1000,
+            "written": self._written,
+            "failed": self._failed,
+            "producer_waits": self._waits,
+            "batch_size": self._batch_size_histogram.to_dict(),
+            "flush_latency_ms": self._flush_latency_histogram.to_dict(),
+        }
+
+    def _worker_alive(self) -> bool:
+        return (
+            self._worker is not None
+            and self._pid == os.getpid()
+            and self._worker.is_alive()
+        )
+
+    def _ensure_worker(self):
+        # Threads don't survive a fork, each worker of the pre-fork server
+        # starts its own
+        if self._worker is not None and self._pid == os.getpid():
+            return
+        with self._condition:
+            if self._worker is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._worker = threading.Thread(target=self._run, daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._stopping and len(self._rows) < self._flush_size:
+                    if self._oldest is None:
+                        self._condition.wait()
+                        continue
+                    timeout = self._oldest + self._max_wait - time.monotonic()
+                    if timeout <= 0:
+                        break
+                    self._condition.wait(timeout)
+                if not self._rows:
+                    if self._stopping:
+                        return
+                    continue
+                batch, self._rows, self._oldest = self._rows, [], None
+                self._writing = len(batch)
+                # Room was made for the producers waiting on a full buffer
+                self._condition.notify_all()
+
+            start = time.perf_counter()
+            try:
+                self._write(batch)
+                self._written += len(batch)
+            except Exception:
+                self._failed += len(batch)
+                logger.exception(f"Failed to write a batch of {len(batch)} rows")
+            self._flush_latency_histogram.observe((time.perf_counter() - start) * 1000)
+            self._batch_size_histogram.observe(len(batch))
+
+            with self._condition:
+                self._writing = 0
+                self._completed += len(batch)
+                self._condition.notify_all()
@@ -0,0 +1,305 @@
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Sequence
+
+import pandas as pd
+from sqlalchemy import Connection, Table, delete, func, insert, select
+
+from database.models import (
+    Contract,
+    Customer,
+    CustomerChurn,
+    CustomerFeatures,
+    InternetService,
+    PhoneService,
+)
+from database.queries import join_customer_features
+from utils.logger import setup_logger
+
+logger = setup_logger("database_bulk")
+
+# Columns of each table, mapped from the columns of the Telco customer churn CSV
+CUSTOMER_COLUMNS = {
+    "id": "customerID",
+    "gender": "gender",
+    "seniorCitizen": "SeniorCitizen",
+    "partner": "Partner",
+    "dependents": "Dependents",
+}
+CONTRACT_COLUMNS = {
+    "contractType": "Contract",
+    "tenure": "tenure",
+    "paperlessBilling": "PaperlessBilling",
+    "paymentMethod": "PaymentMethod",
+    "monthlyCharges": "MonthlyCharges",
+    "totalCharges": "TotalCharges",
+}
+PHONE_SERVICE_COLUMNS = {
+    "hasPhoneService": "PhoneService",
+    "multipleLines": "MultipleLines",
+}
+INTERNET_SERVICE_COLUMNS = {
+    "internetServiceType": "InternetService",
+    "onlineSecurity": "OnlineSecurity",
+    "onlineBackup": "OnlineBackup",
+    "deviceProtection": "DeviceProtection",
+    "techSupport": "TechSupport",
+    "streamingTV": "StreamingTV",
+    "streamingMovies": "StreamingMovies",
+}
+# Columns of the denormalized CustomerFeatures table
+CUSTOMER_FEATURES_COLUMNS = {
+    **CUSTOMER_COLUMNS,
+    **CONTRACT_COLUMNS,
+    **PHONE_SERVICE_COLUMNS,
+    **INTERNET_SERVICE_COLUMNS,
+}
+
+# Maximum number of bound parameters in a single `IN` clause, below the SQLite
+# limit of older versions
+_MAX_IN_PARAMETERS = 900
+
+
+def _column_values(data: pd.Series) -> List[Any]:
+    # Python values of a column, NaN being stored as NULL
+    return data.astype(object).where(data.notna(), None).tolist()
+
+
+def _insert_many(connection: Connection, table: Table, columns: Dict[str, List[Any]]):
+    if not next(iter(columns.values())):
+        return
+    # The statement is compiled once and the rows are bound by the driver itself,
+    # skipping the per-row parameter processing of SQLAlchemy, which would take
+    # most of the loading time. The values must already be plain Python types.
+    compiled = insert(table).compile(
+        dialect=connection.dialect, column_keys=list(columns)
+    )
+    if compiled.positional:
+        parameters = list(zip(*(columns[key] for key in compiled.positiontup)))
+    else:
+        parameters = [dict(zip(columns, row)) for row in zip(*columns.values())]
+    connection.exec_driver_sql(str(compiled), parameters)
+
+
+def _existing_customer_ids(connection: Connection, customer_ids: List[str]) -> set:
+    existing = set()
+    for start in range(0, len(customer_ids), _MAX_IN_PARAMETERS):
+        batch = customer_ids[start : start + _MAX_IN_PARAMETERS]
+        existing.update(
+            connection.scalars(select(Customer.id).where(Customer.id.in_(batch)))
+        )
+    return existing
+
+
+def _lock_for_insert(connection: Connection):
+    # Take the write lock before reading the existing customers and the largest
+    # contract ID, so that concurrent loads wait for each other instead of
+    # allocating the same contract IDs
+    if connection.dialect.name == "sqlite":
+        connection.exec_driver_sql("BEGIN IMMEDIATE")
+    elif connection.dialect.name == "postgresql":
+        connection.exec_driver_sql(
+            f'LOCK TABLE "{Contract.__tablename__}" IN SHARE ROW EXCLUSIVE MODE'
+        )
+
+
+def prepare_customers(data: pd.DataFrame) -> pd.DataFrame:
+    """
+    Clean a chunk of the Telco customer churn CSV before its insertion.
+
+    Args:
+        data (pd.DataFrame): The raw chunk.
+
+    Returns:
+        pd.DataFrame: The cleaned chunk.
+    """
+    data = data.copy()
+    data["TotalCharges"] = pd.to_numeric(data["TotalCharges"], errors="coerce")
+    data["SeniorCitizen"] = data["SeniorCitizen"].map({0: "No", 1: "Yes"})
+    return data
+
+
+def insert_customers(connection: Connection, data: pd.DataFrame) -> int:
+    """
+    Insert customers in all the tables of the database, in a single transaction,
+    skipping the ones already in the database.
+
+    Args:
+        connection (Connection): The database connection, not in a transaction.
+        data (pd.DataFrame): The customers, as cleaned by `prepare_customers`.
+
+    Returns:
+        int: The number of inserted customers.
+    """
+    return len(insert_new_customers(connection, data))
+
+
+def insert_new_customers(connection: Connection, data: pd.DataFrame) -> List[str]:
+    """
+    Insert customers in all the tables of the database, in a single transaction.
+
+    Each table is inserted with a single executemany `INSERT` on the driver,
+    without going through the ORM. The contract IDs are allocated here, after
+    the largest ID in the table, so that the phone and internet services can
+    reference their contract without fetching the generated keys back. The
+    CustomerFeatures table is written from the same columns. Customers already
+    in the database are skipped, so that an interrupted load can be resumed.
+
+    Args:
+        connection (Connection): The database connection, not in a transaction.
+        data (pd.DataFrame): The customers, as cleaned by `prepare_customers`.
+
+    Returns:
+        List[str]: The IDs of the inserted customers.
+    """
+    with connection.begin():
+        _lock_for_insert(connection)
+        existing = _existing_customer_ids(connection, data["customerID"].tolist())
+        if existing:
+            data = data[~data["customerID"].isin(existing)]
+        if data.empty:
+            return []
+
+        first_contract_id = connection.scalar(
+            select(func.coalesce(func.max(Contract.id), 0) + 1)
+        )
+        contract_ids = list(range(first_contract_id, first_contract_id + len(data)))
+        customer_ids = data["customerID"].tolist()
+
+        def columns(mapping: Dict[str, str]) -> Dict[str, List[Any]]:
+            return {attr: _column_values(data[col]) for attr, col in mapping.items()}
+
+        _insert_many(connection, Customer.__table__, columns(CUSTOMER_COLUMNS))
+        _insert_many(
+            connection,
+            Contract.__table__,
+            {
+                "id": contract_ids,
+                "customer_id": customer_ids,
+                **columns(CONTRACT_COLUMNS),
+            },
+        )
+        _insert_many(
+            connection,
+            PhoneService.__table__,
+            {"contract_id": contract_ids, **columns(PHONE_SERVICE_COLUMNS)},
+        )
+        _insert_many(
+            connection,
+            InternetService.__table__,
+            {"contract_id": contract_ids, **columns(INTERNET_SERVICE_COLUMNS)},
+        )
+        # Customers without a churn label have no churn row
+        labelled = data["Churn"].notna().to_numpy()
+        _insert_many(
+            connection,
+            CustomerChurn.__table__,
+            {
+                "customer_id": data["customerID"][labelled].tolist(),
+                "churn": _column_values(data["Churn"][labelled]),
+            },
+        )
+        _insert_many(
+            connection, CustomerFeatures.__table__, columns(CUSTOMER_FEATURES_COLUMNS)
+        )
+    return customer_ids
+
+
+def rebuild_customer_features(connection: Connection) -> int:
+    """
+    Rebuild the CustomerFeatures table from the Customer, Contract, PhoneService
+    and InternetService tables, with a single `INSERT ... SELECT`.
+
+    The rebuild is not committed, so that it replaces the table at once when
+    the caller commits.
+
+    Args:
+        connection (Connection): The database connection.
+
+    Returns:
+        int: The number of customers in the table.
+    """
+    statement = join_customer_features()
+    connection.execute(delete(CustomerFeatures))
+    connection.execute(
+        insert(CustomerFeatures).from_select(
+            [column.key for column in statement.selected_columns], statement
+        )
+    )
+    return connection.scalar(select(func.count()).select_from(CustomerFeatures))
+
+
+def delete_customers(
+    connection: Connection, customer_ids: Sequence[str]
+) -> Dict[str, int]:
+    """
+    Delete customers and their rows in all the other tables.
+
+    Each table is deleted from with set-based `DELETE ... WHERE ... IN (...)`
+    statements, one per table and chunk of IDs, the child tables first. The
+    deletion is not committed, so that it happens at once when the caller
+    commits.
+
+    Args:
+        connection (Connection): The database connection.
+        customer_ids (Sequence[str]): The IDs of the customers.
+
+    Returns:
+        Dict[str, int]: The number of deleted rows per table.
+    """
+    tables = [
+        PhoneService,
+        InternetService,
+        CustomerChurn,
+        CustomerFeatures,
+        Contract,
+        Customer,
+    ]
+    counts = {table.__tablename__: 0 for table in tables}
+    customer_ids = list(dict.fromkeys(customer_ids))
+    for start in range(0, len(customer_ids), _MAX_IN_PARAMETERS):
+        batch = customer_ids[start : start + _MAX_IN_PARAMETERS]
+        contract_ids = select(Contract.id).where(Contract.customer_id.in_(batch))
+        for statement in [
+            delete(PhoneService).where(PhoneService.contract_id.in_(contract_ids)),
+            delete(InternetService).where(
+                InternetService.contract_id.in_(contract_ids)
+            ),
+            delete(CustomerChurn).where(CustomerChurn.customer_id.in_(batch)),
+            delete(CustomerFeatures).where(CustomerFeatures.id.in_(batch)),
+            delete(Contract).where(Contract.customer_id.in_(batch)),
+            delete(Customer).where(Customer.id.in_(batch)),
+        ]:
+            counts[statement.table.name] += connection.execute(statement).rowcount
+    return counts
+
+
+def load_customers_csv(
+    connection: Connection, csv_path: Path, chunk_size: int = 50000
+) -> int:
+    """
+    Load the customers of a Telco customer churn CSV into the database.
+
+    The file is read and inserted chunk by chunk, each chunk in its own
+    transaction, so that memory stays flat whatever the size of the file and an
+    interrupted load can be resumed by running it again.
+
+    Args:
+        connection (Connection): The database connection.
+        csv_path (Path): The path of the CSV file.
+        chunk_size (int): The number of rows per chunk.
+
+    Returns:
+        int: The number of inserted customers.
+    """
+    n_rows = 0
+    n_inserted = 0
+    start = time.perf_counter()
+    for chunk in pd.read_csv(csv_path, chunksize=chunk_size):
+        n_inserted += insert_customers(connection, prepare_customers(chunk))
+        n_rows += len(chunk)
+        elapsed = time.perf_counter() - start
+        logger.info(
+            f"Loaded {n_inserted}/{n_rows} customers ({n_rows / elapsed:.0f} rows/s)"
+        )
+    return n_inserted
@@ -0,0 +1,59 @@
+from typing import Any, Dict, Optional
+
+from sqlalchemy import Engine, create_engine, event
+
+# Pragmas applied to every new SQLite connection:
+# - WAL lets readers run while a transaction writes, instead of waiting for it
+# - with WAL, synchronous=NORMAL only syncs the log at checkpoints: a commit
+#   can be lost on power failure, but the database is never corrupted
+# - the database file is memory-mapped up to mmap_size bytes, so reads don't
+#   copy the pages from the OS page cache
+# - cache_size is the page cache of each connection, in KiB when negative
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "mmap_size": 256 * 2**20,
+    "cache_size": -64 * 2**10,
+}
+
+
+def apply_sqlite_pragmas(engine: Engine, pragmas: Optional[Dict[str, Any]] = None):
+    """
+    Apply pragmas to every new connection of an SQLite engine.
+
+    Args:
+        engine (Engine): The engine, the synchronous engine of an async engine.
+        pragmas (Dict[str, Any], optional): The pragmas, `SQLITE_PRAGMAS` by
+            default.
+    """
+    # An in-memory database has no file to log to or to map
+    if engine.dialect.name != "sqlite" or engine.url.database in (None, "", ":memory:"):
+        return
+    pragmas = SQLITE_PRAGMAS if pragmas is None else pragmas
+
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+
+def create_database_engine(
+    database_url: str, pragmas: Optional[Dict[str, Any]] = None, **kwargs
+) -> Engine:
+    """
+    Create an engine, with the SQLite pragmas applied on connect.
+
+    Args:
+        database_url (str): The database URL.
+        pragmas (Dict[str, Any], optional): The SQLite pragmas,
+            `SQLITE_PRAGMAS` by default.
+        **kwargs: The other arguments of `create_engine`.
+
+    Returns:
+        Engine: The engine.
+    """
+    engine = create_engine(database_url, **kwargs)
+    apply_sqlite_pragmas(engine, pragmas)
+    return engine
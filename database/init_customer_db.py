@@ -1,71 +1,44 @@
+import argparse
+import time
 from pathlib import Path
 
-import pandas as pd
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-
-from database.models import (
-    Base,
-    Contract,
-    Customer,
-    CustomerChurn,
-    InternetService,
-    PhoneService,
-)
-
-# Create an SQLite database (You can use a different database URL if needed)
-database_url = "sqlite:///customers.db"
-engine = create_engine(database_url)
-
-# Create tables in the database
-Base.metadata.create_all(engine)
+from database.bulk import load_customers_csv
+from database.engine import create_database_engine
+from database.migrations import migrate
+
+
+def main(
+    csv_path: Path = Path("data/raw/WA_Fn-UseC_-Telco-Customer-Churn.csv"),
+    database_url: str = "sqlite:///customers.db",
+    chunk_size: int = 50000,
+):
+    # Create an SQLite database (You can use a different database URL if needed)
+    engine = create_database_engine(database_url)
+
+    start = time.perf_counter()
+    with engine.connect() as connection:
+        # Create the tables, or upgrade the schema of an existing database
+        migrate(connection)
+        n_inserted = load_customers_csv(connection, csv_path, chunk_size=chunk_size)
+    elapsed = time.perf_counter() - start
+    print(
+        f"Inserted {n_inserted} customers in {elapsed:.1f}s "
+        f"({n_inserted / max(elapsed, 1e-9):.0f} rows/s)"
+    )
 
-# Initialize a session to interact with the database
-Session = sessionmaker(bind=engine)
-session = Session()
 
-data_dir = Path("data/raw/WA_Fn-UseC_-Telco-Customer-Churn.csv")
-data = pd.read_csv(data_dir)
-data["TotalCharges"] = pd.to_numeric(data["TotalCharges"], errors="coerce")
-data["SeniorCitizen"] = data["SeniorCitizen"].map({0: "No", 1: "Yes"})
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
 
-for _, row in data.iterrows():
-    phone_service = PhoneService(
-        hasPhoneService=row["PhoneService"], multipleLines=row["MultipleLines"]
-    )
-    internet_service = InternetService(
-        internetServiceType=row["InternetService"],
-        onlineSecurity=row["OnlineSecurity"],
-        onlineBackup=row["OnlineBackup"],
-        deviceProtection=row["DeviceProtection"],
-        techSupport=row["TechSupport"],
-        streamingTV=row["StreamingTV"],
-        streamingMovies=row["StreamingMovies"],
+    parser.add_argument(
+        "--csv-path", default="data/raw/WA_Fn-UseC_-Telco-Customer-Churn.csv"
     )
-    contract = Contract(
-        contractType=row["Contract"],
-        tenure=row["tenure"],
-        paperlessBilling=row["PaperlessBilling"],
-        paymentMethod=row["PaymentMethod"],
-        monthlyCharges=row["MonthlyCharges"],
-        totalCharges=row["TotalCharges"],
-        phone_service=phone_service,
-        internet_service=internet_service,
+    parser.add_argument("--database-url", default="sqlite:///customers.db")
+    parser.add_argument("--chunk-size", type=int, default=50000)
+
+    args = parser.parse_args()
+    main(
+        csv_path=Path(args.csv_path),
+        database_url=args.database_url,
+        chunk_size=args.chunk_size,
     )
-    customer_churn = CustomerChurn(churn=row["Churn"])
-
-    customer = Customer(
-        id=row["customerID"],
-        gender=row["gender"],
-        seniorCitizen=row["SeniorCitizen"],
-        partner=row["Partner"],
-        dependents=row["Dependents"],
-        contracts=[contract],
-        churns=[customer_churn],
-    )
-
-    session.add(customer)
-
-session.commit()
-
-session.close()
@@ -0,0 +1,128 @@
+import argparse
+import time
+from typing import Callable, List
+
+from sqlalchemy import Column, Connection, Integer, MetaData, Table, inspect, text
+
+from database.bulk import rebuild_customer_features
+from database.engine import create_database_engine
+from database.models import Base, Customer, CustomerFeatures
+from utils.logger import setup_logger
+
+logger = setup_logger("database_migrations")
+
+# Version of the schema of a database, in a table of its own
+schema_version_table = Table(
+    "SchemaVersion", MetaData(), Column("version", Integer, nullable=False)
+)
+
+
+def _index_foreign_keys(connection: Connection):
+    # The joins of the customer queries and the deletions look the child rows
+    # up by their foreign key, which was a full scan of the table
+    for table, column in [
+        ("Contract", "customer_id"),
+        ("PhoneService", "contract_id"),
+        ("InternetService", "contract_id"),
+        ("CustomerChurn", "customer_id"),
+    ]:
+        connection.execute(
+            text(
+                f'CREATE INDEX IF NOT EXISTS "ix_{table}_{column}" '
+                f'ON "{table}" ({column})'
+            )
+        )
+    # Refresh the statistics the query planner uses to pick the indexes
+    connection.execute(text("ANALYZE"))
+
+
+def _create_customer_features(connection: Connection):
+    # The features denormalized from the customer tables, read by the scoring
+    # and the training without joins
+    CustomerFeatures.__table__.create(connection, checkfirst=True)
+    n_customers = rebuild_customer_features(connection)
+    logger.info(f"Built the features of {n_customers} customers")
+
+
+# Migrations of the schema, each one upgrading it from the previous version. The
+# schema of the models is the one of the last version, and a released migration
+# must never be edited: add a new one instead.
+MIGRATIONS: List[Callable[[Connection], None]] = [
+    _index_foreign_keys,
+    _create_customer_features,
+]
+
+
+def get_schema_version(connection: Connection) -> int:
+    """
+    Get the version of the schema of a database.
+
+    Args:
+        connection (Connection): The connection to the database.
+
+    Returns:
+        int: The version, 0 for a database created before the migrations.
+    """
+    if not inspect(connection).has_table(schema_version_table.name):
+        return 0
+    return connection.scalar(schema_version_table.select()) or 0
+
+
+def _set_schema_version(connection: Connection, version: int):
+    schema_version_table.create(connection, checkfirst=True)
+    connection.execute(schema_version_table.delete())
+    connection.execute(schema_version_table.insert().values(version=version))
+
+
+def migrate(connection: Connection) -> int:
+    """
+    Create the tables of an empty database, or upgrade the schema of an
+    existing one in place.
+
+    Each migration is committed with its new version, so an interrupted
+    upgrade resumes from the last migration applied.
+
+    Args:
+        connection (Connection): The connection to the database.
+
+    Returns:
+        int: The version of the schema.
+    """
+    latest = len(MIGRATIONS)
+    version = get_schema_version(connection)
+    if version == 0 and not inspect(connection).has_table(Customer.__tablename__):
+        Base.metadata.create_all(connection)
+        _set_schema_version(connection, latest)
+        connection.commit()
+        logger.info(f"Created the tables at schema version {latest}")
+        return latest
+
+    for target in range(version + 1, latest + 1):
+        start = time.perf_counter()
+        MIGRATIONS[target - 1](connection)
+        _set_schema_version(connection, target)
+        connection.commit()
+        logger.info(
+            f"Migrated the schema to version {target} "
+            f"in {time.perf_counter() - start:.1f}s"
+        )
+    # End the transaction begun by reading the version when the schema is
+    # already current, so that the caller can begin its own
+    connection.commit()
+    return max(version, latest)
+
+
+def main(database_url: str = "sqlite:///customers.db"):
+    engine = create_database_engine(database_url)
+    with engine.connect() as connection:
+        version = migrate(connection)
+    print(f"Database {database_url} is at schema version {version}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument("--database-url", default="sqlite:///customers.db")
+
+    args = parser.parse_args()
+    main(database_url=args.database_url)
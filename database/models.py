@@ -34,7 +34,7 @@ class PhoneService(Base):
     hasPhoneService: Mapped[str] = mapped_column(String)
     multipleLines: Mapped[str] = mapped_column(String)
 
-    contract_id: Mapped[int] = mapped_column(ForeignKey("Contract.id"))
+    contract_id: Mapped[int] = mapped_column(ForeignKey("Contract.id"), index=True)
     contract: Mapped["Contract"] = relationship(back_populates="phone_service")
 
     def __repr__(self) -> str:
@@ -54,7 +54,7 @@ class InternetService(Base):
     streamingTV: Mapped[str] = mapped_column(String)
     streamingMovies: Mapped[str] = mapped_column(String)
 
-    contract_id: Mapped[int] = mapped_column(ForeignKey("Contract.id"))
+    contract_id: Mapped[int] = mapped_column(ForeignKey("Contract.id"), index=True)
     contract: Mapped["Contract"] = relationship(back_populates="internet_service")
 
     def __repr__(self) -> str:
@@ -73,7 +73,7 @@ class Contract(Base):
     monthlyCharges: Mapped[float] = mapped_column(Float)
     totalCharges: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
 
-    customer_id: Mapped[int] = mapped_column(ForeignKey("Customer.id"))
+    customer_id: Mapped[int] = mapped_column(ForeignKey("Customer.id"), index=True)
     customer: Mapped["Customer"] = relationship(back_populates="contracts")
 
     # Define the one-to-one relationship between Contract and PhoneService
@@ -96,8 +96,77 @@ class CustomerChurn(Base):
 
     churn: Mapped[str] = mapped_column(String)
 
-    customer_id: Mapped[int] = mapped_column(ForeignKey("Customer.id"))
+    customer_id: Mapped[int] = mapped_column(ForeignKey("Customer.id"), index=True)
     customer: Mapped["Customer"] = relationship(back_populates="churns")
 
     def __repr__(self) -> str:
         return f"CustomerChurn(id={self.id!r}, churn={self.churn!r})"
+
+
+# Define the CustomerFeatures table, denormalized from the Customer, Contract,
+# PhoneService and InternetService tables so that the features are read
+# without joins. It is written along with them, and rebuilt from them by
+# `database/rebuild_customer_features.py`.
+class CustomerFeatures(Base):
+    __tablename__ = "CustomerFeatures"
+
+    id: Mapped[str] = mapped_column(ForeignKey("Customer.id"), primary_key=True)
+    gender: Mapped[str] = mapped_column(String)
+    seniorCitizen: Mapped[str] = mapped_column(String)
+    partner: Mapped[str] = mapped_column(String)
+    dependents: Mapped[str] = mapped_column(String)
+    tenure: Mapped[int] = mapped_column(Integer)
+    hasPhoneService: Mapped[str] = mapped_column(String)
+    multipleLines: Mapped[str] = mapped_column(String)
+    internetServiceType: Mapped[str] = mapped_column(String)
+    onlineSecurity: Mapped[str] = mapped_column(String)
+    onlineBackup: Mapped[str] = mapped_column(String)
+    deviceProtection: Mapped[str] = mapped_column(String)
+    techSupport: Mapped[str] = mapped_column(String)
+    streamingTV: Mapped[str] = mapped_column(String)
+    streamingMovies: Mapped[str] = mapped_column(String)
+    contractType: Mapped[str] = mapped_column(String)
+    paperlessBilling: Mapped[str] = mapped_column(String)
+    paymentMethod: Mapped[str] = mapped_column(String)
+    monthlyCharges: Mapped[float] = mapped_column(Float)
+    totalCharges: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+
+    @classmethod
+    def from_customer(cls, customer: Customer) -> "CustomerFeatures":
+        """
+        Denormalize the features of a customer, from its contract and services.
+
+        Args:
+            customer (Customer): The customer, with its contract.
+
+        Returns:
+            CustomerFeatures: The features of the customer.
+        """
+        contract = customer.contracts[0]
+        phone_service = contract.phone_service
+        internet_service = contract.internet_service
+        return cls(
+            id=customer.id,
+            gender=customer.gender,
+            seniorCitizen=customer.seniorCitizen,
+            partner=customer.partner,
+            dependents=customer.dependents,
+            tenure=contract.tenure,
+            hasPhoneService=phone_service.hasPhoneService,
+            multipleLines=phone_service.multipleLines,
+            internetServiceType=internet_service.internetServiceType,
+            onlineSecurity=internet_service.onlineSecurity,
+            onlineBackup=internet_service.onlineBackup,
+            deviceProtection=internet_service.deviceProtection,
+            techSupport=internet_service.techSupport,
+            streamingTV=internet_service.streamingTV,
+            streamingMovies=internet_service.streamingMovies,
+            contractType=contract.contractType,
+            paperlessBilling=contract.paperlessBilling,
+            paymentMethod=contract.paymentMethod,
+            monthlyCharges=contract.monthlyCharges,
+            totalCharges=contract.totalCharges,
+        )
+
+    def __repr__(self) -> str:
+        return f"CustomerFeatures(id={self.id!r}, tenure={self.tenure!r}, contractType={self.contractType!r}, monthlyCharges={self.monthlyCharges!r})"
@@ -0,0 +1,199 @@
+import sys
+from typing import Iterator, Optional, Sequence, Union
+
+import pandas as pd
+from sqlalchemy import Connection, Float, Integer, Select, String, select
+
+from database.models import (
+    Contract,
+    Customer,
+    CustomerChurn,
+    CustomerFeatures,
+    InternetService,
+    PhoneService,
+)
+
+
+def join_customer_features() -> Select:
+    """
+    Select the customers' features, joined from the Customer, Contract,
+    PhoneService and InternetService tables, to build the CustomerFeatures table.
+
+    The columns are labelled as the model attributes, with the customer ID in
+    `id`.
+
+    Returns:
+        Select: The select statement, to be filtered by the caller.
+    """
+    return (
+        select(
+            Customer.id,
+            Customer.gender,
+            Customer.seniorCitizen,
+            Customer.partner,
+            Customer.dependents,
+            Contract.tenure,
+            PhoneService.hasPhoneService,
+            PhoneService.multipleLines,
+            InternetService.internetServiceType,
+            InternetService.onlineSecurity,
+            InternetService.onlineBackup,
+            InternetService.deviceProtection,
+            InternetService.techSupport,
+            InternetService.streamingTV,
+            InternetService.streamingMovies,
+            Contract.contractType,
+            Contract.paperlessBilling,
+            Contract.paymentMethod,
+            Contract.monthlyCharges,
+            Contract.totalCharges,
+        )
+        .join(Contract, Contract.customer_id == Customer.id)
+        .join(PhoneService, PhoneService.contract_id == Contract.id)
+        .join(InternetService, InternetService.contract_id == Contract.id)
+    )
+
+
+def select_customer_features() -> Select:
+    """
+    Select the customers' features, from the CustomerFeatures table.
+
+    The columns are the ones of `join_customer_features`, read without joins.
+
+    Returns:
+        Select: The select statement, to be filtered by the caller with
+            `CustomerFeatures.id`.
+    """
+    return select(*CustomerFeatures.__table__.columns)
+
+
+def select_customer_ids(
+    after: Optional[str] = None, prefix: Optional[str] = None, limit: int = 100
+) -> Select:
+    """
+    Select a page of customer IDs, in ID order.
+
+    The page starts after the last ID of the previous page (keyset pagination)
+    instead of skipping rows with an offset, so every page is a range scan of
+    the primary key index, however deep it is.
+
+    Args:
+        after (str, optional): The last ID of the previous page.
+        prefix (str, optional): Only select the IDs starting with it.
+        limit (int): The maximum number of IDs.
+
+    Returns:
+        Select: The select statement.
+    """
+    statement = select(Customer.id).order_by(Customer.id).limit(limit)
+    if after is not None:
+        statement = statement.where(Customer.id > after)
+    if prefix:
+        # A range rather than LIKE, which is case-insensitive in SQLite and
+        # can't use the index: the IDs with the prefix are the ones between it
+        # and the prefix with its last character incremented
+        statement = statement.where(Customer.id >= prefix)
+        upper_bound = _prefix_upper_bound(prefix)
+        if upper_bound is not None:
+            statement = statement.where(Customer.id < upper_bound)
+    return statement
+
+
+def _prefix_upper_bound(prefix: str) -> Optional[str]:
+    # The last character can't be incremented past U+10FFFF: the strings
+    # starting with "a\U0010ffff" are the ones before "b". A prefix of only
+    # U+10FFFF characters has no upper bound, every string after it has it.
+    stripped = prefix.rstrip(chr(sys.maxunicode))
+    if not stripped:
+        return None
+    code_point = ord(stripped[-1]) + 1
+    # Surrogates can't be encoded, and no string has them: U+D7FF is followed
+    # by U+E000
+    if 0xD800 <= code_point <= 0xDFFF:
+        code_point = 0xE000
+    return stripped[:-1] + chr(code_point)
+
+
+def select_customer_info() -> Select:
+    """
+    Select the customers' features and churn label, from the CustomerFeatures
+    table joined with the CustomerChurn table.
+
+    The columns are labelled as the model attributes, with the customer ID in
+    `id` and the churn label in `churn`. The churn labels stay in their own
+    table, as a customer has one row per label or stored prediction.
+
+    Returns:
+        Select: The select statement, to be filtered by the caller with
+            `CustomerFeatures.id`.
+    """
+    return (
+        select_customer_features()
+        .add_columns(CustomerChurn.churn)
+        .join(
+            CustomerChurn,
+            CustomerChurn.customer_id == CustomerFeatures.id,
+            isouter=True,
+        )
+    )
+
+
+def _customer_frame(
+    rows: Sequence[tuple], statement: Select, index_col: Optional[str]
+) -> pd.DataFrame:
+    # Build the frame column by column, with the dtypes of the selected columns
+    columns = list(zip(*rows)) if rows else [()] * len(statement.selected_columns)
+    data = {}
+    for column, values in zip(statement.selected_columns, columns):
+        if isinstance(column.type, String) and not column.primary_key:
+            dtype = "category"
+        elif isinstance(column.type, Float):
+            dtype = "float64"
+        elif isinstance(column.type, Integer) and None not in values:
+            dtype = "int64"
+        else:
+            dtype = None
+        data[column.key] = pd.Series(values, dtype=dtype)
+    frame = pd.DataFrame(data)
+    if index_col is not None:
+        frame.set_index(index_col, inplace=True)
+    return frame
+
+
+def load_customer_frame(
+    connection: Connection,
+    statement: Optional[Select] = None,
+    index_col: Optional[str] = "id",
+    chunksize: Optional[int] = None,
+) -> Union[pd.DataFrame, Iterator[pd.DataFrame]]:
+    """
+    Load customers into a DataFrame, running the join once.
+
+    The string columns are categoricals, except the primary keys, the float
+    columns float64 (a NULL being NaN) and the integer columns int64 when they
+    have no NULL.
+
+    Args:
+        connection (Connection): The database connection.
+        statement (Select, optional): The select statement, `select_customer_info`
+            by default.
+        index_col (str, optional): The column to use as index.
+        chunksize (int, optional): If given, stream the customers and return an
+            iterator of DataFrames of `chunksize` rows. The categories of each
+            chunk are the values of this chunk.
+
+    Returns:
+        Union[pd.DataFrame, Iterator[pd.DataFrame]]: The customers.
+    """
+    if statement is None:
+        statement = select_customer_info()
+    if chunksize is None:
+        rows = connection.execute(statement).all()
+        return _customer_frame(rows, statement, index_col)
+
+    def chunks() -> Iterator[pd.DataFrame]:
+        result = connection.execution_options(yield_per=chunksize).execute(statement)
+        for rows in result.partitions():
+            yield _customer_frame(rows, statement, index_col)
+
+    return chunks()
@@ -0,0 +1,25 @@
+import argparse
+import time
+
+from database.bulk import rebuild_customer_features
+from database.engine import create_database_engine
+
+
+def main(database_url: str = "sqlite:///customers.db"):
+    engine = create_database_engine(database_url)
+
+    start = time.perf_counter()
+    with engine.connect() as connection:
+        n_customers = rebuild_customer_features(connection)
+        connection.commit()
+    elapsed = time.perf_counter() - start
+    print(f"Rebuilt the features of {n_customers} customers in {elapsed:.1f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument("--database-url", default="sqlite:///customers.db")
+
+    args = parser.parse_args()
+    main(database_url=args.database_url)
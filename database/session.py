@@ -0,0 +1,83 @@
+import time
+from typing import AsyncIterator, Callable, Optional
+
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from database.engine import apply_sqlite_pragmas
+
+# Async drivers used for the synchronous database URLs
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+}
+
+
+def get_async_database_url(database_url: str) -> str:
+    """
+    Get the URL of a database for an async driver.
+
+    Args:
+        database_url (str): The database URL, e.g. `sqlite:////data/customers.db`.
+
+    Returns:
+        str: The same database with an async driver, e.g.
+            `sqlite+aiosqlite:////data/customers.db`.
+
+    Raises:
+        ValueError: If no async driver is known for the database.
+    """
+    url = make_url(database_url)
+    if url.get_dialect().is_async:
+        return database_url
+    drivername = ASYNC_DRIVERS.get(url.get_backend_name())
+    if drivername is None:
+        raise ValueError(f"No async driver known for database {database_url}")
+    return url.set(drivername=drivername).render_as_string(hide_password=False)
+
+
+def create_async_session_factory(
+    database_url: str,
+) -> async_sessionmaker[AsyncSession]:
+    """
+    Create an async session factory bound to a new async engine, with the
+    SQLite pragmas applied on connect.
+
+    Args:
+        database_url (str): The database URL, with a sync or an async driver.
+
+    Returns:
+        async_sessionmaker[AsyncSession]: The session factory.
+    """
+    engine = create_async_engine(get_async_database_url(database_url))
+    apply_sqlite_pragmas(engine.sync_engine)
+    # Objects stay usable after commit without an implicit (blocking) refresh
+    return async_sessionmaker(engine, expire_on_commit=False)
+
+
+def session_dependency(
+    session_factory: async_sessionmaker[AsyncSession],
+    observer: Optional[Callable[[float], None]] = None,
+) -> Callable[[], AsyncIterator[AsyncSession]]:
+    """
+    Create a FastAPI dependency handing out one session per request.
+
+    Args:
+        session_factory (async_sessionmaker[AsyncSession]): The session factory.
+        observer (Callable[[float], None], optional): Called with the duration
+            in seconds of each session, from its creation to its close.
+
+    Returns:
+        Callable[[], AsyncIterator[AsyncSession]]: The dependency.
+    """
+
+    async def get_session() -> AsyncIterator[AsyncSession]:
+        start = time.perf_counter()
+        try:
+            async with session_factory() as session:
+                yield session
+        finally:
+            if observer is not None:
+                observer(time.perf_counter() - start)
+
+    return get_session
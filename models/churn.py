@@ -1,12 +1,17 @@
 import pickle
+import warnings
 from pathlib import Path
-from typing import Optional
+from typing import Any, Callable, List, Mapping, Optional, Sequence
 
+import numpy as np
 import pandas as pd
 from sklearn.base import BaseEstimator
 from sklearn.pipeline import Pipeline
 
+from models.compiled import CompiledPreprocessor, compile_preprocessors
+from models.forest import load_forest
 from utils.logger import setup_logger
+from utils.profiling import profiled
 
 log = setup_logger("churn_logger")
 
@@ -15,6 +20,7 @@ class ChurnModel:
     def __init__(self, preprocessors: Pipeline, model: Optional[BaseEstimator] = None):
         self._preprocessors = preprocessors
         self._model = model
+        self._compiled_preprocessors: Optional[CompiledPreprocessor] = None
 
     @property
     def model(self):
@@ -25,7 +31,11 @@ class ChurnModel:
         self._model = new_model
 
     def deserialize(self, model_path: Path):
-        # load prediction model
+        # load prediction model, a directory being a forest exported by
+        # save_forest, memory-mapped instead of copied into the process
+        if model_path.is_dir():
+            self.model = load_forest(model_path)
+            return
         with open(model_path, "rb") as f:
             self.model = pickle.load(f)
 
@@ -36,10 +46,12 @@ class ChurnModel:
     def _preprocess(self, X: pd.DataFrame) -> pd.DataFrame:
         return self._preprocessors.transform(X)
 
+    @profiled
     def fit(self, X: pd.DataFrame, y: pd.DataFrame) -> BaseEstimator:
         self.model.fit(X, y)
         return self.model
 
+    @profiled
     def train(
         self, X: pd.DataFrame, y: pd.DataFrame, preprocess_features: bool = True
     ) -> "ChurnModel":
@@ -49,6 +61,7 @@ class ChurnModel:
         self.fit(X, y)
         return self
 
+    @profiled
     def predict(
         self, X: pd.DataFrame, preprocess_features: bool = True
     ) -> pd.DataFrame:
@@ -56,3 +69,51 @@ class ChurnModel:
         if preprocess_features:
             X = self._preprocess(X)
         return self.model.predict(X)
+
+    def compile(self, input_columns: List[str]) -> CompiledPreprocessor:
+        """Compile the fitted preprocessors into a pandas-free numpy path."""
+        compiled = compile_preprocessors(self._preprocessors, input_columns)
+        feature_names = getattr(self.model, "feature_names_in_", None)
+        if feature_names is not None and list(feature_names) != compiled.columns:
+            raise ValueError(
+                "The compiled preprocessors don't output the features the model "
+                "was trained with, check the order of the input columns"
+            )
+        self._compiled_preprocessors = compiled
+        return compiled
+
+    @property
+    def compiled_preprocessors(self) -> Optional[CompiledPreprocessor]:
+        return self._compiled_preprocessors
+
+    @profiled
+    def encode_records(
+        self,
+        records: Sequence[Mapping[str, Any]],
+        out: Optional[np.ndarray] = None,
+        observer: Optional[Callable[[str, float], None]] = None,
+    ) -> np.ndarray:
+        # Encode raw records through the compiled preprocessors, the observer
+        # is called with the duration of each stage
+        if self._compiled_preprocessors is None:
+            raise RuntimeError("Preprocessors must be compiled before encoding records")
+        return self._compiled_preprocessors.transform(
+            records, out=out, observer=observer
+        )
+
+    @profiled
+    def predict_encoded(self, X: np.ndarray) -> np.ndarray:
+        # Make predictions from a feature matrix returned by encode_records
+        with warnings.catch_warnings():
+            # The feature matrix has the training layout but no column names
+            warnings.filterwarnings(
+                "ignore", message="X does not have valid feature names"
+            )
+            return self.predict(X, preprocess_features=False)
+
+    @profiled
+    def predict_records(
+        self, records: Sequence[Mapping[str, Any]], out: Optional[np.ndarray] = None
+    ) -> np.ndarray:
+        # Make predictions from raw records through the compiled preprocessors
+        return self.predict_encoded(self.encode_records(records, out=out))
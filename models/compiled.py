@@ -0,0 +1,444 @@
+import math
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, List, Mapping, Optional, Sequence
+
+import numpy as np
+from sklearn.impute import SimpleImputer
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import OneHotEncoder, StandardScaler
+
+from models.features import (
+    FeaturePreprocessor,
+    MultiColumnLabelEncoder,
+    RatioComputer,
+    TenureBinarizer,
+)
+
+
+class CompiledStep(ABC):
+    """
+    Base class of a compiled preprocessing step.
+
+    A compiled step reads and writes numpy columns stored in a dictionary keyed
+    by column name, and updates the column layout the same way the pandas
+    step would.
+
+    Args:
+        name (str): Name of the step in the pipeline.
+
+    """
+
+    numeric_inputs: List[str] = []
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def update_columns(self, columns: List[str]) -> List[str]:
+        """
+        Get the column layout after the step.
+
+        Args:
+            columns (List[str]): The column layout before the step.
+
+        Returns:
+            List[str]: The column layout after the step.
+        """
+        return columns
+
+    @abstractmethod
+    def apply(self, data: Dict[str, np.ndarray]):
+        """
+        Transform the columns in place.
+
+        Args:
+            data (Dict[str, np.ndarray]): Columns of the batch, keyed by name.
+        """
+
+
+def _set_columns(columns: List[str], output_variables: List[str]) -> List[str]:
+    # Same layout as `data[output_variables] = ...`: existing columns are
+    # overwritten in place and new ones are appended
+    return columns + [var for var in output_variables if var not in columns]
+
+
+class CompiledTenureBinarizer(CompiledStep):
+    def __init__(
+        self, name: str, binarizer: TenureBinarizer, output_variables: List[str]
+    ):
+        super().__init__(name)
+        self._edges = np.asarray(binarizer._bins, dtype=np.float64)
+        self._labels = np.asarray(list(binarizer._labels) + [np.nan], dtype=object)
+        self._output_variables = output_variables
+        self._output_variable = output_variables[-1]
+        self.numeric_inputs = ["tenure"]
+
+    def update_columns(self, columns: List[str]) -> List[str]:
+        return _set_columns(columns, self._output_variables)
+
+    def apply(self, data: Dict[str, np.ndarray]):
+        # Right-closed bins, as `pd.cut`: values outside the edges are NaN
+        tenure = data["tenure"]
+        codes = np.searchsorted(self._edges, tenure, side="left") - 1
+        invalid = (codes < 0) | (codes >= len(self._edges) - 1) | np.isnan(tenure)
+        codes[invalid] = len(self._labels) - 1
+        data[self._output_variable] = self._labels[codes]
+
+
+class CompiledRatioComputer(CompiledStep):
+    def __init__(self, name: str, ratio_computer: RatioComputer):
+        super().__init__(name)
+        self._numerator = ratio_computer._numerator
+        self._denominator = ratio_computer._denominator
+        self._ratio_name = ratio_computer._ratio_name
+        self.numeric_inputs = [self._numerator, self._denominator]
+
+    def update_columns(self, columns: List[str]) -> List[str]:
+        return _set_columns(
+            columns, [self._numerator, self._denominator, self._ratio_name]
+        )
+
+    def apply(self, data: Dict[str, np.ndarray]):
+        with np.errstate(divide="ignore", invalid="ignore"):
+            data[self._ratio_name] = data[self._numerator] / data[self._denominator]
+
+
+class CompiledScaler(CompiledStep):
+    def __init__(self, name: str, scaler: StandardScaler, variables: List[str]):
+        super().__init__(name)
+        self._variables = variables
+        n_features = len(variables)
+        self._mean = scaler.mean_ if scaler.with_mean else np.zeros(n_features)
+        self._scale = scaler.scale_ if scaler.with_std else np.ones(n_features)
+        self._with_mean = scaler.with_mean
+        self._with_std = scaler.with_std
+        self.numeric_inputs = list(variables)
+
+    def update_columns(self, columns: List[str]) -> List[str]:
+        return _set_columns(columns, self._variables)
+
+    def apply(self, data: Dict[str, np.ndarray]):
+        for var, mean, scale in zip(self._variables, self._mean, self._scale):
+            values = data[var]
+            if np.isinf(values).any():
+                # Same message as sklearn's input validation
+                raise ValueError(
+                    "Input X contains infinity or a value too large for "
+                    "dtype('float64')."
+                )
+            if self._with_mean:
+                values = values - mean
+            if self._with_std:
+                values = values / scale
+            data[var] = values
+
+
+class CompiledImputer(CompiledStep):
+    def __init__(self, name: str, imputer: SimpleImputer, variables: List[str]):
+        super().__init__(name)
+        if not (
+            isinstance(imputer.missing_values, float)
+            and math.isnan(imputer.missing_values)
+        ):
+            raise TypeError("Only NaN missing values can be compiled")
+        self._variables = variables
+        self._statistics = imputer.statistics_
+        self.numeric_inputs = list(variables)
+
+    def update_columns(self, columns: List[str]) -> List[str]:
+        return _set_columns(columns, self._variables)
+
+    def apply(self, data: Dict[str, np.ndarray]):
+        for var, statistic in zip(self._variables, self._statistics):
+            values = data[var]
+            missing = np.isnan(values)
+            if missing.any():
+                values = values.copy()
+                values[missing] = statistic
+                data[var] = values
+
+
+def _lookup_table(categories: Sequence) -> Dict[Any, int]:
+    return {
+        category: i for i, category in enumerate(categories) if category == category
+    }
+
+
+def _nan_code(categories: Sequence) -> Optional[int]:
+    for i, category in enumerate(categories):
+        if category != category:
+            return i
+    return None
+
+
+class CompiledLabelEncoder(CompiledStep):
+    def __init__(self, name: str, label_encoder: MultiColumnLabelEncoder):
+        super().__init__(name)
+        self._variables = list(label_encoder._encoded_variables)
+        self._tables = {
+            var: _lookup_table(label_encoder._model[var].classes_)
+            for var in self._variables
+        }
+        self._nan_codes = {
+            var: _nan_code(label_encoder._model[var].classes_)
+            for var in self._variables
+        }
+
+    def apply(self, data: Dict[str, np.ndarray]):
+        for var in self._variables:
+            data[var] = self._encode(var, data[var])
+
+    def _encode(self, var: str, values: np.ndarray) -> np.ndarray:
+        table = self._tables[var]
+        codes = np.empty(len(values), dtype=np.float64)
+        for i, value in enumerate(values):
+            code = table.get(value)
+            if code is None:
+                if value != value and self._nan_codes[var] is not None:
+                    code = self._nan_codes[var]
+                else:
+                    # Same message as sklearn's LabelEncoder
+                    raise ValueError(
+                        f"y contains previously unseen labels: {str(KeyError(value))}"
+                    )
+            codes[i] = code
+        return codes
+
+
+class CompiledOneHotEncoder(CompiledStep):
+    def __init__(
+        self,
+        name: str,
+        encoder: OneHotEncoder,
+        variables: List[str],
+        feature_names: List[str],
+    ):
+        super().__init__(name)
+        if getattr(encoder, "infrequent_categories_", None) is not None and any(
+            categories is not None for categories in encoder.infrequent_categories_
+        ):
+            raise TypeError(
+                "One-hot encoders with infrequent categories can't be compiled"
+            )
+        if encoder.handle_unknown != "error":
+            raise TypeError(
+                "Only one-hot encoders raising on unknown categories can be compiled"
+            )
+        self._variables = variables
+        self._feature_names = feature_names
+        self._tables = [_lookup_table(categories) for categories in encoder.categories_]
+        self._nan_codes = [_nan_code(categories) for categories in encoder.categories_]
+        # Offset of the first output column of each variable, and output column
+        # of each category code (-1 for the dropped category)
+        self._offsets = []
+        self._columns = []
+        offset = 0
+        for i, categories in enumerate(encoder.categories_):
+            drop_idx = None if encoder.drop_idx_ is None else encoder.drop_idx_[i]
+            column = np.full(len(categories), -1, dtype=np.int64)
+            kept = [j for j in range(len(categories)) if j != drop_idx]
+            column[kept] = np.arange(len(kept))
+            self._offsets.append(offset)
+            self._columns.append(column)
+            offset += len(kept)
+        if offset != len(feature_names):
+            raise TypeError("Unexpected number of one-hot encoded features")
+
+    def update_columns(self, columns: List[str]) -> List[str]:
+        return [col for col in columns if col not in self._variables] + list(
+            self._feature_names
+        )
+
+    def apply(self, data: Dict[str, np.ndarray]):
+        n_samples = len(data[self._variables[0]])
+        encoded = np.zeros((len(self._feature_names), n_samples), dtype=np.float64)
+        rows = np.arange(n_samples)
+        for i, var in enumerate(self._variables):
+            codes = self._encode(i, data.pop(var))
+            columns = self._columns[i][codes]
+            kept = columns >= 0
+            encoded[self._offsets[i] + columns[kept], rows[kept]] = 1.0
+        for feature_name, values in zip(self._feature_names, encoded):
+            data[feature_name] = values
+
+    def _encode(self, i: int, values: np.ndarray) -> np.ndarray:
+        table = self._tables[i]
+        codes = np.empty(len(values), dtype=np.int64)
+        unknown = []
+        for j, value in enumerate(values):
+            code = table.get(value)
+            if code is None and value != value:
+                code = self._nan_codes[i]
+            if code is None:
+                if value not in unknown:
+                    unknown.append(value)
+                continue
+            codes[j] = code
+        if unknown:
+            # Same message as sklearn's OneHotEncoder
+            raise ValueError(
+                f"Found unknown categories {unknown} in column {i}" " during transform"
+            )
+        return codes
+
+
+class CompiledPreprocessor:
+    """
+    CompiledPreprocessor is a pandas-free version of a fitted preprocessing
+    pipeline.
+
+    The column layout of the pipeline output and the lookup tables of every
+    step (category codes, one-hot offsets, scaler mean and scale, tenure bin
+    edges) are computed once, so that transforming a batch of records only
+    requires a few numpy operations before writing into a float array. The
+    output is identical to `pipeline.transform(X).to_numpy(dtype=np.float64)`.
+
+    Args:
+        steps (List[CompiledStep]): The compiled steps, in pipeline order.
+        input_columns (List[str]): The columns of the records to transform.
+
+    Attributes:
+        columns (List[str]): The column layout of the output array.
+
+    """
+
+    def __init__(self, steps: List[CompiledStep], input_columns: List[str]):
+        self._steps = steps
+        self._input_columns = list(input_columns)
+        self._numeric_inputs = set()
+        columns = list(input_columns)
+        for step in steps:
+            self._numeric_inputs.update(
+                var for var in step.numeric_inputs if var in self._input_columns
+            )
+            columns = step.update_columns(columns)
+        self.columns = columns
+
+    @property
+    def steps(self) -> List[CompiledStep]:
+        return self._steps
+
+    @property
+    def input_columns(self) -> List[str]:
+        return self._input_columns
+
+    def transform(
+        self,
+        records: Sequence[Mapping[str, Any]],
+        out: Optional[np.ndarray] = None,
+        observer: Optional[Callable[[str, float], None]] = None,
+    ) -> np.ndarray:
+        """
+        Transform records into the feature matrix expected by the model.
+
+        Args:
+            records (Sequence[Mapping[str, Any]]): The records to transform, with
+                at least the input columns as keys.
+            out (np.ndarray, optional): Preallocated float64 array of shape
+                (len(records), len(columns)) to write the features into.
+            observer (Callable[[str, float], None], optional): Called with the
+                name and the duration in seconds of each stage: `input_columns`,
+                every step of the pipeline by name, and `output`.
+
+        Returns:
+            np.ndarray: The feature matrix.
+        """
+        start = time.perf_counter() if observer is not None else 0.0
+
+        def lap(stage: str):
+            nonlocal start
+            now = time.perf_counter()
+            observer(stage, now - start)
+            start = now
+
+        n_samples = len(records)
+        if out is None:
+            out = np.empty((n_samples, len(self.columns)), dtype=np.float64)
+        elif out.shape != (n_samples, len(self.columns)):
+            raise ValueError(
+                f"Expected an output array of shape {(n_samples, len(self.columns))}"
+                f", got {out.shape}"
+            )
+
+        data = {}
+        for col in self._input_columns:
+            if col in self._numeric_inputs:
+                data[col] = np.fromiter(
+                    (record[col] for record in records), np.float64, n_samples
+                )
+            else:
+                values = np.empty(n_samples, dtype=object)
+                values[:] = [record[col] for record in records]
+                data[col] = values
+        if observer is not None:
+            lap("input_columns")
+
+        for step in self._steps:
+            step.apply(data)
+            if observer is not None:
+                lap(step.name)
+
+        for i, col in enumerate(self.columns):
+            out[:, i] = data[col]
+        if observer is not None:
+            lap("output")
+        return out
+
+
+def compile_step(name: str, step) -> CompiledStep:
+    """
+    Compile a fitted preprocessing step.
+
+    Args:
+        name (str): Name of the step in the pipeline.
+        step: The fitted step.
+
+    Returns:
+        CompiledStep: The compiled step.
+
+    Raises:
+        TypeError: If the step can't be compiled.
+    """
+    if isinstance(step, MultiColumnLabelEncoder):
+        return CompiledLabelEncoder(name, step)
+    if not isinstance(step, FeaturePreprocessor):
+        raise TypeError(f"Can't compile step {name} of type {type(step).__name__}")
+
+    model = step.model
+    if isinstance(model, TenureBinarizer):
+        return CompiledTenureBinarizer(name, model, step._output_variables)
+    if isinstance(model, RatioComputer):
+        return CompiledRatioComputer(name, model)
+    if isinstance(model, StandardScaler):
+        return CompiledScaler(name, model, step._encoded_variables)
+    if isinstance(model, SimpleImputer):
+        return CompiledImputer(name, model, step._encoded_variables)
+    if isinstance(model, OneHotEncoder):
+        return CompiledOneHotEncoder(
+            name,
+            model,
+            step._encoded_variables,
+            step.get_feature_names(step._encoded_variables),
+        )
+    raise TypeError(f"Can't compile step {name} of type {type(model).__name__}")
+
+
+def compile_preprocessors(
+    preprocessors: Pipeline, input_columns: List[str]
+) -> CompiledPreprocessor:
+    """
+    Compile a fitted preprocessing pipeline.
+
+    Args:
+        preprocessors (Pipeline): The fitted preprocessing pipeline.
+        input_columns (List[str]): The columns of the records to transform, in
+            the order of the DataFrame the pipeline would be applied to.
+
+    Returns:
+        CompiledPreprocessor: The compiled pipeline.
+
+    Raises:
+        TypeError: If a step of the pipeline can't be compiled.
+    """
+    steps = [compile_step(name, step) for name, step in preprocessors.steps]
+    return CompiledPreprocessor(steps, input_columns)
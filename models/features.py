@@ -1,10 +1,12 @@
 import pickle
 from pathlib import Path
-from typing import List, Optional
+from typing import Dict, List, Optional
 
 import pandas as pd
 from sklearn.preprocessing import LabelEncoder
 
+from utils.profiling import profiled
+
 
 class FeaturePreprocessor:
     """
@@ -59,6 +61,7 @@ class FeaturePreprocessor:
         """
         return self._model
 
+    @profiled
     def fit(
         self, X: pd.DataFrame, y: Optional[pd.DataFrame] = None
     ) -> "FeaturePreprocessor":
@@ -74,6 +77,7 @@ class FeaturePreprocessor:
         """
         self._model.fit(X[self._encoded_variables])
 
+    @profiled
     def transform(
         self, X: pd.DataFrame, y: Optional[pd.DataFrame] = None
     ) -> pd.DataFrame:
@@ -172,6 +176,14 @@ class MultiColumnLabelEncoder:
         self._encoded_variables = encoded_variables
         self._model = {var: LabelEncoder() for var in encoded_variables}
 
+    @property
+    def model(self) -> Dict[str, LabelEncoder]:
+        """
+        The label encoders, by encoded variable.
+        """
+        return self._model
+
+    @profiled
     def fit(
         self, X: pd.DataFrame, y: Optional[pd.DataFrame] = None
     ) -> "MultiColumnLabelEncoder":
@@ -187,6 +199,7 @@ class MultiColumnLabelEncoder:
         for var in self._encoded_variables:
             self._model[var].fit(X[var])
 
+    @profiled
     def transform(
         self, X: pd.DataFrame, y: Optional[pd.DataFrame] = None
     ) -> pd.DataFrame:
@@ -269,6 +282,7 @@ class TenureBinarizer:
         self._bins = bins
         self._labels = labels
 
+    @profiled
     def fit(
         self, X: pd.DataFrame, y: Optional[pd.DataFrame] = None
     ) -> "TenureBinarizer":
@@ -283,6 +297,7 @@ class TenureBinarizer:
         """
         return self
 
+    @profiled
     def transform(
         self, X: pd.DataFrame, y: Optional[pd.DataFrame] = None
     ) -> pd.DataFrame:
@@ -336,6 +351,7 @@ class RatioComputer:
         self._denominator = denominator
         self._ratio_name = ratio_name
 
+    @profiled
     def fit(self, X: pd.DataFrame, y: Optional[pd.DataFrame] = None) -> "RatioComputer":
         """
         Fit the RatioComputer.
@@ -348,6 +364,7 @@ class RatioComputer:
         """
         return self
 
+    @profiled
     def transform(
         self, X: pd.DataFrame, y: Optional[pd.DataFrame] = None
     ) -> pd.DataFrame:
@@ -0,0 +1,196 @@
+import json
+from pathlib import Path
+from typing import Union
+
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestClassifier
+
+META_FILE = "meta.json"
+ARRAY_FILES = ["left", "right", "feature", "threshold", "value"]
+
+
+class MappedForest:
+    """
+    MappedForest evaluates a random forest classifier from node tables that are
+    memory-mapped read-only.
+
+    The nodes of all the trees are stored in flat arrays, so the operating
+    system shares the pages of the tables between every process that maps
+    them, and loading a forest doesn't read it. The predictions are the same as
+    the ones of the `RandomForestClassifier` the tables were exported from.
+
+    Args:
+        forest_dir (Path): The directory written by `save_forest`.
+
+    Attributes:
+        classes_ (np.ndarray): The class labels.
+        n_features_in_ (int): The number of features.
+        feature_names_in_ (np.ndarray): The names of the features, if the forest
+            was fitted on a DataFrame.
+
+    """
+
+    def __init__(self, forest_dir: Path):
+        with open(forest_dir.joinpath(META_FILE), "r") as f:
+            meta = json.load(f)
+        self.classes_ = np.array(meta["classes"])
+        self.n_features_in_ = meta["n_features"]
+        if meta["feature_names"] is not None:
+            self.feature_names_in_ = np.array(meta["feature_names"], dtype=object)
+        self._roots = np.array(meta["roots"], dtype=np.int64)
+        self._max_depth = meta["max_depth"]
+        (
+            self._left,
+            self._right,
+            self._feature,
+            self._threshold,
+            self._value,
+        ) = (
+            np.load(forest_dir.joinpath(f"{name}.npy"), mmap_mode="r")
+            for name in ARRAY_FILES
+        )
+
+    @property
+    def n_estimators(self) -> int:
+        return len(self._roots)
+
+    def apply(self, X: Union[np.ndarray, pd.DataFrame]) -> np.ndarray:
+        """
+        Find the leaf of every tree each sample falls in.
+
+        Args:
+            X (Union[np.ndarray, pd.DataFrame]): The features.
+
+        Returns:
+            np.ndarray: The indices of the leaves in the node tables, of shape
+                (n_samples, n_estimators).
+        """
+        # Like scikit-learn, compare the features as float32 to the thresholds
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim != 2 or X.shape[1] != self.n_features_in_:
+            raise ValueError(
+                f"X has {X.shape[-1]} features, but MappedForest is expecting "
+                f"{self.n_features_in_} features as input."
+            )
+        # A NaN would silently take the right branch, scikit-learn rejects it.
+        # Checked after the cast, as values too large for float32 become inf.
+        if not np.isfinite(X).all():
+            raise ValueError("Input X contains NaN or infinity.")
+        rows = np.arange(X.shape[0])[:, np.newaxis]
+        nodes = np.broadcast_to(self._roots, (X.shape[0], self.n_estimators))
+        # All the trees are walked one level at a time. The leaves point to
+        # themselves, so a sample stays in its leaf once it has reached it.
+        for _ in range(self._max_depth):
+            go_left = X[rows, self._feature[nodes]] <= self._threshold[nodes]
+            nodes = np.where(go_left, self._left[nodes], self._right[nodes])
+        return nodes
+
+    def predict_proba(self, X: Union[np.ndarray, pd.DataFrame]) -> np.ndarray:
+        """
+        Predict the class probabilities, the mean of the trees' probabilities.
+
+        Args:
+            X (Union[np.ndarray, pd.DataFrame]): The features.
+
+        Returns:
+            np.ndarray: The probabilities, of shape (n_samples, n_classes).
+        """
+        # Sum the trees in order, as scikit-learn does, to get the same
+        # floating-point probabilities
+        proba = np.cumsum(self._value[self.apply(X)], axis=1)[:, -1]
+        proba /= self.n_estimators
+        return proba
+
+    def predict(self, X: Union[np.ndarray, pd.DataFrame]) -> np.ndarray:
+        """
+        Predict the classes.
+
+        Args:
+            X (Union[np.ndarray, pd.DataFrame]): The features.
+
+        Returns:
+            np.ndarray: The classes, of shape (n_samples,).
+        """
+        return self.classes_.take(np.argmax(self.predict_proba(X), axis=1))
+
+
+def save_forest(model: RandomForestClassifier, forest_dir: Path):
+    """
+    Export the node tables of a fitted random forest, to load it as a
+    `MappedForest`.
+
+    Args:
+        model (RandomForestClassifier): The fitted single-output forest.
+        forest_dir (Path): The directory of the node tables.
+    """
+    if model.n_outputs_ != 1:
+        raise ValueError("Only single-output forests can be exported")
+
+    offset = 0
+    roots = []
+    tables = {name: [] for name in ARRAY_FILES}
+    for estimator in model.estimators_:
+        tree = estimator.tree_
+        nodes = np.arange(tree.node_count)
+        is_leaf = tree.children_left == -1
+        roots.append(offset)
+        # Leaves point to themselves and always go "left"
+        tables["left"].append(np.where(is_leaf, nodes, tree.children_left) + offset)
+        tables["right"].append(np.where(is_leaf, nodes, tree.children_right) + offset)
+        tables["feature"].append(np.where(is_leaf, 0, tree.feature))
+        tables["threshold"].append(np.where(is_leaf, np.inf, tree.threshold))
+        # Class probabilities of the nodes, normalized as in
+        # DecisionTreeClassifier.predict_proba
+        value = tree.value[:, 0, :].copy()
+        normalizer = value.sum(axis=1)[:, np.newaxis]
+        normalizer[normalizer == 0.0] = 1.0
+        value /= normalizer
+        tables["value"].append(value)
+        offset += tree.node_count
+
+    forest_dir.mkdir(parents=True, exist_ok=True)
+    meta_path = forest_dir.joinpath(META_FILE)
+    # The metadata is written last, an interrupted save leaves no valid forest
+    meta_path.unlink(missing_ok=True)
+    dtypes = {
+        "left": np.int64,
+        "right": np.int64,
+        "feature": np.int64,
+        "threshold": np.float64,
+        "value": np.float64,
+    }
+    for name, arrays in tables.items():
+        np.save(
+            forest_dir.joinpath(f"{name}.npy"),
+            np.ascontiguousarray(np.concatenate(arrays), dtype=dtypes[name]),
+        )
+    feature_names = getattr(model, "feature_names_in_", None)
+    with open(meta_path, "w") as f:
+        json.dump(
+            {
+                "classes": model.classes_.tolist(),
+                "n_features": int(model.n_features_in_),
+                "feature_names": None
+                if feature_names is None
+                else [str(name) for name in feature_names],
+                "roots": roots,
+                "max_depth": max(
+                    estimator.tree_.max_depth for estimator in model.estimators_
+                ),
+            },
+            f,
+        )
+
+
+def load_forest(forest_dir: Path) -> MappedForest:
+    """
+    Load a forest exported by `save_forest`, memory-mapped read-only.
+
+    Args:
+        forest_dir (Path): The directory of the node tables.
+
+    Returns:
+        MappedForest: The forest.
+    """
+    return MappedForest(forest_dir)
@@ -0,0 +1,270 @@
+import os
+import shutil
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import numpy as np
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import OneHotEncoder, StandardScaler
+
+from models.churn import ChurnModel
+from models.features import (
+    FeaturePreprocessor,
+    MultiColumnLabelEncoder,
+    RatioComputer,
+    TenureBinarizer,
+)
+from models.forest import META_FILE as FOREST_META_FILE
+from utils.fingerprint import fingerprint_files
+
+# Raw features of a customer, in the order the model was trained with
+FEATURE_COLUMNS = [
+    "gender",
+    "seniorCitizen",
+    "partner",
+    "dependents",
+    "tenure",
+    "hasPhoneService",
+    "multipleLines",
+    "internetServiceType",
+    "onlineSecurity",
+    "onlineBackup",
+    "deviceProtection",
+    "techSupport",
+    "streamingTV",
+    "streamingMovies",
+    "contractType",
+    "paperlessBilling",
+    "paymentMethod",
+    "monthlyCharges",
+    "totalCharges",
+]
+
+# Define the columns to be encoded
+label_encoded_variables = [
+    "gender",
+    "seniorCitizen",
+    "partner",
+    "dependents",
+    "hasPhoneService",
+    "paperlessBilling",
+    "contractType",
+    "paymentMethod",
+    "TenureGroup",
+]
+onehot_encoded_variables = [
+    "multipleLines",
+    "internetServiceType",
+    "onlineSecurity",
+    "onlineBackup",
+    "deviceProtection",
+    "techSupport",
+    "streamingTV",
+    "streamingMovies",
+]
+standard_scaler_variables = [
+    "tenure",
+    "monthlyCharges",
+    "totalCharges",
+    "MonthlyTotalChargesRatio",
+]
+
+# Human-readable labels of the model predictions
+PREDICTION_LABELS = {0: "No Churn", 1: "Churn"}
+
+# File of a releases directory naming the release to serve
+CURRENT_RELEASE_FILE = "current"
+
+bins = [0, 12, 24, 36, 48, 60, np.inf]
+labels = ["0-1 Year", "1-2 Years", "2-3 Years", "3-4 Years", "4-5 Years", "5+ Years"]
+
+
+def load_preprocessors(preprocessor_dir: Path) -> Pipeline:
+    """
+    Load the fitted preprocessing pipeline used in production.
+
+    Args:
+        preprocessor_dir (Path): The directory of the preprocessor artifacts.
+
+    Returns:
+        Pipeline: The fitted preprocessing pipeline.
+    """
+    tenure_binarizer = FeaturePreprocessor(
+        TenureBinarizer(bins=bins, labels=labels),
+        encoded_variables=["tenure"],
+        output_variables=["tenure", "TenureGroup"],
+    )
+    ratio_computer = FeaturePreprocessor(
+        RatioComputer("monthlyCharges", "totalCharges", "MonthlyTotalChargesRatio"),
+        encoded_variables=["monthlyCharges", "totalCharges"],
+        output_variables=["monthlyCharges", "totalCharges", "MonthlyTotalChargesRatio"],
+    )
+    scaler = FeaturePreprocessor(
+        model=StandardScaler(),
+        encoded_variables=standard_scaler_variables,
+        output_variables=standard_scaler_variables,
+    )
+    label_encoder = MultiColumnLabelEncoder(encoded_variables=label_encoded_variables)
+    onehot_encoder = FeaturePreprocessor(
+        model=OneHotEncoder(sparse=False, drop="first"),
+        encoded_variables=onehot_encoded_variables,
+        output_variables=onehot_encoded_variables,
+        transform_to_dataframe=True,
+    )
+    scaler.deserialize(preprocessor_dir.joinpath("standard_scaler.pkl"))
+    label_encoder.deserialize(preprocessor_dir.joinpath("label_encoder.pkl"))
+    onehot_encoder.deserialize(preprocessor_dir.joinpath("onehot_encoder.pkl"))
+
+    return Pipeline(
+        [
+            ("tenure_binarizer", tenure_binarizer),
+            ("ratio_computer", ratio_computer),
+            ("scaler", scaler),
+            ("label_encoder", label_encoder),
+            ("onehot_encoder", onehot_encoder),
+        ]
+    )
+
+
+def load_production_model(
+    preprocessor_dir: Path, models_dir: Path, input_columns: List[str] = FEATURE_COLUMNS
+) -> ChurnModel:
+    """
+    Load the production churn model, with its preprocessors compiled.
+
+    The memory-mapped export of the model is used when there is one.
+
+    Args:
+        preprocessor_dir (Path): The directory of the preprocessor artifacts.
+        models_dir (Path): The directory of the model artifacts.
+        input_columns (List[str]): The raw features of the records to score.
+
+    Returns:
+        ChurnModel: The production churn model.
+    """
+    churn_model = ChurnModel(preprocessors=load_preprocessors(preprocessor_dir))
+    churn_model.deserialize(production_model_path(models_dir))
+    churn_model.compile(input_columns)
+    return churn_model
+
+
+def production_model_path(models_dir: Path) -> Path:
+    """
+    Get the path of the production model artifact.
+
+    Args:
+        models_dir (Path): The directory of the model artifacts.
+
+    Returns:
+        Path: The memory-mapped export of the model if there is one, the pickle
+            otherwise.
+    """
+    forest_dir = models_dir.joinpath("churn_model_prod.forest")
+    if forest_dir.joinpath(FOREST_META_FILE).exists():
+        return forest_dir
+    return models_dir.joinpath("churn_model_prod.pkl")
+
+
+def production_model_version(preprocessor_dir: Path, models_dir: Path) -> str:
+    """
+    Get the version of the production artifacts.
+
+    The version changes whenever the model or one of the preprocessors does.
+
+    Args:
+        preprocessor_dir (Path): The directory of the preprocessor artifacts.
+        models_dir (Path): The directory of the model artifacts.
+
+    Returns:
+        str: The version.
+    """
+    model_path = production_model_path(models_dir)
+    model_files = sorted(model_path.iterdir()) if model_path.is_dir() else [model_path]
+    return fingerprint_files(sorted(preprocessor_dir.glob("*.pkl")) + model_files)
+
+
+def release_dirs(release_dir: Path) -> Tuple[Path, Path]:
+    """
+    Get the artifact directories of a release.
+
+    Args:
+        release_dir (Path): The directory of the release.
+
+    Returns:
+        Tuple[Path, Path]: The directories of the preprocessor and model
+            artifacts.
+    """
+    return release_dir.joinpath("preprocessors"), release_dir.joinpath("models")
+
+
+def publish_release(
+    preprocessor_dir: Path, models_dir: Path, releases_dir: Path
+) -> str:
+    """
+    Copy the production artifacts into a new release directory named after their
+    version.
+
+    The artifacts are copied into a temporary directory which is renamed once
+    complete, so a release directory is never partially written. Releases are
+    immutable: publishing the same artifacts again is a no-op.
+
+    Args:
+        preprocessor_dir (Path): The directory of the preprocessor artifacts.
+        models_dir (Path): The directory of the model artifacts.
+        releases_dir (Path): The directory of the releases.
+
+    Returns:
+        str: The version of the release.
+    """
+    version = production_model_version(preprocessor_dir, models_dir)
+    release_dir = releases_dir.joinpath(version)
+    if release_dir.exists():
+        return version
+
+    tmp_dir = releases_dir.joinpath(f".{version}.tmp")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    tmp_preprocessor_dir, tmp_models_dir = release_dirs(tmp_dir)
+    tmp_preprocessor_dir.mkdir(parents=True)
+    tmp_models_dir.mkdir()
+    for path in sorted(preprocessor_dir.glob("*.pkl")):
+        shutil.copy2(path, tmp_preprocessor_dir)
+    model_path = production_model_path(models_dir)
+    if model_path.is_dir():
+        shutil.copytree(model_path, tmp_models_dir.joinpath(model_path.name))
+    else:
+        shutil.copy2(model_path, tmp_models_dir)
+    os.rename(tmp_dir, release_dir)
+    return version
+
+
+def activate_release(releases_dir: Path, release: str):
+    """
+    Make a release the one to serve.
+
+    Args:
+        releases_dir (Path): The directory of the releases.
+        release (str): The name of the release.
+    """
+    if not releases_dir.joinpath(release).is_dir():
+        raise FileNotFoundError(f"Release {release} not found in {releases_dir}")
+    # Replace the file atomically, readers see either the old or the new release
+    tmp_path = releases_dir.joinpath(f".{CURRENT_RELEASE_FILE}.tmp")
+    tmp_path.write_text(release)
+    os.replace(tmp_path, releases_dir.joinpath(CURRENT_RELEASE_FILE))
+
+
+def current_release(releases_dir: Path) -> Optional[str]:
+    """
+    Get the release to serve.
+
+    Args:
+        releases_dir (Path): The directory of the releases.
+
+    Returns:
+        Optional[str]: The name of the release, or None if no release was
+            activated.
+    """
+    current_path = releases_dir.joinpath(CURRENT_RELEASE_FILE)
+    if not current_path.exists():
+        return None
+    return current_path.read_text().strip() or None
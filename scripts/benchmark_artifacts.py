@@ -0,0 +1,98 @@
+import argparse
+import multiprocessing
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+import numpy as np
+
+from models.churn import ChurnModel
+from models.forest import save_forest
+from utils.memory import memory_usage
+
+
+def _load_model(model_path: Path, n_features: int, barrier, results):
+    # Run in a fresh process: load the model, use it once so that the pages it
+    # needs are resident, then measure while all the processes are alive
+    try:
+        before = memory_usage()
+        start = time.perf_counter()
+        churn_model = ChurnModel(preprocessors=None)
+        churn_model.deserialize(model_path)
+        load_time = time.perf_counter() - start
+        churn_model.model.predict(np.zeros((256, n_features)))
+        barrier.wait()
+        after = memory_usage()
+        results.put(
+            {
+                "load_time": load_time,
+                "rss": after["rss"] - before["rss"],
+                "pss": after["pss"] - before["pss"],
+            }
+        )
+        barrier.wait()
+    except BaseException as e:
+        # Release the other processes waiting for this one
+        barrier.abort()
+        results.put({"error": repr(e)})
+
+
+def benchmark(model_path: Path, n_features: int, processes: int) -> Dict[str, Any]:
+    """
+    Measure the load time and memory of a model artifact in fresh processes.
+
+    Args:
+        model_path (Path): The pickle or the exported forest.
+        n_features (int): The number of features of the model.
+        processes (int): The number of processes loading the model at once.
+
+    Returns:
+        Dict[str, Any]: The mean load time, in seconds, and the mean memory
+            growth of a process, in bytes.
+    """
+    context = multiprocessing.get_context("spawn")
+    barrier = context.Barrier(processes)
+    results = context.Queue()
+    workers = [
+        context.Process(
+            target=_load_model, args=(model_path, n_features, barrier, results)
+        )
+        for _ in range(processes)
+    ]
+    for worker in workers:
+        worker.start()
+    measures: List[Dict[str, float]] = [results.get() for _ in workers]
+    for worker in workers:
+        worker.join()
+    errors = [m["error"] for m in measures if "error" in m]
+    if errors:
+        raise RuntimeError(f"Failed to load {model_path}: {errors[0]}")
+    return {key: np.mean([m[key] for m in measures]) for key in measures[0]}
+
+
+def main(models_dir: Path = Path("data/models"), processes: int = 4):
+    churn_model = ChurnModel(preprocessors=None)
+    churn_model.deserialize(models_dir.joinpath("churn_model_prod.pkl"))
+    n_features = churn_model.model.n_features_in_
+    forest_dir = models_dir.joinpath("churn_model_prod.forest")
+    if not forest_dir.exists():
+        save_forest(churn_model.model, forest_dir)
+
+    print(f"{processes} processes loading the model at once")
+    print(f"{'artifact':<30}{'load (ms)':>12}{'RSS (MB)':>12}{'PSS (MB)':>12}")
+    for name in ["churn_model_prod.pkl", "churn_model_prod.forest"]:
+        result = benchmark(models_dir.joinpath(name), n_features, processes)
+        print(
+            f"{name:<30}{result['load_time'] * 1e3:>12.1f}"
+            f"{result['rss'] / 2**20:>12.1f}{result['pss'] / 2**20:>12.1f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument("--models-dir", default="data/models")
+    parser.add_argument("--processes", type=int, default=4)
+
+    args = parser.parse_args()
+    main(models_dir=Path(args.models_dir), processes=args.processes)
@@ -4,23 +4,15 @@ import os
 from pathlib import Path
 
 import numpy as np
-import pandas as pd
 from dotenv import load_dotenv
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.impute import SimpleImputer
 from sklearn.metrics import accuracy_score, classification_report
 from sklearn.pipeline import Pipeline
 from sklearn.preprocessing import OneHotEncoder, StandardScaler
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-
-from database.models import (
-    Contract,
-    Customer,
-    CustomerChurn,
-    InternetService,
-    PhoneService,
-)
+
+from database.engine import create_database_engine
+from database.queries import load_customer_frame, select_customer_info
 from models.churn import ChurnModel
 from models.features import (
     FeaturePreprocessor,
@@ -28,6 +20,7 @@ from models.features import (
     RatioComputer,
     TenureBinarizer,
 )
+from utils.feature_cache import cache_fingerprint, load_features, save_features
 from utils.logger import setup_logger
 
 logger = setup_logger("train_model")
@@ -40,8 +33,7 @@ def main(
 ):
     database_url = os.getenv("DATABASE_URL", "sqlite:////data/customers.db")
     logger.info(f"Load database: {database_url}")
-    engine = create_engine(database_url)
-    Session = sessionmaker(bind=engine)
+    engine = create_database_engine(database_url)
 
     processed_data_dir = base_path.joinpath("processed")
     models_dir = base_path.joinpath("models")
@@ -51,46 +43,9 @@ def main(
     if not preprocessors_dir.exists():
         preprocessors_dir.mkdir(exist_ok=True)
 
-    with Session() as session:
-        # Use SQLAlchemy to fetch customer data by customer ID and join multiple tables
-        customers = (
-            session.query(
-                Customer.id,
-                Customer.gender,
-                Customer.seniorCitizen,
-                Customer.partner,
-                Customer.dependents,
-                Contract.tenure,
-                PhoneService.hasPhoneService,
-                PhoneService.multipleLines,
-                InternetService.internetServiceType,
-                InternetService.onlineSecurity,
-                InternetService.onlineBackup,
-                InternetService.deviceProtection,
-                InternetService.techSupport,
-                InternetService.streamingTV,
-                InternetService.streamingMovies,
-                Contract.contractType,
-                Contract.paperlessBilling,
-                Contract.paymentMethod,
-                Contract.monthlyCharges,
-                Contract.totalCharges,
-                CustomerChurn.churn,
-            )
-            .join(Contract, Contract.customer_id == Customer.id)
-            .join(PhoneService, PhoneService.contract_id == Contract.id)
-            .join(InternetService, InternetService.contract_id == Contract.id)
-            .join(CustomerChurn, CustomerChurn.customer_id == Customer.id, isouter=True)
-            .all()
-        )
-
-    data = pd.concat(
-        [
-            pd.DataFrame.from_dict(customer._mapping, orient="index").T
-            for customer in customers
-        ]
-    )
-    data.set_index("id", inplace=True)
+    with engine.connect() as connection:
+        # Fetch the customers' features and churn label, from the features table
+        data = load_customer_frame(connection)
 
     # Define the columns to be encoded
     binary_cols = [
@@ -179,15 +134,32 @@ def main(
         ]
     )
 
-    training_data_path = processed_data_dir.joinpath("telco_customer_churn.csv")
-    data_encoded = pd.read_csv(training_data_path, index_col=0)
     scaler.deserialize(preprocessors_dir.joinpath("standard_scaler.pkl"))
     label_encoder.deserialize(preprocessors_dir.joinpath(f"label_encoder.pkl"))
     onehot_encoder.deserialize(preprocessors_dir.joinpath(f"onehot_encoder.pkl"))
 
-    # Split the data into training and testing sets
-    X = data_encoded.drop("churn", axis=1)
-    y = data_encoded["churn"]
+    cache_dir = processed_data_dir.joinpath("telco_customer_churn")
+    fingerprint = cache_fingerprint(
+        str(select_customer_info()), data, sorted(preprocessors_dir.glob("*.pkl"))
+    )
+    cached = load_features(cache_dir, fingerprint)
+    if cached is None:
+        # The raw data changes as the predictions are stored, the features are
+        # rebuilt with the preprocessors fitted by the training, without
+        # refitting them
+        logger.info("Processed features are missing or stale, preprocess the data")
+        imputer.deserialize(preprocessors_dir.joinpath("imputer.pkl"))
+        # Rows of labels the encoder wasn't fitted on, as the stored
+        # predictions, can't be encoded
+        labelled = data["churn"].isin(label_encoder.model["churn"].classes_)
+        if not labelled.all():
+            logger.info(f"Skip {(~labelled).sum()} rows with unknown churn labels")
+        data_encoded = feature_pipeline.transform(data[labelled])
+        X = data_encoded.drop("churn", axis=1)
+        y = data_encoded["churn"]
+        save_features(cache_dir, X, y, fingerprint)
+    else:
+        X, y = cached
 
     churn_model = ChurnModel(
         preprocessors=feature_pipeline,
@@ -0,0 +1,114 @@
+import argparse
+import os
+import time
+from pathlib import Path
+from typing import Any, List, Mapping, Optional
+
+import numpy as np
+from dotenv import load_dotenv
+from sqlalchemy import insert
+
+from database.engine import create_database_engine
+from database.models import CustomerChurn
+from database.queries import select_customer_features
+from models.churn import ChurnModel
+from models.production import PREDICTION_LABELS, load_production_model
+from utils.logger import setup_logger
+
+logger = setup_logger("score_customers")
+
+load_dotenv()
+
+
+def predict_chunk(
+    churn_model: ChurnModel, records: List[Mapping[str, Any]]
+) -> List[Optional[str]]:
+    """Predict churn for a chunk of customers, None for the ones that can't be scored."""
+    valid = np.ones(len(records), dtype=bool)
+    try:
+        features = churn_model.encode_records(records)
+    except ValueError:
+        # A single invalid customer (e.g. an unseen label) fails the encoding of
+        # the whole chunk, encode the customers one by one to skip the invalid ones
+        features = np.zeros(
+            (len(records), len(churn_model.compiled_preprocessors.columns))
+        )
+        for i, record in enumerate(records):
+            try:
+                churn_model.encode_records([record], out=features[i : i + 1])
+            except ValueError as e:
+                logger.warning(f"Customer {record['id']} can't be scored: {e}")
+                valid[i] = False
+    # Customers with missing values (e.g. no total charges yet) can't be scored
+    missing = valid & ~np.isfinite(features).all(axis=1)
+    for i in np.flatnonzero(missing):
+        logger.warning(f"Customer {records[i]['id']} can't be scored: missing values")
+    valid &= ~missing
+
+    predictions: List[Optional[str]] = [None] * len(records)
+    if valid.any():
+        for i, prediction in zip(
+            np.flatnonzero(valid), churn_model.predict_encoded(features[valid])
+        ):
+            predictions[i] = PREDICTION_LABELS[prediction]
+    return predictions
+
+
+def main(
+    base_path: Path = Path("data"),
+    chunk_size: int = 10000,
+):
+    database_url = os.getenv("DATABASE_URL", "sqlite:////data/customers.db")
+    logger.info(f"Load database: {database_url}")
+    engine = create_database_engine(database_url)
+
+    churn_model = load_production_model(
+        base_path.joinpath("preprocessors"), base_path.joinpath("models")
+    )
+
+    n_rows = 0
+    n_scored = 0
+    start = time.perf_counter()
+    with engine.connect() as connection:
+        # Stream the customers chunk by chunk instead of loading the whole table,
+        # so that memory stays flat whatever the size of the table. The chunk's
+        # predictions are written with the same connection, as SQLite would not
+        # let another connection write while the query is running.
+        result = connection.execution_options(yield_per=chunk_size).execute(
+            select_customer_features()
+        )
+        for rows in result.partitions():
+            records = [row._mapping for row in rows]
+            predictions = predict_chunk(churn_model, records)
+            churns = [
+                {"customer_id": record["id"], "churn": prediction}
+                for record, prediction in zip(records, predictions)
+                if prediction is not None
+            ]
+            # One transaction and one multi-row insert per chunk
+            if churns:
+                connection.execute(insert(CustomerChurn), churns)
+            connection.commit()
+
+            n_rows += len(records)
+            n_scored += len(churns)
+            elapsed = time.perf_counter() - start
+            logger.info(
+                f"Scored {n_scored}/{n_rows} customers ({n_rows / elapsed:.0f} rows/s)"
+            )
+
+    elapsed = time.perf_counter() - start
+    print(
+        f"Scored {n_scored}/{n_rows} customers in {elapsed:.1f}s "
+        f"({n_rows / max(elapsed, 1e-9):.0f} rows/s)"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument("--base-path", default="data")
+    parser.add_argument("--chunk-size", type=int, default=10000)
+
+    args = parser.parse_args()
+    main(base_path=Path(args.base_path), chunk_size=args.chunk_size)
@@ -1,26 +1,24 @@
 import argparse
 import json
 import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
+from typing import Tuple
 
 import numpy as np
 import pandas as pd
 from dotenv import load_dotenv
+from sklearn.base import clone
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.impute import SimpleImputer
 from sklearn.model_selection import StratifiedKFold
 from sklearn.pipeline import Pipeline
 from sklearn.preprocessing import OneHotEncoder, StandardScaler
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-
-from database.models import (
-    Contract,
-    Customer,
-    CustomerChurn,
-    InternetService,
-    PhoneService,
-)
+from threadpoolctl import threadpool_limits
+
+from database.engine import create_database_engine
+from database.queries import load_customer_frame, select_customer_info
 from models.churn import ChurnModel
 from models.features import (
     FeaturePreprocessor,
@@ -28,23 +26,56 @@ from models.features import (
     RatioComputer,
     TenureBinarizer,
 )
+from models.forest import save_forest
+from models.production import publish_release
+from utils.feature_cache import cache_fingerprint, load_features, save_features
 from utils.logger import setup_logger
+from utils.profiling import Profiler
 
 logger = setup_logger("train_model")
 
 load_dotenv()
 
 
+def train_fold(
+    churn_model: ChurnModel,
+    X_train: pd.DataFrame,
+    y_train: pd.Series,
+    model_path: Path,
+    n_threads: int = 1,
+) -> Tuple[float, float]:
+    """
+    Train the model of a cross-validation fold and serialize it.
+
+    Args:
+        churn_model (ChurnModel): The churn model, its estimator is cloned.
+        X_train (pd.DataFrame): The preprocessed training features of the fold.
+        y_train (pd.Series): The training labels of the fold.
+        model_path (Path): The path of the serialized model.
+        n_threads (int): The number of threads of the estimator and of the
+            native thread pools (BLAS, OpenMP) of the process.
+
+    Returns:
+        Tuple[float, float]: The wall and CPU times of the training, in seconds.
+    """
+    start = time.perf_counter()
+    cpu_start = time.process_time()
+    with threadpool_limits(limits=n_threads):
+        churn_model.model = clone(churn_model.model).set_params(n_jobs=n_threads)
+        churn_model.train(X_train, y_train, preprocess_features=False)
+    churn_model.serialize(model_path)
+    return time.perf_counter() - start, time.process_time() - cpu_start
+
+
 def main(
     base_path: Path = Path("data"),
     to_production: bool = False,
-    overwrite_preprocessing: bool = False,
     n_splits: int = 5,
+    n_jobs: int = 1,
 ):
     database_url = os.getenv("DATABASE_URL", "sqlite:////data/customers.db")
     logger.info(f"Load database: {database_url}")
-    engine = create_engine(database_url)
-    Session = sessionmaker(bind=engine)
+    engine = create_database_engine(database_url)
 
     processed_data_dir = base_path.joinpath("processed")
     models_dir = base_path.joinpath("models")
@@ -54,46 +85,9 @@ def main(
     if not preprocessors_dir.exists():
         preprocessors_dir.mkdir(exist_ok=True)
 
-    with Session() as session:
-        # Use SQLAlchemy to fetch customer data by customer ID and join multiple tables
-        customers = (
-            session.query(
-                Customer.id,
-                Customer.gender,
-                Customer.seniorCitizen,
-                Customer.partner,
-                Customer.dependents,
-                Contract.tenure,
-                PhoneService.hasPhoneService,
-                PhoneService.multipleLines,
-                InternetService.internetServiceType,
-                InternetService.onlineSecurity,
-                InternetService.onlineBackup,
-                InternetService.deviceProtection,
-                InternetService.techSupport,
-                InternetService.streamingTV,
-                InternetService.streamingMovies,
-                Contract.contractType,
-                Contract.paperlessBilling,
-                Contract.paymentMethod,
-                Contract.monthlyCharges,
-                Contract.totalCharges,
-                CustomerChurn.churn,
-            )
-            .join(Contract, Contract.customer_id == Customer.id)
-            .join(PhoneService, PhoneService.contract_id == Contract.id)
-            .join(InternetService, InternetService.contract_id == Contract.id)
-            .join(CustomerChurn, CustomerChurn.customer_id == Customer.id, isouter=True)
-            .all()
-        )
-
-    data = pd.concat(
-        [
-            pd.DataFrame.from_dict(customer._mapping, orient="index").T
-            for customer in customers
-        ]
-    )
-    data.set_index("id", inplace=True)
+    with engine.connect() as connection:
+        # Fetch the customers' features and churn label, from the features table
+        data = load_customer_frame(connection)
 
     # Define the columns to be encoded
     binary_cols = [
@@ -182,23 +176,37 @@ def main(
         ]
     )
 
-    training_data_path = processed_data_dir.joinpath("telco_customer_churn.csv")
-    if overwrite_preprocessing or (not training_data_path.exists()):
+    # The processed features are cached until the raw data, the query or the
+    # preprocessor artifacts change
+    cache_dir = processed_data_dir.joinpath("telco_customer_churn")
+    query = str(select_customer_info())
+    cached = load_features(
+        cache_dir,
+        cache_fingerprint(query, data, sorted(preprocessors_dir.glob("*.pkl"))),
+    )
+    if cached is None:
+        logger.info("Processed features are missing or stale, preprocess the data")
         data_encoded = feature_pipeline.fit_transform(data)
+        imputer.serialize(preprocessors_dir.joinpath("imputer.pkl"))
         scaler.serialize(preprocessors_dir.joinpath("standard_scaler.pkl"))
         label_encoder.serialize(preprocessors_dir.joinpath(f"label_encoder.pkl"))
         onehot_encoder.serialize(preprocessors_dir.joinpath(f"onehot_encoder.pkl"))
-        data_encoded.to_csv(training_data_path)
+
+        # Split the data into training and testing sets
+        X = data_encoded.drop("churn", axis=1)
+        y = data_encoded["churn"]
+        save_features(
+            cache_dir,
+            X,
+            y,
+            cache_fingerprint(query, data, sorted(preprocessors_dir.glob("*.pkl"))),
+        )
     else:
-        data_encoded = pd.read_csv(training_data_path, index_col=0)
+        X, y = cached
         scaler.deserialize(preprocessors_dir.joinpath("standard_scaler.pkl"))
         label_encoder.deserialize(preprocessors_dir.joinpath(f"label_encoder.pkl"))
         onehot_encoder.deserialize(preprocessors_dir.joinpath(f"onehot_encoder.pkl"))
 
-    # Split the data into training and testing sets
-    X = data_encoded.drop("churn", axis=1)
-    y = data_encoded["churn"]
-
     churn_model = ChurnModel(
         preprocessors=feature_pipeline,
         model=RandomForestClassifier(n_estimators=100, random_state=42),
@@ -206,19 +214,85 @@ def main(
 
     suffix = "_prod" if to_production else "_dev"
     if to_production:
+        if n_jobs != 1:
+            churn_model.model.set_params(n_jobs=n_jobs)
         churn_model.train(X, y, preprocess_features=False)
         churn_model.serialize(models_dir.joinpath(f"churn_model{suffix}.pkl"))
+        # Export the node tables of the forest, to be memory-mapped by the API
+        save_forest(
+            churn_model.model, models_dir.joinpath(f"churn_model{suffix}.forest")
+        )
+        # Keep a versioned copy of the artifacts, to be hot reloaded by the API
+        release = publish_release(
+            preprocessors_dir, models_dir, base_path.joinpath("releases")
+        )
+        logger.info(f"Published release {release}")
     else:
         kfold = StratifiedKFold(n_splits=n_splits)
         train_ids = {}
         test_ids = {}
+        folds = []
         for i, (train_index, test_index) in enumerate(kfold.split(X, y)):
             train_ids[f"fold_{i}"] = X.index[train_index].to_list()
             test_ids[f"fold_{i}"] = X.index[test_index].to_list()
-            churn_model.train(
-                X.iloc[train_index], y.iloc[train_index], preprocess_features=False
-            )
-            churn_model.serialize(models_dir.joinpath(f"churn_model{suffix}_{i}.pkl"))
+            folds.append((i, train_index))
+
+        # Train the folds concurrently, one process per fold, and share the
+        # cores between them so that the estimators' threads don't oversubscribe
+        if n_jobs < 0:
+            n_jobs = os.cpu_count() or 1
+        n_processes = max(1, min(n_jobs, n_splits))
+        n_threads = max(1, n_jobs // n_processes)
+        logger.info(
+            f"Train {n_splits} folds with {n_processes} processes of {n_threads} threads"
+        )
+
+        start = time.perf_counter()
+        wall_times = {}
+        cpu_times = {}
+        if n_processes == 1:
+            for i, train_index in folds:
+                wall_times[i], cpu_times[i] = train_fold(
+                    churn_model,
+                    X.iloc[train_index],
+                    y.iloc[train_index],
+                    models_dir.joinpath(f"churn_model{suffix}_{i}.pkl"),
+                    n_threads,
+                )
+                logger.info(
+                    f"Trained fold {i} in {wall_times[i]:.1f}s "
+                    f"({cpu_times[i]:.1f}s CPU)"
+                )
+        else:
+            with ProcessPoolExecutor(max_workers=n_processes) as executor:
+                futures = {
+                    executor.submit(
+                        train_fold,
+                        churn_model,
+                        X.iloc[train_index],
+                        y.iloc[train_index],
+                        models_dir.joinpath(f"churn_model{suffix}_{i}.pkl"),
+                        n_threads,
+                    ): i
+                    for i, train_index in folds
+                }
+                # Each fold's model is serialized by its process as soon as
+                # it is trained
+                for future in as_completed(futures):
+                    i = futures[future]
+                    wall_times[i], cpu_times[i] = future.result()
+                    logger.info(
+                        f"Trained fold {i} in {wall_times[i]:.1f}s "
+                        f"({cpu_times[i]:.1f}s CPU)"
+                    )
+        # The ratio of the CPU time of the folds to the wall time is only an
+        # estimate of the parallel speedup, no sequential baseline is timed,
+        # and it is inflated by the CPU time of every thread of the estimators
+        elapsed = time.perf_counter() - start
+        logger.info(
+            f"Trained {n_splits} folds in {elapsed:.1f}s "
+            f"(CPU/wall ratio {sum(cpu_times.values()) / elapsed:.2f})"
+        )
         with open(processed_data_dir.joinpath("train_folds.json"), "w") as f:
             json.dump(train_ids, f)
         with open(processed_data_dir.joinpath("test_folds.json"), "w") as f:
@@ -230,11 +304,23 @@ if __name__ == "__main__":
 
     parser.add_argument("--base-path", default="data")
     parser.add_argument("--to-production", action="store_true")
-    parser.add_argument("--overwrite-preprocessing", action="store_true")
+    parser.add_argument("--n-jobs", type=int, default=1)
+    # Record the preprocessing and model calls into a Chrome trace, the folds
+    # trained in other processes (--n-jobs) are not recorded
+    parser.add_argument("--profile", type=Path, default=None)
+    parser.add_argument("--profile-memory", action="store_true")
 
     args = parser.parse_args()
+    profiler = None
+    if args.profile is not None:
+        profiler = Profiler(trace_memory=args.profile_memory).start()
     main(
         base_path=Path(args.base_path),
         to_production=args.to_production,
-        overwrite_preprocessing=args.overwrite_preprocessing,
+        n_jobs=args.n_jobs,
     )
+    if profiler is not None:
+        profiler.stop()
+        profiler.save_chrome_trace(args.profile)
+        print(profiler.report())
+        logger.info(f"Saved the profile to {args.profile}")
@@ -10,6 +10,7 @@ setup(
     install_requires=[
         "pandas",
         "sqlalchemy",
+        "aiosqlite",
         "seaborn",
         "fastapi",
         "python-dotenv",
@@ -17,10 +18,12 @@ setup(
         "jinja2",
         "python-multipart",
         "itsdangerous",
+        "uvicorn",
     ],
     entry_points={
         "console_scripts": [
             "run-customer-churn = api.main:app",
+            "serve-customer-churn = api.server:main",
         ],
     },
 )
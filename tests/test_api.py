@@ -1,11 +1,65 @@
+import asyncio
 import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
 import unittest
+from pathlib import Path
+from unittest import mock
+
+import httpx
 
 from fastapi.templating import Jinja2Templates
 from fastapi.testclient import TestClient
+from sqlalchemy import func, select
+
+from api.batching import MicroBatcher
+from api.cache import LRUCache, PredictionCache
+from api.ingest import (
+    CSV_COLUMNS,
+    MAX_LINE_LENGTH,
+    NDJSON_CONTENT_TYPES,
+    LineTooLongError,
+    iter_lines,
+    iter_row_chunks,
+    records_frame,
+    validate_rows,
+)
+from api.main import (
+    Session,
+    app,
+    feature_cache,
+    get_session,
+    prediction_writer,
+    registry,
+)
+from api.metrics import CONTENT_TYPE, MetricsRegistry
+from api.registry import (
+    ModelRegistry,
+    ModelUnavailableError,
+    ModelValidationError,
+    load_warmup_records,
+)
+from api.schemas.prediction import CustomerData
+from api.shadow import ShadowScorer
+from api.write_behind import WriteBehindBuffer
+from database.engine import create_database_engine
+from database.migrations import migrate
+from database.models import (
+    Contract,
+    Customer,
+    CustomerChurn,
+    CustomerFeatures,
+    InternetService,
+    PhoneService,
+)
+from database.session import create_async_session_factory, session_dependency
+from models.churn import ChurnModel
+from models.production import activate_release, current_release, publish_release
 
-from api.main import Session, app
-from database.models import Contract, Customer, InternetService, PhoneService
+FIELDS = [field for field in CustomerData.model_fields if field != "customerID"]
 
 
 class TestAPI(unittest.TestCase):
@@ -45,6 +99,7 @@ class TestAPI(unittest.TestCase):
             dependents="No",
             contracts=[self.contract],
         )
+        self.test_customer_features = CustomerFeatures.from_customer(self.test_customer)
 
     def test_predict_churn(self):
         # Define a sample request data
@@ -59,6 +114,113 @@ class TestAPI(unittest.TestCase):
         prediction = response.json()
         self.assertEqual(prediction, {"churnPrediction": "No Churn"})
 
+    def test_metrics(self):
+        with open("data/example_no_churn.json", "r") as f:
+            data = json.load(f)
+        data["customerID"] = "test_customer_metrics"
+
+        self.client.post("/churn-prediction/predict-churn", json=data)
+        prediction_writer.flush()
+        response = self.client.get("/metrics")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.headers["content-type"], f"{CONTENT_TYPE}; charset=utf-8"
+        )
+        samples = response.text.splitlines()
+        for stage in [
+            "validation",
+            "records",
+            "input_columns",
+            "tenure_binarizer",
+            "ratio_computer",
+            "scaler",
+            "label_encoder",
+            "onehot_encoder",
+            "output",
+            "predict",
+            "db_write",
+        ]:
+            self.assertTrue(
+                any(
+                    sample.startswith(
+                        f'churn_prediction_stage_seconds_count{{stage="{stage}"}} '
+                    )
+                    for sample in samples
+                ),
+                stage,
+            )
+        self.assertTrue(
+            any(
+                sample.startswith(
+                    "http_requests_total"
+                    '{handler="predict_churn_endpoint",method="POST",status="200"} '
+                )
+                for sample in samples
+            )
+        )
+        # The scrape itself is in flight
+        self.assertIn("http_requests_in_flight 1", samples)
+
+    def test_profiling(self):
+        with open("data/example_no_churn.json", "r") as f:
+            data = json.load(f)
+        data["customerID"] = "test_customer_profiling"
+        # A profile missing from the prediction cache, to be scored by the model
+        data["monthlyCharges"] = 71.37
+
+        response = self.client.post("/admin/profiling/start")
+        self.assertEqual(response.status_code, 200)
+        self.client.post("/churn-prediction/predict-churn", json=data)
+        report = self.client.get("/admin/profiling/report")
+        trace = self.client.get("/admin/profiling/trace")
+        response = self.client.post("/admin/profiling/stop")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.json()["profiling"])
+        self.assertIn(".encode_records", report.text)
+        names = {event["name"] for event in trace.json()["traceEvents"]}
+        self.assertTrue(any(name.endswith(".predict_encoded") for name in names))
+
+    def test_predictions_are_persisted(self):
+        with open("data/example_churn.json", "r") as f:
+            data = json.load(f)
+        data["customerID"] = "test_customer_persisted"
+
+        for _ in range(3):
+            response = self.client.post("/churn-prediction/predict-churn", json=data)
+        prediction_writer.flush()
+
+        with Session() as session:
+            churns = session.scalars(
+                select(CustomerChurn.churn).filter_by(
+                    customer_id="test_customer_persisted"
+                )
+            ).all()
+        self.assertEqual(churns, [response.json()["churnPrediction"]] * 3)
+
+    def test_model_version_header(self):
+        with open("data/example_churn.json", "r") as f:
+            data = json.load(f)
+
+        response = self.client.post("/churn-prediction/predict-churn", json=data)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.headers["X-Model-Version"], registry.status()["model_version"]
+        )
+
+    def test_reload_unknown_release(self):
+        version = registry.get().version
+
+        response = self.client.post(
+            "/admin/model/reload", params={"release": "missing"}
+        )
+
+        self.assertEqual(response.status_code, 409)
+        self.assertIn(f"still serving {version}", response.json()["detail"])
+        self.assertEqual(registry.get().version, version)
+
     def test_predict_churn_error(self):
         # Define a sample request data
         with open("data/example_churn.json", "r") as f:
@@ -75,6 +237,196 @@ class TestAPI(unittest.TestCase):
             str(exception), "y contains previously unseen labels: 'Non binary'"
         )
 
+    def test_predict_churn_batch(self):
+        with open("data/example_no_churn.json", "r") as f:
+            no_churn = json.load(f)
+        with open("data/example_churn.json", "r") as f:
+            churn = json.load(f)
+        unseen_label = dict(churn, customerID="Unseen-USER", gender="Non binary")
+        missing_field = {k: v for k, v in churn.items() if k != "tenure"}
+
+        response = self.client.post(
+            "/churn-prediction/predict-churn-batch",
+            json=[no_churn, unseen_label, missing_field, churn],
+        )
+
+        self.assertEqual(response.status_code, 200)
+        predictions = response.json()["predictions"]
+        self.assertEqual([p["index"] for p in predictions], [0, 1, 2, 3])
+        self.assertEqual(predictions[0]["churnPrediction"], "No Churn")
+        self.assertIsNone(predictions[0]["error"])
+        self.assertIsNone(predictions[1]["churnPrediction"])
+        self.assertIn("previously unseen labels", predictions[1]["error"])
+        self.assertIsNone(predictions[2]["churnPrediction"])
+        self.assertIn("tenure", predictions[2]["error"])
+        single = self.client.post("/churn-prediction/predict-churn", json=churn)
+        self.assertEqual(
+            predictions[3]["churnPrediction"], single.json()["churnPrediction"]
+        )
+
+    def test_predict_churn_stream(self):
+        with open("data/example_no_churn.json", "r") as f:
+            no_churn = json.load(f)
+        with open("data/example_churn.json", "r") as f:
+            churn = json.load(f)
+        missing_field = {k: v for k, v in churn.items() if k != "tenure"}
+        body = "\n".join(
+            json.dumps(customer) for customer in [no_churn, missing_field, churn]
+        )
+
+        response = self.client.post(
+            "/churn-prediction/predict-stream?chunk_size=2",
+            content=body + "\n\n[]\n",
+            headers={"Content-Type": "application/x-ndjson"},
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.headers["X-Model-Version"], registry.status()["model_version"]
+        )
+        predictions = [json.loads(line) for line in response.text.splitlines()]
+        self.assertEqual([p["index"] for p in predictions], [0, 1, 2, 3])
+        self.assertEqual(predictions[0]["churnPrediction"], "No Churn")
+        self.assertIn("tenure", predictions[1]["error"])
+        self.assertEqual(predictions[2]["churnPrediction"], "Churn")
+        self.assertEqual(predictions[3]["error"], "Expected a JSON object")
+
+    def test_long_lines_are_rejected(self):
+        body = "x" * (MAX_LINE_LENGTH + 1)
+
+        for url in ["/churn-prediction/predict-stream", "/customers/ingest"]:
+            response = self.client.post(
+                url, content=body, headers={"Content-Type": "application/x-ndjson"}
+            )
+            self.assertEqual(response.status_code, 413)
+
+    def test_worker_memory(self):
+        response = self.client.get("/health/memory")
+
+        self.assertEqual(response.status_code, 200)
+        usage = response.json()
+        self.assertEqual(usage["pid"], os.getpid())
+        if usage["uss"] is not None:
+            self.assertLessEqual(usage["uss"], usage["rss"])
+
+    def test_readiness(self):
+        # The startup hook warms up the model in the background
+        with TestClient(app) as client:
+            deadline = time.monotonic() + 30
+            response = client.get("/health/ready")
+            while response.status_code != 200 and time.monotonic() < deadline:
+                time.sleep(0.05)
+                response = client.get("/health/ready")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()["ready"])
+        self.assertIsNotNone(response.json()["model_version"])
+
+    def test_model_unavailable(self):
+        with open("data/example_churn.json", "r") as f:
+            data = json.load(f)
+        missing = ModelRegistry(Path("missing"), Path("missing"), input_columns=[])
+
+        with mock.patch("api.main.registry", missing):
+            response = self.client.post("/churn-prediction/predict-churn", json=data)
+            ready = self.client.get("/health/ready")
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(ready.status_code, 503)
+        self.assertFalse(ready.json()["ready"])
+        self.assertIn("FileNotFoundError", ready.json()["error"])
+
+    def test_predict_customer_churn(self):
+        with open("data/example_churn.json", "r") as f:
+            data = json.load(f)
+        with Session() as session:
+            session.add(
+                Customer(
+                    id="test_customer_churn",
+                    gender=data["gender"],
+                    seniorCitizen=data["seniorCitizen"],
+                    partner=data["partner"],
+                    dependents=data["dependents"],
+                    contracts=[
+                        Contract(
+                            contractType=data["contractType"],
+                            tenure=data["tenure"],
+                            paperlessBilling=data["paperlessBilling"],
+                            paymentMethod=data["paymentMethod"],
+                            monthlyCharges=data["monthlyCharges"],
+                            totalCharges=data["totalCharges"],
+                            phone_service=PhoneService(
+                                hasPhoneService=data["hasPhoneService"],
+                                multipleLines=data["multipleLines"],
+                            ),
+                            internet_service=InternetService(
+                                internetServiceType=data["internetServiceType"],
+                                onlineSecurity=data["onlineSecurity"],
+                                onlineBackup=data["onlineBackup"],
+                                deviceProtection=data["deviceProtection"],
+                                techSupport=data["techSupport"],
+                                streamingTV=data["streamingTV"],
+                                streamingMovies=data["streamingMovies"],
+                            ),
+                        )
+                    ],
+                )
+            )
+            session.commit()
+            customer = session.get(Customer, "test_customer_churn")
+            session.add(CustomerFeatures.from_customer(customer))
+            session.commit()
+        expected = self.client.post("/churn-prediction/predict-churn", json=data)
+
+        response = self.client.get("/customers/test_customer_churn/churn")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), expected.json())
+        self.assertIsNotNone(feature_cache.get("test_customer_churn"))
+
+        # Cached features are served again, and invalidated on deletion
+        response = self.client.get("/customers/test_customer_churn/churn")
+        self.assertEqual(response.json(), expected.json())
+        self.client.post(
+            "/customer-database/delete", data={"customerID": "test_customer_churn"}
+        )
+        self.assertIsNone(feature_cache.get("test_customer_churn"))
+        response = self.client.get("/customers/test_customer_churn/churn")
+        self.assertEqual(response.status_code, 404)
+
+    def test_list_customers(self):
+        with Session() as session:
+            expected = session.scalars(
+                select(Customer.id).order_by(Customer.id).limit(6)
+            ).all()
+            last_id = session.scalars(select(func.max(Customer.id))).one()
+
+        first = self.client.get("/customers", params={"limit": 3}).json()
+        second = self.client.get(
+            "/customers", params={"after": first["next"], "limit": 3}
+        ).json()
+
+        self.assertEqual(first["customerIDs"] + second["customerIDs"], expected)
+        self.assertEqual(first["next"], expected[2])
+        last = self.client.get("/customers", params={"after": last_id}).json()
+        self.assertEqual(last, {"customerIDs": [], "next": None})
+
+    def test_search_customers(self):
+        with Session() as session:
+            prefix = session.scalars(select(Customer.id).limit(1)).one()[:2]
+            expected = session.scalars(
+                select(Customer.id)
+                .filter(Customer.id.startswith(prefix))
+                .order_by(Customer.id)
+                .limit(5)
+            ).all()
+
+        response = self.client.get(
+            "/customers/search", params={"prefix": prefix, "limit": 5}
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["customerIDs"], expected)
+
     def test_successful_login(self):
         response = self.client.post(
             "/login", data={"username": "testuser", "password": "testpassword"}
@@ -125,10 +477,14 @@ class TestAPI(unittest.TestCase):
             # Verify the customer is added to the database
             customer = session.query(Customer).filter_by(id="test_customer_add").first()
             self.assertIsNotNone(customer)
+            features = session.get(CustomerFeatures, "test_customer_add")
+            self.assertEqual(features.internetServiceType, "DSL")
+            self.assertEqual(features.totalCharges, 599.40)
 
     def test_access_customer(self):
         with Session() as session:
             session.add(self.test_customer)
+            session.add(self.test_customer_features)
             session.commit()
 
             # Send a POST request to access the test customer's information
@@ -143,25 +499,136 @@ class TestAPI(unittest.TestCase):
             session.delete(self.phone_service)
             session.delete(self.internet_service)
             session.delete(self.contract)
+            session.delete(self.test_customer_features)
             session.delete(self.test_customer)
             session.commit()
 
     def test_delete_customer(self):
         with Session() as session:
             session.add(self.test_customer)
+            session.add(self.test_customer_features)
             session.commit()
+            # A prediction of the customer waiting in the write-behind buffer
+            prediction_writer.put([("test_customer_delete", "Churn")], block=False)
 
             # Send a POST request to delete the test customer
             response = self.client.post(
                 "/customer-database/delete", data={"customerID": "test_customer_delete"}
             )
             self.assertEqual(response.status_code, 200)
+            prediction_writer.flush()
+            self.assertEqual(
+                session.scalars(
+                    select(CustomerChurn).filter_by(customer_id="test_customer_delete")
+                ).all(),
+                [],
+            )
 
             # Verify the test customer is deleted from the database
             customer = (
                 session.query(Customer).filter_by(id="test_customer_delete").first()
             )
             self.assertIsNone(customer)
+            self.assertIsNone(session.get(CustomerFeatures, "test_customer_delete"))
+
+    def test_delete_customers(self):
+        with Session() as session:
+            session.add(self.test_customer)
+            session.add(self.test_customer_features)
+            session.add(CustomerChurn(customer=self.test_customer, churn="Test cohort"))
+            session.commit()
+
+        response = self.client.post("/customers/delete", json={})
+        self.assertEqual(response.status_code, 422)
+
+        response = self.client.post("/customers/delete", json={"churn": "Test cohort"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json()["deleted"],
+            {
+                "PhoneService": 1,
+                "InternetService": 1,
+                "CustomerChurn": 1,
+                "CustomerFeatures": 1,
+                "Contract": 1,
+                "Customer": 1,
+            },
+        )
+
+        response = self.client.post(
+            "/customers/delete", json={"customerIDs": ["test_customer_delete"]}
+        )
+        self.assertEqual(response.json()["deleted"]["Customer"], 0)
+
+    def test_ingest_customers(self):
+        with open("data/example_churn.json", "r") as f:
+            data = json.load(f)
+        customers = [
+            {**data, "customerID": "test_ingest_1", "churn": "Yes"},
+            {**data, "customerID": "test_ingest_2"},
+            {**data, "customerID": "test_ingest_1"},
+            {**data, "customerID": "test_ingest_3", "tenure": "long"},
+        ]
+        body = "\n".join(json.dumps(customer) for customer in customers) + "\nnot json"
+
+        response = self.client.post(
+            "/customers/ingest?score=true&chunk_size=2",
+            content=body,
+            headers={"Content-Type": "application/x-ndjson"},
+        )
+        prediction_writer.flush()
+        self.client.post(
+            "/customers/delete",
+            json={"customerIDs": ["test_ingest_1", "test_ingest_2"]},
+        )
+
+        self.assertEqual(response.status_code, 200)
+        summary = response.json()
+        # The third customer, of the second chunk, was inserted by the first one,
+        # and is not scored with the data of the skipped row
+        self.assertEqual(
+            {key: value for key, value in summary.items() if key != "errors"},
+            {"rows": 5, "inserted": 2, "skipped": 1, "rejected": 2, "scored": 2},
+        )
+        self.assertEqual([error["line"] for error in summary["errors"]], [4, 5])
+        self.assertIn("tenure", summary["errors"][0]["error"])
+
+    def test_ingest_customers_csv(self):
+        with open("data/example_no_churn.json", "r") as f:
+            data = json.load(f)
+        data["customerID"] = "test_ingest_csv"
+        row = {CSV_COLUMNS[field]: value for field, value in data.items()}
+        row.update(SeniorCitizen=0, TotalCharges=" ", Churn="No")
+        body = ",".join(row) + "\n" + ",".join(map(str, row.values())) + "\n"
+
+        responses = [
+            self.client.post(
+                "/customers/ingest?score=true",
+                content=body,
+                headers={"Content-Type": "text/csv"},
+            )
+            for _ in range(2)
+        ]
+        prediction_writer.flush()
+        with Session() as session:
+            features = session.get(CustomerFeatures, "test_ingest_csv")
+            churns = session.scalars(
+                select(CustomerChurn.churn).filter_by(customer_id="test_ingest_csv")
+            ).all()
+        self.client.post("/customers/delete", json={"customerIDs": ["test_ingest_csv"]})
+
+        self.assertEqual(responses[0].json()["inserted"], 1)
+        self.assertEqual(responses[1].json()["skipped"], 1)
+        # A new customer without total charges can't be scored
+        self.assertEqual([response.json()["scored"] for response in responses], [0, 0])
+        self.assertEqual(features.seniorCitizen, "No")
+        self.assertIsNone(features.totalCharges)
+        self.assertEqual(churns, ["No"])
+
+        response = self.client.post(
+            "/customers/ingest", content=body, headers={"Content-Type": "text/plain"}
+        )
+        self.assertEqual(response.status_code, 415)
 
     def tearDown(self) -> None:
         self.client.post(
@@ -169,5 +636,461 @@ class TestAPI(unittest.TestCase):
         )
 
 
+class TestAPIConcurrency(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        # The requests use a database of their own, as the test locks it
+        self.directory = tempfile.TemporaryDirectory()
+        self.database_path = os.path.join(self.directory.name, "customers.db")
+        engine = create_database_engine(f"sqlite:///{self.database_path}")
+        with engine.connect() as connection:
+            migrate(connection)
+        engine.dispose()
+        self.session_factory = create_async_session_factory(
+            f"sqlite:///{self.database_path}"
+        )
+        app.dependency_overrides[get_session] = session_dependency(self.session_factory)
+
+    async def asyncTearDown(self):
+        app.dependency_overrides.pop(get_session, None)
+        await self.session_factory.kw["bind"].dispose()
+        self.directory.cleanup()
+
+    async def test_predictions_do_not_stall_during_database_writes(self):
+        with open("data/example_no_churn.json", "r") as f:
+            data = json.load(f)
+
+        # Hold an exclusive lock so that database writes wait on SQLite's busy
+        # handler until it is released, while the reads go on from the WAL
+        lock = sqlite3.connect(self.database_path, isolation_level=None)
+        lock.execute("PRAGMA journal_mode=WAL")
+        lock.execute("BEGIN EXCLUSIVE")
+        try:
+            async with httpx.AsyncClient(app=app, base_url="http://test") as client:
+                writes = [
+                    asyncio.create_task(
+                        client.post(
+                            "/customer-database/add-prediction",
+                            params={"customer_id": 1, "churn_prediction": True},
+                        )
+                    )
+                    for _ in range(5)
+                ]
+                await asyncio.sleep(0.1)
+
+                start = time.perf_counter()
+                with mock.patch("api.main.add_churn_predictions"):
+                    responses = await asyncio.gather(
+                        *[
+                            client.post("/churn-prediction/predict-churn", json=data)
+                            for _ in range(50)
+                        ]
+                    )
+                elapsed = time.perf_counter() - start
+
+                self.assertTrue(all(r.status_code == 200 for r in responses))
+                self.assertLess(elapsed, 2)
+
+                read = await client.get("/customer-database")
+                self.assertEqual(read.status_code, 200)
+                self.assertFalse(any(write.done() for write in writes))
+                lock.execute("COMMIT")
+
+                for write in await asyncio.gather(*writes):
+                    self.assertEqual(write.status_code, 200)
+        finally:
+            lock.close()
+
+        async with self.session_factory() as session:
+            n_churns = await session.scalar(
+                select(func.count()).select_from(CustomerChurn)
+            )
+        self.assertEqual(n_churns, 5)
+
+
+class TestModelRegistry(unittest.TestCase):
+    def test_model_is_loaded_on_first_use(self):
+        registry = ModelRegistry(
+            Path("data/preprocessors"), Path("data/models"), input_columns=FIELDS
+        )
+        self.assertFalse(registry.loaded)
+
+        loaded = registry.get()
+
+        self.assertIs(registry.get(), loaded)
+        self.assertFalse(registry.ready)
+        registry.warmup(load_warmup_records(Path("data/example_churn.json")))
+        self.assertTrue(registry.ready)
+
+    def test_failed_warmup_is_not_ready(self):
+        registry = ModelRegistry(
+            Path("data/preprocessors"), Path("data/models"), input_columns=FIELDS
+        )
+        records = load_warmup_records(Path("data/example_churn.json"))
+        records[0]["gender"] = "Non binary"
+
+        with self.assertRaises(ModelUnavailableError):
+            registry.warmup(records)
+        self.assertFalse(registry.ready)
+        self.assertIn("Warmup failed", registry.status()["error"])
+
+
+class TestModelReload(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.releases_dir = Path(self.tmp_dir.name).joinpath("releases")
+        self.first = publish_release(
+            Path("data/preprocessors"), Path("data/models"), self.releases_dir
+        )
+        # A smaller forest makes another release of the same preprocessors
+        models_dir = Path(self.tmp_dir.name).joinpath("models")
+        models_dir.mkdir()
+        churn_model = ChurnModel(preprocessors=None)
+        churn_model.deserialize(Path("data/models/churn_model_prod.pkl"))
+        churn_model.model.estimators_ = churn_model.model.estimators_[:10]
+        churn_model.serialize(models_dir.joinpath("churn_model_prod.pkl"))
+        self.second = publish_release(
+            Path("data/preprocessors"), models_dir, self.releases_dir
+        )
+        activate_release(self.releases_dir, self.first)
+
+        self.registry = ModelRegistry(
+            Path("missing"),
+            Path("missing"),
+            input_columns=FIELDS,
+            releases_dir=self.releases_dir,
+        )
+        self.records = load_warmup_records(Path("data/example_churn.json"))
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_reload_swaps_release(self):
+        in_flight = self.registry.get()
+        self.assertEqual(in_flight.version, self.first)
+
+        loaded = self.registry.reload(self.records, release=self.second)
+
+        self.assertEqual(loaded.version, self.second)
+        self.assertIs(self.registry.get(), loaded)
+        self.assertTrue(self.registry.ready)
+        self.assertEqual(current_release(self.releases_dir), self.second)
+        # Requests holding the previous model finish on it
+        self.assertEqual(len(in_flight.churn_model.predict_records(self.records)), 1)
+
+    def test_failed_canary_keeps_current_model(self):
+        current = self.registry.get()
+        self.records[0]["gender"] = "Non binary"
+
+        with self.assertRaises(ModelValidationError):
+            self.registry.reload(self.records, release=self.second)
+
+        self.assertIs(self.registry.get(), current)
+        self.assertEqual(current_release(self.releases_dir), self.first)
+        self.assertIn(
+            "previously unseen labels", self.registry.status()["reload_error"]
+        )
+
+    def test_activated_release_is_detected(self):
+        self.registry.get()
+        self.assertFalse(self.registry.release_changed())
+
+        activate_release(self.releases_dir, self.second)
+
+        self.assertTrue(self.registry.release_changed())
+        self.assertEqual(self.registry.reload(self.records).version, self.second)
+        self.assertFalse(self.registry.release_changed())
+
+
+class TestShadowScorer(unittest.TestCase):
+    def setUp(self):
+        self.registry = ModelRegistry(
+            Path("data/preprocessors"), Path("data/models"), input_columns=FIELDS
+        )
+        with open("data/example_churn.json", "r") as f:
+            self.churn = CustomerData(**json.load(f))
+        with open("data/example_no_churn.json", "r") as f:
+            self.no_churn = CustomerData(**json.load(f))
+
+    def test_disagreements_are_recorded(self):
+        scorer = ShadowScorer(self.registry)
+
+        scorer.submit(self.no_churn, "No Churn")
+        scorer.submit(self.churn, "No Churn")
+        scorer.join()
+        scorer.stop()
+
+        stats = scorer.stats()
+        self.assertEqual(stats["scored"], 2)
+        self.assertEqual(stats["disagreements"], 1)
+        self.assertEqual(stats["disagreement_rate"], 0.5)
+        self.assertEqual(
+            stats["predictions"], {"No Churn -> Churn": 1, "No Churn -> No Churn": 1}
+        )
+        self.assertGreater(stats["latency_ms"]["count"], 0)
+
+    def test_work_is_dropped_when_behind(self):
+        gate = threading.Event()
+        registry = mock.Mock(wraps=self.registry)
+        registry.get.side_effect = lambda: gate.wait() and self.registry.get()
+        scorer = ShadowScorer(registry, max_queue_size=1, max_batch_size=1)
+
+        scorer.submit(self.churn, "Churn")
+        # Wait for the worker to block on the first customer
+        while scorer.queue_depth:
+            time.sleep(0.01)
+        for _ in range(3):
+            scorer.submit(self.churn, "Churn")
+        gate.set()
+        scorer.join()
+        scorer.stop()
+
+        stats = scorer.stats()
+        self.assertEqual(stats["submitted"], 4)
+        self.assertEqual(stats["dropped"], 2)
+        self.assertEqual(stats["scored"], 2)
+        self.assertEqual(stats["disagreements"], 0)
+
+
+class TestWriteBehindBuffer(unittest.TestCase):
+    def setUp(self):
+        self.batches = []
+
+    def write(self, rows):
+        self.batches.append(list(rows))
+
+    def wait_for_batches(self, count):
+        deadline = time.monotonic() + 5
+        while len(self.batches) < count and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def test_rows_are_written_in_batches(self):
+        buffer = WriteBehindBuffer(self.write, flush_size=3, max_wait_ms=60000)
+
+        buffer.put([1, 2])
+        buffer.put([3])
+        self.wait_for_batches(1)
+        buffer.put([4])
+        buffer.stop()
+
+        self.assertEqual(self.batches, [[1, 2, 3], [4]])
+        stats = buffer.stats()
+        self.assertEqual(stats["written"], 4)
+        self.assertEqual(stats["batch_size"]["count"], 2)
+        self.assertEqual(stats["flush_latency_ms"]["count"], 2)
+
+    def test_rows_are_written_after_max_wait(self):
+        buffer = WriteBehindBuffer(self.write, flush_size=100, max_wait_ms=20)
+
+        buffer.put([1])
+        self.wait_for_batches(1)
+
+        self.assertEqual(self.batches, [[1]])
+        buffer.stop()
+
+    def test_full_buffer_applies_backpressure(self):
+        gate = threading.Event()
+        buffer = WriteBehindBuffer(
+            lambda rows: gate.wait() and self.write(rows),
+            flush_size=1,
+            max_wait_ms=0,
+            max_size=2,
+        )
+
+        buffer.put([1])
+        # Wait for the writer to block on the first batch
+        while buffer.buffered:
+            time.sleep(0.01)
+        self.assertTrue(buffer.put([2, 3], block=False))
+        self.assertFalse(buffer.put([4], block=False))
+        gate.set()
+        buffer.put([4])
+        buffer.stop()
+
+        self.assertEqual(sum(self.batches, []), [1, 2, 3, 4])
+
+    def test_flush_does_not_wait_for_later_rows(self):
+        def write(rows):
+            time.sleep(0.005)
+            self.write(rows)
+
+        buffer = WriteBehindBuffer(write, flush_size=1000, max_wait_ms=60000)
+        buffer.put([0])
+        stop = threading.Event()
+
+        def produce():
+            while not stop.is_set():
+                buffer.put([1])
+                time.sleep(0.001)
+
+        producer = threading.Thread(target=produce)
+        producer.start()
+        try:
+            flusher = threading.Thread(target=buffer.flush)
+            flusher.start()
+            flusher.join(timeout=5)
+            self.assertFalse(flusher.is_alive())
+            self.assertEqual(self.batches[0][0], 0)
+        finally:
+            stop.set()
+            producer.join()
+            buffer.stop()
+
+
+class TestIngest(unittest.IsolatedAsyncioTestCase):
+    async def test_rows_are_parsed_in_chunks(self):
+        with open("data/example_churn.json", "r") as f:
+            data = json.load(f)
+        body = "\r\n".join(
+            json.dumps({**data, "customerID": customer_id})
+            for customer_id in ["Zoé", "Zoé", "Léa"]
+        ).encode()
+
+        async def stream():
+            # Lines and characters split across the chunks of the body
+            for start in range(0, len(body), 7):
+                yield body[start : start + 7]
+
+        chunks = [
+            chunk
+            async for chunk in iter_row_chunks(
+                stream(), NDJSON_CONTENT_TYPES[0], chunk_size=2
+            )
+        ]
+        self.assertEqual([len(chunk) for chunk in chunks], [2, 1])
+
+        records, rejected = validate_rows(chunks[0])
+        self.assertEqual([record.customerID for record in records], ["Zoé"])
+        self.assertEqual(rejected, [(2, "Duplicate customer Zoé")])
+        self.assertEqual(records_frame(records).loc[0, "customerID"], "Zoé")
+
+    async def test_long_lines_are_not_buffered(self):
+        n_read = 0
+
+        async def stream():
+            # A body without any line break
+            nonlocal n_read
+            while True:
+                n_read += 1
+                yield b"x" * 1000
+
+        with self.assertRaises(LineTooLongError):
+            async for _ in iter_lines(stream(), max_line_length=10000):
+                pass
+        self.assertEqual(n_read, 11)
+
+
+class TestLRUCache(unittest.TestCase):
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = LRUCache(maxsize=2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        self.assertEqual(cache.get("a"), 1)
+
+        cache.put("c", 3)
+
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), 1)
+        self.assertEqual(cache.get("c"), 3)
+        self.assertEqual(cache.stats()["hits"], 3)
+        self.assertEqual(cache.stats()["misses"], 1)
+
+    def test_entries_expire_after_ttl(self):
+        cache = LRUCache(maxsize=2, ttl=60)
+        cache.put("a", 1)
+
+        with mock.patch("api.cache.time.monotonic", return_value=time.monotonic() + 61):
+            self.assertIsNone(cache.get("a"))
+        self.assertEqual(len(cache), 0)
+
+
+class TestPredictionCache(unittest.TestCase):
+    def setUp(self):
+        with open("data/example_churn.json", "r") as f:
+            self.data = CustomerData(**json.load(f))
+
+    def test_key_ignores_customer_id(self):
+        other = self.data.model_copy(update={"customerID": "Other-USER"})
+        cache = PredictionCache(maxsize=2)
+        cache.get(self.data, "v1")
+        cache.put(self.data, "v1", "Churn")
+
+        self.assertEqual(cache.get(other, "v1"), "Churn")
+        self.assertNotEqual(
+            PredictionCache.key(self.data, "v1"), PredictionCache.key(self.data, "v2")
+        )
+
+    def test_model_change_flushes_cache(self):
+        cache = PredictionCache(maxsize=2)
+        cache.get(self.data, "v1")
+        cache.put(self.data, "v1", "Churn")
+
+        self.assertIsNone(cache.get(self.data, "v2"))
+        # Late predictions of the previous model are not cached
+        cache.put(self.data, "v1", "Churn")
+        self.assertEqual(len(cache._cache), 0)
+        self.assertEqual(cache.stats()["flushes"], 1)
+
+
+class TestMetricsRegistry(unittest.TestCase):
+    def test_render(self):
+        registry = MetricsRegistry()
+        requests = registry.counter("requests_total", "Requests", ["path"])
+        latency = registry.histogram("latency_seconds", "Latency", buckets=[0.1, 1.0])
+
+        requests.labels('/a"b').inc()
+        requests.labels('/a"b').inc()
+        for seconds in [0.05, 0.5, 5.0]:
+            latency.labels().observe(seconds)
+        with self.assertRaises(ValueError):
+            requests.labels()
+
+        self.assertEqual(
+            registry.render(),
+            "# HELP requests_total Requests\n"
+            "# TYPE requests_total counter\n"
+            'requests_total{path="/a\\"b"} 2\n'
+            "# HELP latency_seconds Latency\n"
+            "# TYPE latency_seconds histogram\n"
+            'latency_seconds_bucket{le="0.1"} 1\n'
+            'latency_seconds_bucket{le="1"} 2\n'
+            'latency_seconds_bucket{le="+Inf"} 3\n'
+            "latency_seconds_count 3\n"
+            "latency_seconds_sum 5.55\n",
+        )
+
+
+class TestMicroBatcher(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.batches = []
+
+    def predict_batch(self, items, return_exceptions=False):
+        self.batches.append(list(items))
+        return [ValueError(item) if item < 0 else item * 2 for item in items]
+
+    async def test_concurrent_requests_are_batched(self):
+        batcher = MicroBatcher(self.predict_batch, max_batch_size=8, max_wait_ms=50)
+
+        results = await asyncio.gather(*[batcher.submit(i) for i in range(10)])
+
+        self.assertEqual(results, [i * 2 for i in range(10)])
+        self.assertEqual([len(batch) for batch in self.batches], [8, 2])
+        stats = batcher.stats()
+        self.assertEqual(stats["batch_size"]["count"], 2)
+        self.assertEqual(stats["batch_size"]["buckets"]["8"], 2)
+        await batcher.stop()
+
+    async def test_errors_are_returned_to_their_caller(self):
+        batcher = MicroBatcher(self.predict_batch, max_batch_size=8, max_wait_ms=50)
+
+        results = await asyncio.gather(
+            batcher.submit(1), batcher.submit(-1), return_exceptions=True
+        )
+
+        self.assertEqual(results[0], 2)
+        self.assertIsInstance(results[1], ValueError)
+        self.assertEqual(len(self.batches), 1)
+        await batcher.stop()
+
+
 if __name__ == "__main__":
     unittest.main()
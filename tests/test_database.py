@@ -1,16 +1,62 @@
+import os
+import sys
+import tempfile
+import threading
 import unittest
 
-from sqlalchemy import create_engine
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine, inspect, select, text
 from sqlalchemy.orm import sessionmaker
 
+from database.bulk import (
+    delete_customers,
+    insert_customers,
+    prepare_customers,
+    rebuild_customer_features,
+)
+from database.engine import create_database_engine
+from database.migrations import MIGRATIONS, get_schema_version, migrate
 from database.models import (
     Base,
     Contract,
     Customer,
     CustomerChurn,
+    CustomerFeatures,
     InternetService,
     PhoneService,
 )
+from database.queries import (
+    join_customer_features,
+    load_customer_frame,
+    select_customer_features,
+    select_customer_ids,
+)
+
+# Rows of the Telco customer churn CSV
+TELCO_CUSTOMERS = {
+    "customerID": ["6", "7"],
+    "gender": ["Male", "Female"],
+    "SeniorCitizen": [0, 1],
+    "Partner": ["Yes", "No"],
+    "Dependents": ["No", "No"],
+    "tenure": [0, 12],
+    "PhoneService": ["Yes", "No"],
+    "MultipleLines": ["No", "No phone service"],
+    "InternetService": ["DSL", "No"],
+    "OnlineSecurity": ["Yes", "No internet service"],
+    "OnlineBackup": ["No", "No internet service"],
+    "DeviceProtection": ["Yes", "No internet service"],
+    "TechSupport": ["No", "No internet service"],
+    "StreamingTV": ["Yes", "No internet service"],
+    "StreamingMovies": ["No", "No internet service"],
+    "Contract": ["Month-to-month", "One year"],
+    "PaperlessBilling": ["Yes", "No"],
+    "PaymentMethod": ["Electronic check", "Mailed check"],
+    "MonthlyCharges": [55.0, 20.0],
+    "TotalCharges": [" ", "240.0"],
+    "Churn": ["Yes", "No"],
+}
 
 
 class TestCustomerDatabase(unittest.TestCase):
@@ -127,6 +173,248 @@ class TestCustomerDatabase(unittest.TestCase):
         self.assertEqual(churn.churn, "Yes")
         self.assertEqual(churn.customer.id, "5")
 
+    def test_bulk_insert_customers(self):
+        # Test inserting customers in bulk, then resuming with more customers
+        data = pd.DataFrame(TELCO_CUSTOMERS)
+        with self.engine.connect() as connection:
+            self.assertEqual(
+                insert_customers(connection, prepare_customers(data.iloc[:1])), 1
+            )
+            self.assertEqual(insert_customers(connection, prepare_customers(data)), 1)
+
+        customers = self.session.scalars(select(Customer).order_by(Customer.id)).all()
+        self.assertEqual([customer.id for customer in customers], ["6", "7"])
+        self.assertEqual(customers[1].seniorCitizen, "Yes")
+        contract = customers[1].contracts[0]
+        self.assertEqual(contract.tenure, 12)
+        self.assertEqual(contract.totalCharges, 240.0)
+        self.assertEqual(contract.phone_service.multipleLines, "No phone service")
+        self.assertEqual(contract.internet_service.internetServiceType, "No")
+        self.assertEqual(customers[1].churns[0].churn, "No")
+        self.assertIsNone(customers[0].contracts[0].totalCharges)
+
+        # The denormalized features are written along with the tables
+        with self.engine.connect() as connection:
+            features = connection.execute(select_customer_features()).all()
+            self.assertEqual(
+                features, connection.execute(join_customer_features()).all()
+            )
+        self.assertEqual(len(features), 2)
+
+    def test_select_customer_ids_prefix(self):
+        top = chr(sys.maxunicode)
+        ids = ["a", "a" + top, "a" + top + "z", "b", "\ud7ff", "\ud7ffz", "\ue000"]
+        ids += [top, top + "x"]
+        self.session.add_all(
+            Customer(
+                id=customer_id,
+                gender="Male",
+                seniorCitizen="No",
+                partner="No",
+                dependents="No",
+            )
+            for customer_id in ids
+        )
+        self.session.commit()
+
+        for prefix in ["a", "a" + top, "\ud7ff", top]:
+            self.assertEqual(
+                self.session.scalars(select_customer_ids(prefix=prefix)).all(),
+                [customer_id for customer_id in ids if customer_id.startswith(prefix)],
+            )
+
+    def test_delete_customers(self):
+        # Test deleting customers from all the tables, the others being kept
+        with self.engine.connect() as connection:
+            insert_customers(
+                connection, prepare_customers(pd.DataFrame(TELCO_CUSTOMERS))
+            )
+            counts = delete_customers(connection, ["6", "6", "unknown"])
+            connection.commit()
+
+        self.assertEqual(
+            counts,
+            {
+                "PhoneService": 1,
+                "InternetService": 1,
+                "CustomerChurn": 1,
+                "CustomerFeatures": 1,
+                "Contract": 1,
+                "Customer": 1,
+            },
+        )
+        for table in [Customer, Contract, PhoneService, InternetService]:
+            self.assertEqual(self.session.query(table).count(), 1)
+        self.assertEqual(self.session.scalars(select(CustomerFeatures.id)).all(), ["7"])
+
+    def test_rebuild_customer_features(self):
+        # Test rebuilding the features of customers written without them
+        customer = Customer(
+            id="8", gender="Male", seniorCitizen="No", partner="No", dependents="No"
+        )
+        customer.contracts = [
+            Contract(
+                contractType="Two year",
+                tenure=24,
+                paperlessBilling="No",
+                paymentMethod="Credit card (automatic)",
+                monthlyCharges=80.0,
+                totalCharges=1920.0,
+                phone_service=PhoneService(hasPhoneService="Yes", multipleLines="Yes"),
+                internet_service=InternetService(
+                    internetServiceType="Fiber optic",
+                    onlineSecurity="Yes",
+                    onlineBackup="No",
+                    deviceProtection="No",
+                    techSupport="Yes",
+                    streamingTV="Yes",
+                    streamingMovies="Yes",
+                ),
+            )
+        ]
+        self.session.add(customer)
+        self.session.commit()
+
+        with self.engine.connect() as connection:
+            insert_customers(
+                connection, prepare_customers(pd.DataFrame(TELCO_CUSTOMERS))
+            )
+            self.assertEqual(rebuild_customer_features(connection), 3)
+            connection.commit()
+
+        features = self.session.get(CustomerFeatures, "8")
+        self.assertEqual(features.internetServiceType, "Fiber optic")
+        self.assertEqual(features.totalCharges, 1920.0)
+        ids = select(CustomerFeatures.id).order_by(CustomerFeatures.id)
+        self.assertEqual(self.session.scalars(ids).all(), ["6", "7", "8"])
+
+    def test_load_customer_frame(self):
+        # Test loading the customers column-wise, at once and in chunks
+        with self.engine.connect() as connection:
+            insert_customers(
+                connection, prepare_customers(pd.DataFrame(TELCO_CUSTOMERS))
+            )
+            data = load_customer_frame(connection)
+            chunks = list(load_customer_frame(connection, chunksize=1))
+
+        self.assertEqual(data.index.to_list(), ["6", "7"])
+        self.assertEqual(data["gender"].dtype, "category")
+        self.assertEqual(data["churn"].to_list(), ["Yes", "No"])
+        self.assertEqual(data["tenure"].dtype, "int64")
+        self.assertEqual(data["totalCharges"].dtype, "float64")
+        self.assertTrue(np.isnan(data.loc["6", "totalCharges"]))
+        self.assertEqual([chunk.index.to_list() for chunk in chunks], [["6"], ["7"]])
+        pd.testing.assert_frame_equal(
+            pd.concat(chunks).astype(data.dtypes.to_dict()), data
+        )
+
+
+class TestConcurrentInserts(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.engine = create_database_engine(
+            f"sqlite:///{os.path.join(self.directory.name, 'customers.db')}"
+        )
+        with self.engine.connect() as connection:
+            migrate(connection)
+
+    def tearDown(self):
+        self.engine.dispose()
+        self.directory.cleanup()
+
+    def test_concurrent_inserts(self):
+        data = prepare_customers(pd.DataFrame(TELCO_CUSTOMERS))
+        errors = []
+
+        def insert(i):
+            chunk = data.assign(customerID=data["customerID"] + f"-{i}")
+            try:
+                with self.engine.connect() as connection:
+                    insert_customers(connection, chunk)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=insert, args=(i,)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        with self.engine.connect() as connection:
+            contract_ids = connection.scalars(select(Contract.id)).all()
+        self.assertEqual(sorted(contract_ids), list(range(1, 9)))
+
+
+class TestMigrations(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.database_url = (
+            f"sqlite:///{os.path.join(self.directory.name, 'customers.db')}"
+        )
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def foreign_key_indexes(self, connection):
+        tables = ["Contract", "PhoneService", "InternetService", "CustomerChurn"]
+        return {
+            (table, index["column_names"][0])
+            for table in tables
+            for index in inspect(connection).get_indexes(table)
+        }
+
+    def test_new_database_is_at_latest_version(self):
+        engine = create_database_engine(self.database_url)
+        with engine.connect() as connection:
+            self.assertEqual(migrate(connection), len(MIGRATIONS))
+            self.assertEqual(len(self.foreign_key_indexes(connection)), 4)
+            journal_mode = connection.scalar(text("PRAGMA journal_mode"))
+        self.assertEqual(journal_mode, "wal")
+
+    def test_existing_database_is_upgraded(self):
+        # A database created before the migrations, without the indexes and
+        # the features table
+        engine = create_database_engine(self.database_url)
+        with engine.connect() as connection:
+            Base.metadata.create_all(connection)
+            connection.commit()
+            insert_customers(
+                connection, prepare_customers(pd.DataFrame(TELCO_CUSTOMERS))
+            )
+            for table, column in self.foreign_key_indexes(connection):
+                connection.execute(text(f'DROP INDEX "ix_{table}_{column}"'))
+            CustomerFeatures.__table__.drop(connection)
+            connection.commit()
+            self.assertEqual(get_schema_version(connection), 0)
+
+            self.assertEqual(migrate(connection), len(MIGRATIONS))
+            self.assertEqual(
+                self.foreign_key_indexes(connection),
+                {
+                    ("Contract", "customer_id"),
+                    ("PhoneService", "contract_id"),
+                    ("InternetService", "contract_id"),
+                    ("CustomerChurn", "customer_id"),
+                },
+            )
+            self.assertEqual(
+                connection.scalars(select(CustomerFeatures.id)).all(), ["6", "7"]
+            )
+            # Migrating again is a no-op
+            self.assertEqual(migrate(connection), len(MIGRATIONS))
+
+    def test_load_resumes_on_current_database(self):
+        data = prepare_customers(pd.DataFrame(TELCO_CUSTOMERS))
+        engine = create_database_engine(self.database_url)
+        with engine.connect() as connection:
+            migrate(connection)
+            self.assertEqual(insert_customers(connection, data), 2)
+        with engine.connect() as connection:
+            migrate(connection)
+            self.assertEqual(insert_customers(connection, data), 0)
+        engine.dispose()
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -1,19 +1,28 @@
 import json
+import tempfile
+import tracemalloc
 import unittest
 from pathlib import Path
 
 import numpy as np
 import pandas as pd
+from sklearn.impute import SimpleImputer
 from sklearn.pipeline import Pipeline
 from sklearn.preprocessing import OneHotEncoder, StandardScaler
 
 from models.churn import ChurnModel
+from models.compiled import compile_preprocessors
 from models.features import (
     FeaturePreprocessor,
     MultiColumnLabelEncoder,
     RatioComputer,
     TenureBinarizer,
 )
+from models.forest import MappedForest, save_forest
+from models.production import PREDICTION_LABELS
+from scripts.score_customers import predict_chunk
+from utils.feature_cache import load_features, save_features
+from utils.profiling import Profiler
 
 
 class TestChurnModel(unittest.TestCase):
@@ -97,6 +106,7 @@ class TestChurnModel(unittest.TestCase):
                 ("onehot_encoder", onehot_encoder),
             ]
         )
+        self.preprocessors = preprocessors
         self.churn_model = ChurnModel(
             preprocessors=preprocessors,
         )
@@ -119,6 +129,217 @@ class TestChurnModel(unittest.TestCase):
         # Validate the prediction
         self.assertIn(prediction, [0, 1])
 
+    def test_profiler(self):
+        input_data = pd.DataFrame(
+            [{k: v for k, v in self.data.items() if k != "customerID"}] * 3
+        )
+
+        with Profiler(trace_memory=True) as profiler:
+            prediction = self.churn_model.predict(input_data)
+        self.churn_model.predict(input_data)
+
+        np.testing.assert_array_equal(prediction, self.churn_model.predict(input_data))
+        self.assertFalse(tracemalloc.is_tracing())
+        records = {record.name: record for record in profiler.records}
+        self.assertEqual(
+            set(records),
+            {
+                "ChurnModel[RandomForestClassifier].predict",
+                "FeaturePreprocessor[TenureBinarizer].transform",
+                "TenureBinarizer.transform",
+                "FeaturePreprocessor[RatioComputer].transform",
+                "RatioComputer.transform",
+                "FeaturePreprocessor[StandardScaler].transform",
+                "MultiColumnLabelEncoder.transform",
+                "FeaturePreprocessor[OneHotEncoder].transform",
+            },
+        )
+        predict = records["ChurnModel[RandomForestClassifier].predict"]
+        self.assertEqual((predict.rows_in, predict.rows_out), (3, 3))
+        # The nested calls are within their caller, and so is their memory
+        binarizer = records["TenureBinarizer.transform"]
+        self.assertLessEqual(predict.start, binarizer.start)
+        self.assertLessEqual(
+            binarizer.start + binarizer.duration, predict.start + predict.duration
+        )
+        self.assertGreater(binarizer.peak_memory, 0)
+        self.assertGreaterEqual(predict.peak_memory, binarizer.peak_memory)
+
+        events = profiler.chrome_trace()["traceEvents"]
+        self.assertEqual(len(events), len(records))
+        self.assertEqual({event["ph"] for event in events}, {"X"})
+        self.assertIn("MultiColumnLabelEncoder.transform", profiler.report())
+
+    def test_profiler_records_fit_transform_once(self):
+        encoder = MultiColumnLabelEncoder(encoded_variables=["gender"])
+
+        with Profiler() as profiler:
+            encoder.fit_transform(pd.DataFrame({"gender": ["Male", "Female"]}))
+
+        # The fit and the transform it calls, without a record of their own
+        self.assertEqual(
+            [record.name for record in profiler.records],
+            ["MultiColumnLabelEncoder.fit", "MultiColumnLabelEncoder.transform"],
+        )
+
+    def test_compiled_preprocessors_match_pandas(self):
+        record = {k: v for k, v in self.data.items() if k != "customerID"}
+        records = [
+            record,
+            dict(record, tenure=0, totalCharges=np.nan),
+            dict(record, tenure=12, totalCharges=12 * record["monthlyCharges"]),
+            dict(record, tenure=72, internetServiceType="No"),
+            dict(record, hasPhoneService="No", multipleLines="No phone service"),
+        ]
+        input_data = pd.DataFrame(records)
+
+        compiled = self.churn_model.compile(list(input_data.columns))
+        expected = self.preprocessors.transform(input_data)
+        features = compiled.transform(records)
+
+        self.assertEqual(compiled.columns, list(expected.columns))
+        expected = expected.to_numpy(dtype=np.float64)
+        # Bit-identical, NaN included
+        np.testing.assert_array_equal(features.view(np.int64), expected.view(np.int64))
+
+        out = np.empty_like(features)
+        self.assertIs(compiled.transform(records, out=out), out)
+        np.testing.assert_array_equal(
+            self.churn_model.predict_records(records[2:]),
+            self.churn_model.predict(input_data.iloc[2:]),
+        )
+
+    def test_compiled_imputer(self):
+        # The training pipeline imputes the missing total charges first
+        record = {k: v for k, v in self.data.items() if k != "customerID"}
+        records = [
+            record,
+            dict(record, tenure=0, totalCharges=np.nan),
+            dict(record, tenure=24, totalCharges=24 * record["monthlyCharges"]),
+        ]
+        input_data = pd.DataFrame(records)
+        imputer = FeaturePreprocessor(
+            SimpleImputer(strategy="median"),
+            encoded_variables=["totalCharges"],
+            output_variables=["totalCharges"],
+        )
+        imputer.fit(input_data)
+        preprocessors = Pipeline([("imputer", imputer), *self.preprocessors.steps])
+
+        compiled = compile_preprocessors(preprocessors, list(input_data.columns))
+        expected = preprocessors.transform(input_data)
+
+        self.assertEqual(compiled.columns, list(expected.columns))
+        np.testing.assert_array_equal(
+            compiled.transform(records), expected.to_numpy(dtype=np.float64)
+        )
+        self.assertTrue(np.isfinite(compiled.transform(records)).all())
+
+    def test_compiled_preprocessors_observer(self):
+        record = {k: v for k, v in self.data.items() if k != "customerID"}
+        compiled = self.churn_model.compile(list(record))
+        stages = []
+
+        features = compiled.transform(
+            [record], observer=lambda stage, seconds: stages.append(stage)
+        )
+
+        np.testing.assert_array_equal(features, compiled.transform([record]))
+        self.assertEqual(
+            stages,
+            ["input_columns"]
+            + [name for name, _ in self.preprocessors.steps]
+            + ["output"],
+        )
+
+    def test_compiled_preprocessors_unseen_label(self):
+        record = {k: v for k, v in self.data.items() if k != "customerID"}
+        compiled = self.churn_model.compile(list(record))
+
+        with self.assertRaises(ValueError) as context:
+            compiled.transform([dict(record, gender="Non binary")])
+
+        self.assertEqual(
+            str(context.exception), "y contains previously unseen labels: 'Non binary'"
+        )
+
+    def test_score_customers_chunk(self):
+        record = {k: v for k, v in self.data.items() if k != "customerID"}
+        self.churn_model.compile(list(record))
+        records = [
+            dict(record, id="0001"),
+            dict(record, id="0002", tenure=0, totalCharges=np.nan),
+            dict(record, id="0003", gender="Non binary"),
+            dict(record, id="0004", tenure=72),
+        ]
+
+        predictions = predict_chunk(self.churn_model, records)
+
+        expected = self.churn_model.predict_records([records[0], records[3]])
+        self.assertEqual(
+            predictions,
+            [
+                PREDICTION_LABELS[expected[0]],
+                None,
+                None,
+                PREDICTION_LABELS[expected[1]],
+            ],
+        )
+
+    def test_mapped_forest(self):
+        record = {k: v for k, v in self.data.items() if k != "customerID"}
+        self.churn_model.compile(list(record))
+        records = [dict(record, tenure=tenure) for tenure in range(0, 73, 6)]
+        features = self.churn_model.encode_records(records)
+
+        with tempfile.TemporaryDirectory() as forest_dir:
+            forest_dir = Path(forest_dir)
+            save_forest(self.churn_model.model, forest_dir)
+            mapped_model = ChurnModel(preprocessors=self.preprocessors)
+            mapped_model.deserialize(forest_dir)
+            mapped_model.compile(list(record))
+
+            forest = mapped_model.model
+            self.assertIsInstance(forest, MappedForest)
+            # Bit-identical probabilities
+            np.testing.assert_array_equal(
+                forest.predict_proba(features),
+                self.churn_model.model.predict_proba(features),
+            )
+            np.testing.assert_array_equal(
+                mapped_model.predict_records(records),
+                self.churn_model.predict_records(records),
+            )
+            # Both backends reject the customers with missing values
+            missing = features[:2].copy()
+            missing[1, 0] = np.nan
+            for model in [forest, self.churn_model.model]:
+                with self.assertRaisesRegex(ValueError, "NaN"):
+                    model.predict(missing)
+            del forest, mapped_model
+
+
+class TestFeatureCache(unittest.TestCase):
+    def test_save_load_features(self):
+        X = pd.DataFrame(
+            {"tenure": [0.5, -1.0], "gender": [1, 0]},
+            index=pd.Index(["0001", "0002"], name="id"),
+        )
+        y = pd.Series([1, 0], index=X.index, name="churn")
+
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache_dir = Path(cache_dir)
+            self.assertIsNone(load_features(cache_dir))
+            save_features(cache_dir, X, y, "v1")
+
+            self.assertIsNone(load_features(cache_dir, "v2"))
+            X_cached, y_cached = load_features(cache_dir, "v1")
+            pd.testing.assert_frame_equal(X_cached, X.astype(np.float64))
+            pd.testing.assert_series_equal(y_cached, y)
+            # Views of the read-only memory-mapped files
+            self.assertFalse(X_cached.to_numpy().flags.writeable)
+            del X_cached, y_cached
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,114 @@
+import hashlib
+import json
+from pathlib import Path
+from typing import Iterable, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from utils.fingerprint import fingerprint_files
+
+FEATURES_FILE = "features.npy"
+LABELS_FILE = "labels.npy"
+INDEX_FILE = "index.npy"
+META_FILE = "meta.json"
+
+
+def cache_fingerprint(
+    query: str, data: pd.DataFrame, artifacts: Iterable[Path], length: int = 12
+) -> str:
+    """
+    Compute the fingerprint of a processed feature matrix.
+
+    The fingerprint changes whenever the source query, the raw data it returned
+    or one of the preprocessor artifacts does.
+
+    Args:
+        query (str): The SQL query of the raw data.
+        data (pd.DataFrame): The raw data.
+        artifacts (Iterable[Path]): The preprocessor artifacts, in a
+            deterministic order.
+        length (int): The number of hexadecimal digits to keep.
+
+    Returns:
+        str: The fingerprint.
+    """
+    digest = hashlib.sha256()
+    digest.update(query.encode())
+    digest.update(pd.util.hash_pandas_object(data, index=True).to_numpy().tobytes())
+    digest.update(repr(list(data.columns)).encode())
+    digest.update(fingerprint_files(artifacts).encode())
+    return digest.hexdigest()[:length]
+
+
+def save_features(cache_dir: Path, X: pd.DataFrame, y: pd.Series, fingerprint: str):
+    """
+    Save a processed feature matrix and its labels as `.npy` files.
+
+    The features are stored as a single float64 matrix in column-major order,
+    so that each column is contiguous on disk and the matrix can be loaded as a
+    DataFrame without copy.
+
+    Args:
+        cache_dir (Path): The cache directory.
+        X (pd.DataFrame): The numeric features.
+        y (pd.Series): The labels, with the same index as the features.
+        fingerprint (str): The fingerprint of the features.
+    """
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    meta_path = cache_dir.joinpath(META_FILE)
+    # The metadata is written last, an interrupted save leaves no valid cache
+    meta_path.unlink(missing_ok=True)
+
+    np.save(
+        cache_dir.joinpath(FEATURES_FILE),
+        np.asfortranarray(X.to_numpy(dtype=np.float64)),
+    )
+    np.save(cache_dir.joinpath(LABELS_FILE), y.to_numpy())
+    np.save(cache_dir.joinpath(INDEX_FILE), X.index.to_numpy(dtype=str))
+    with open(meta_path, "w") as f:
+        json.dump(
+            {
+                "fingerprint": fingerprint,
+                "columns": list(X.columns),
+                "index_name": X.index.name,
+                "label_name": y.name,
+            },
+            f,
+        )
+
+
+def load_features(
+    cache_dir: Path, fingerprint: Optional[str] = None
+) -> Optional[Tuple[pd.DataFrame, pd.Series]]:
+    """
+    Load a processed feature matrix saved by `save_features`.
+
+    The features and labels are memory-mapped read-only, the DataFrame and the
+    Series are views of the mapped files.
+
+    Args:
+        cache_dir (Path): The cache directory.
+        fingerprint (str, optional): The expected fingerprint, if given a cache
+            with another fingerprint is stale.
+
+    Returns:
+        Optional[Tuple[pd.DataFrame, pd.Series]]: The features and the labels,
+            or None if there is no cache or it is stale.
+    """
+    meta_path = cache_dir.joinpath(META_FILE)
+    if not meta_path.exists():
+        return None
+    with open(meta_path, "r") as f:
+        meta = json.load(f)
+    if fingerprint is not None and meta["fingerprint"] != fingerprint:
+        return None
+
+    index = pd.Index(
+        np.load(cache_dir.joinpath(INDEX_FILE)).astype(object), name=meta["index_name"]
+    )
+    features = np.load(cache_dir.joinpath(FEATURES_FILE), mmap_mode="r")
+    labels = np.load(cache_dir.joinpath(LABELS_FILE), mmap_mode="r")
+    X = pd.DataFrame(features, index=index, columns=meta["columns"], copy=False)
+    y = pd.Series(labels, index=index, name=meta["label_name"], copy=False)
+    return X, y
@@ -0,0 +1,23 @@
+import hashlib
+from pathlib import Path
+from typing import Iterable
+
+
+def fingerprint_files(paths: Iterable[Path], length: int = 12) -> str:
+    """
+    Compute a fingerprint of the content of several files.
+
+    Args:
+        paths (Iterable[Path]): The files, in a deterministic order.
+        length (int): The number of hexadecimal digits to keep.
+
+    Returns:
+        str: The fingerprint.
+    """
+    digest = hashlib.sha256()
+    for path in paths:
+        digest.update(path.name.encode())
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+    return digest.hexdigest()[:length]
@@ -0,0 +1,36 @@
+import os
+from pathlib import Path
+from typing import Dict, Optional
+
+
+def memory_usage(pid: Optional[int] = None) -> Dict[str, Optional[int]]:
+    """
+    Get the memory usage of a process, in bytes.
+
+    The unique set size (USS) is the memory only mapped by this process, i.e.
+    what would be freed if it exited. Pages shared copy-on-write with a parent
+    or with other workers count in the RSS and the proportional set size (PSS)
+    but not in the USS.
+
+    Args:
+        pid (int, optional): The process ID, defaults to the current process.
+
+    Returns:
+        Dict[str, Optional[int]]: The `rss`, `pss` and `uss` of the process, or
+            None values when they are not available (Linux only).
+    """
+    pid = os.getpid() if pid is None else pid
+    usage = {"rss": None, "pss": None, "uss": None}
+    try:
+        lines = Path(f"/proc/{pid}/smaps_rollup").read_text().splitlines()
+    except OSError:
+        return usage
+
+    fields = {}
+    for line in lines[1:]:
+        name, value = line.split(":", 1)
+        fields[name] = int(value.split()[0]) * 1024
+    usage["rss"] = fields.get("Rss")
+    usage["pss"] = fields.get("Pss")
+    usage["uss"] = fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0)
+    return usage
@@ -0,0 +1,283 @@
+import functools
+import json
+import threading
+import time
+import tracemalloc
+from collections import deque
+from pathlib import Path
+from typing import Any, Callable, Deque, Dict, List, NamedTuple, Optional
+
+# Profiler recording the calls of the profiled methods, None when profiling is
+# off. It is shared by all the threads, as the API scores in its thread pool.
+_active_profiler: Optional["Profiler"] = None
+
+
+class ProfileRecord(NamedTuple):
+    """A profiled call, its times in seconds since the start of the profiler."""
+
+    name: str
+    thread_id: int
+    start: float
+    duration: float
+    rows_in: Optional[int]
+    rows_out: Optional[int]
+    # Bytes allocated at the peak of the call, above the ones allocated when
+    # it started, None when the memory isn't traced
+    peak_memory: Optional[int]
+
+
+def _n_rows(value: Any) -> Optional[int]:
+    shape = getattr(value, "shape", None)
+    if shape:
+        return int(shape[0])
+    if isinstance(value, (list, tuple)):
+        return len(value)
+    return None
+
+
+class _Call:
+    def __init__(self, start: float, memory: int):
+        self.start = start
+        self.memory = memory
+        # Peak of the children, whose calls reset the peak of tracemalloc
+        self.children_peak = 0
+
+
+class Profiler:
+    """
+    Profiler records the wall time, the input and output row counts and the
+    peak memory of the calls of the profiled methods, while it is started.
+
+    The peak memory is traced with `tracemalloc`, which slows the profiled
+    code down a few times, so it is only traced on demand. It is the peak of
+    the process: calls running concurrently in other threads add to it.
+
+    Args:
+        trace_memory (bool): Whether to trace the peak memory of the calls.
+        max_records (int): The number of calls kept, the oldest ones are
+            dropped first.
+
+    """
+
+    def __init__(self, trace_memory: bool = False, max_records: int = 100000):
+        self.trace_memory = trace_memory
+        self._records: Deque[ProfileRecord] = deque(maxlen=max_records)
+        self._stacks = threading.local()
+        self._origin = time.perf_counter()
+        self._started_tracemalloc = False
+
+    @property
+    def records(self) -> List[ProfileRecord]:
+        return list(self._records)
+
+    def start(self) -> "Profiler":
+        """Start recording the calls of the profiled methods."""
+        global _active_profiler
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+        _active_profiler = self
+        return self
+
+    def stop(self):
+        """Stop recording the calls."""
+        global _active_profiler
+        if _active_profiler is self:
+            _active_profiler = None
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+
+    def __enter__(self) -> "Profiler":
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def call(self, name: str, function: Callable, *args, **kwargs) -> Any:
+        """
+        Call a function and record the call.
+
+        Args:
+            name (str): The name of the call in the records.
+            function (Callable): The function.
+            *args: The positional arguments, the first one is the input.
+            **kwargs: The keyword arguments.
+
+        Returns:
+            Any: The result of the function.
+        """
+        stack = getattr(self._stacks, "calls", None)
+        if stack is None:
+            stack = self._stacks.calls = []
+        trace_memory = self.trace_memory and tracemalloc.is_tracing()
+        if trace_memory:
+            memory, peak = tracemalloc.get_traced_memory()
+            if stack:
+                stack[-1].children_peak = max(stack[-1].children_peak, peak)
+            tracemalloc.reset_peak()
+        call = _Call(time.perf_counter(), memory if trace_memory else 0)
+        stack.append(call)
+        try:
+            result = function(*args, **kwargs)
+        finally:
+            end = time.perf_counter()
+            stack.pop()
+            peak_memory = None
+            if trace_memory:
+                peak = max(tracemalloc.get_traced_memory()[1], call.children_peak)
+                peak_memory = peak - call.memory
+                if stack:
+                    stack[-1].children_peak = max(stack[-1].children_peak, peak)
+        self._records.append(
+            ProfileRecord(
+                name=name,
+                thread_id=threading.get_ident(),
+                start=call.start - self._origin,
+                duration=end - call.start,
+                rows_in=_n_rows(args[0]) if args else None,
+                rows_out=_n_rows(result),
+                peak_memory=peak_memory,
+            )
+        )
+        return result
+
+    def summary(self) -> List[Dict[str, Any]]:
+        """
+        Aggregate the records by name.
+
+        Returns:
+            List[Dict[str, Any]]: The number of calls, the total, mean and
+                maximum times in seconds, the input and output rows and the
+                maximum peak memory of each name, by decreasing total time.
+        """
+        summary: Dict[str, Dict[str, Any]] = {}
+        for record in self.records:
+            stats = summary.setdefault(
+                record.name,
+                {
+                    "name": record.name,
+                    "calls": 0,
+                    "total": 0.0,
+                    "max": 0.0,
+                    "rows_in": 0,
+                    "rows_out": 0,
+                    "peak_memory": None,
+                },
+            )
+            stats["calls"] += 1
+            stats["total"] += record.duration
+            stats["max"] = max(stats["max"], record.duration)
+            stats["rows_in"] += record.rows_in or 0
+            stats["rows_out"] += record.rows_out or 0
+            if record.peak_memory is not None:
+                stats["peak_memory"] = max(
+                    stats["peak_memory"] or 0, record.peak_memory
+                )
+        for stats in summary.values():
+            stats["mean"] = stats["total"] / stats["calls"]
+        return sorted(summary.values(), key=lambda stats: -stats["total"])
+
+    def report(self) -> str:
+        """
+        Format the summary of the records as a table.
+
+        The times of the nested calls are included in the ones of their
+        callers.
+
+        Returns:
+            str: The report.
+        """
+        header = (
+            f"{'name':<48} {'calls':>7} {'total s':>9} {'mean ms':>9} "
+            f"{'max ms':>9} {'rows in':>10} {'rows out':>10} {'peak MiB':>9}"
+        )
+        lines = [header, "-" * len(header)]
+        for stats in self.summary():
+            peak = stats["peak_memory"]
+            peak = "-" if peak is None else f"{peak / 2**20:.1f}"
+            lines.append(
+                f"{stats['name']:<48} {stats['calls']:>7} {stats['total']:>9.3f} "
+                f"{stats['mean'] * 1000:>9.2f} {stats['max'] * 1000:>9.2f} "
+                f"{stats['rows_in']:>10} {stats['rows_out']:>10} {peak:>9}"
+            )
+        return "\n".join(lines)
+
+    def chrome_trace(self) -> Dict[str, Any]:
+        """
+        Export the records in the Chrome trace event format, to be opened in
+        chrome://tracing or https://ui.perfetto.dev.
+
+        Returns:
+            Dict[str, Any]: The trace, a complete event per call, with the
+                times in microseconds.
+        """
+        events = []
+        for record in self.records:
+            args = {"rows_in": record.rows_in, "rows_out": record.rows_out}
+            if record.peak_memory is not None:
+                args["peak_memory"] = record.peak_memory
+            events.append(
+                {
+                    "name": record.name,
+                    "cat": record.name.split(".", 1)[0],
+                    "ph": "X",
+                    "ts": record.start * 1e6,
+                    "dur": record.duration * 1e6,
+                    "pid": 0,
+                    "tid": record.thread_id,
+                    "args": args,
+                }
+            )
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def save_chrome_trace(self, path: Path):
+        """
+        Save the records as a Chrome trace JSON file.
+
+        Args:
+            path (Path): The path of the file.
+        """
+        with open(path, "w") as f:
+            json.dump(self.chrome_trace(), f)
+
+
+def get_profiler() -> Optional[Profiler]:
+    """Get the started profiler, None when profiling is off."""
+    return _active_profiler
+
+
+def profiled(method: Callable) -> Callable:
+    """
+    Record the calls of a method while a profiler is started.
+
+    The calls are named after the class and the method, and the class of the
+    wrapped model of a `FeaturePreprocessor`, e.g.
+    `FeaturePreprocessor[StandardScaler].transform`. When no profiler is
+    started, the method is called directly.
+
+    Args:
+        method (Callable): The method, its first argument after `self` is its
+            input.
+
+    Returns:
+        Callable: The profiled method.
+    """
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        profiler = _active_profiler
+        if profiler is None:
+            return method(self, *args, **kwargs)
+        name = type(self).__name__
+        model = getattr(self, "_model", None)
+        if model is not None and not isinstance(model, dict):
+            name = f"{name}[{type(model).__name__}]"
+        return profiler.call(
+            f"{name}.{method.__name__}",
+            functools.partial(method, self),
+            *args,
+            **kwargs,
+        )
+
+    return wrapper